@@ -1,7 +1,16 @@
+from logging import getLogger
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 
+def show_server_error(error):
+    getLogger('finprint').error('Server request failed: {0}'.format(error))
+    msgbox = QMessageBox()
+    msgbox.setText('The server could not complete the request: {0}'.format(error))
+    msgbox.setWindowTitle('Server error')
+    msgbox.exec_()
+
+
 class ClickLabel(QLabel):
     clicked = pyqtSignal()
 
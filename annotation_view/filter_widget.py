@@ -17,10 +17,8 @@ class FilterSlider(QWidget):
         self._slider.setTickInterval(range_max)
         self._slider.setTickPosition(QSlider.TicksBelow)
         self._slider.setValue(range_min)
+        # filtering drops stale frames, so it's fine to follow the slider while it's dragged
         self._slider.valueChanged.connect(self._on_value_change)
-        self._slider.sliderPressed.connect(self._on_slider_pressed)
-        self._slider.sliderReleased.connect(self._on_slider_released)
-        self._slider_pressed = False
 
         range_labels = QWidget()
         range_layout = QHBoxLayout()
@@ -36,20 +34,17 @@ class FilterSlider(QWidget):
         layout.addWidget(range_labels)
         self.setLayout(layout)
 
-    def _on_slider_pressed(self):
-        self._slider_pressed = True
-
-    def _on_slider_released(self):
-        self._slider_pressed = False
-        self._on_value_change()
-
     def _on_value_change(self):
-        if self._slider_pressed is False:
-            self.change.emit()
+        self.change.emit()
 
     def value(self):
         return self._slider.value()
 
+    def set_value(self, value):
+        self._slider.blockSignals(True)
+        self._slider.setValue(value)
+        self._slider.blockSignals(False)
+
 
 class ContrastToggle(QWidget):
     change = pyqtSignal()
@@ -73,6 +68,11 @@ class ContrastToggle(QWidget):
     def checked(self):
         return self.contrast_checkbox.isChecked()
 
+    def set_checked(self, checked):
+        self.contrast_checkbox.blockSignals(True)
+        self.contrast_checkbox.setChecked(checked)
+        self.contrast_checkbox.blockSignals(False)
+
 
 class FilterWidget(QWidget):
     change = pyqtSignal(int, int, bool)
@@ -119,6 +119,12 @@ class FilterWidget(QWidget):
         self.setGeometry(xy.x() - 205, xy.y() - 105, 200, 100)
         self.show()
 
+    def set_values(self, saturation, brightness, contrast):
+        ''' mirror another player's filters without emitting change '''
+        self.saturation_slider.set_value(saturation)
+        self.brightness_slider.set_value(brightness)
+        self.contrast_toggle.set_checked(contrast)
+
     def on_change(self):
         self.change.emit(self.saturation_slider.value(),
                          self.brightness_slider.value(),
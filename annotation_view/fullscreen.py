@@ -78,12 +78,12 @@ class FullScreenLayout(QLayout):
 
 
 class FullScreen(QWidget):
-    FRAME_STEP = 70  # milli seconds
     keyPressed = pyqtSignal(QEvent)
 
-    def __init__(self, set, video_file, small_player):
+    def __init__(self, set, video_file, small_player, show=True, resume_rate=None):
         super().__init__()
-        self.showFullScreen()
+        if show:
+            self.showFullScreen()
 
         self.setStyleSheet('background-color: black;')
         self.current_set = set
@@ -194,8 +194,12 @@ class FullScreen(QWidget):
         self.layout.addWidget(controls)
         self.setLayout(self.layout)
 
-        # prepare video for display
-        self.prepare(video_file, True)
+        # prepare video for display, or just get it ready when warming up in the background
+        if show:
+            self.prepare(video_file, True, resume_rate)
+        else:
+            self._load_set()
+            self.fullscreen_video_player.preload(video_file)
 
         # wire events for interactivity
         self.wire_events()
@@ -207,7 +211,18 @@ class FullScreen(QWidget):
         self.filter_widget.installEventFilter(self)
         self.video_filter_button.installEventFilter(self)
 
-    def revive(self, set, video_file, small_player):
+    def prewarm(self, set, video_file, small_player):
+        '''
+        Get the player ready for video_file while hidden, so that going fullscreen
+        doesn't have to set up a player or parse the media first
+        '''
+        if self.current_set != set:
+            self.current_set = set
+            self._load_set()
+        self.small_player = small_player
+        self.fullscreen_video_player.preload(video_file)
+
+    def revive(self, set, video_file, small_player, resume_rate=None):
         set_changed = self.current_set != set
         self.current_set = set
         self.small_player = small_player
@@ -215,25 +230,36 @@ class FullScreen(QWidget):
         # Initialize/Sync full screen timer with incoming small player timer
         self.fullscreen_video_player.timer_vo.timer_duration_ms = self.small_player.get_position()
 
-        self.prepare(video_file, set_changed)
-        self.show()
+        self.prepare(video_file, set_changed, resume_rate)
+        self.showFullScreen()
 
-    def prepare(self, video_file, set_changed=False):
+    def _load_set(self):
+        self.set_label.setText(self.current_set.code)
+        self.fullscreen_video_player.load_set(self.current_set)
+        self.seek_bar.load_set(self.current_set)
+
+    def prepare(self, video_file, set_changed=False, resume_rate=None):
         self.fullscreen_video_player.clear_extent()
         if set_changed:
-            self.fullscreen_video_player.load_set(self.current_set)
-            self.fullscreen_video_player.load(video_file)
-            self.seek_bar.load_set(self.current_set)
-            self.seek_bar.setMaximum(int(self.fullscreen_video_player.get_length()))
-            self.seek_bar.set_allowed_progress(self.current_set.progress)
-            self.seek_bar.setMaximumWidth(self.frameGeometry().width())
+            self._load_set()
         else:
             self.seek_bar.generate_ticks()
+        if not self.fullscreen_video_player.is_loaded(video_file):
+            self.fullscreen_video_player.load(video_file, resume_rate)
+            self.seek_bar.setMaximum(int(self.fullscreen_video_player.get_length()))
+            self.seek_bar.setMaximumWidth(self.frameGeometry().width())
+            # load() picks the rate back up once the media has started
+            resume_rate = None
         self.seek_bar.set_allowed_progress(self.current_set.progress)
+        # same filters as the normal player
+        self.fullscreen_video_player.set_filter_state(*self.small_player.filter_state())
+        self.filter_widget.set_values(*self.small_player.filter_state())
         self.video_length_label.setText(convert_position(int(self.fullscreen_video_player.get_length())))
         self.playback_speed_label.setText('(0x)')
         #intializing TimerVO with present time
         self.fullscreen_video_player.set_position(self.small_player.get_position())
+        if resume_rate:
+            self.fullscreen_video_player.set_speed(resume_rate)
         self.filter_widget.installEventFilter(self)
         self.video_filter_button.installEventFilter(self)
         QCoreApplication.instance().installEventFilter(self.fullscreen_video_player)
@@ -280,10 +306,10 @@ class FullScreen(QWidget):
         self.fullscreen_video_player.fast_forward()
 
     def on_step_back(self):
-        self.fullscreen_video_player.scrub_position(self.fullscreen_video_player.get_position() - self.FRAME_STEP)
+        self.fullscreen_video_player.step_frame(-1)
 
     def on_step_forward(self):
-        self.fullscreen_video_player.scrub_position(self.fullscreen_video_player.get_position() + self.FRAME_STEP)
+        self.fullscreen_video_player.step_frame(1)
 
     def on_speed(self, speed):
         self.fullscreen_video_player.set_speed(speed)
@@ -301,11 +327,15 @@ class FullScreen(QWidget):
 
 
     def on_fullscreen_toggle(self):
+        resume_rate = self.fullscreen_video_player.get_rate() if self.fullscreen_video_player.is_playing() else None
         self.fullscreen_video_player.pause()
         self.filter_widget.hide()
         self.video_filter_button.setPixmap(QPixmap('images/filters.png'))
         #setting scrub postion with new changed position of normal screen where it paused
         self.small_player.scrub_position(self.fullscreen_video_player.get_position())
+        self.small_player.parent().set_filter_state(*self.fullscreen_video_player.filter_state())
+        if resume_rate:
+            self.small_player.set_speed(resume_rate)
         self.small_player.parent()._observation_table.refresh_model()
         self.filter_widget.removeEventFilter(self)
         self.video_filter_button.removeEventFilter(self)
@@ -315,7 +345,7 @@ class FullScreen(QWidget):
         self.small_player.parent().is_fullscreen = False
 
     def on_slider_tick(self, _, obs):
-        evt = sorted(obs.events, key=lambda e: e.create_datetime)[0]
+        evt = obs.first_event()
         self.fullscreen_video_player.pause()
         self.fullscreen_video_player.display_event(evt.event_time, evt.extent)
 
@@ -1,13 +1,37 @@
-from global_finprint import Event, Observation, GlobalFinPrintServer
+from pydispatch import dispatcher
+from global_finprint import Event, Observation, GlobalFinPrintServer, OBSERVATIONS_CHANGED
 from enum import IntEnum
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from video_player import DialogActions
 from annotation_view.util import ObservationColumn
-from win32api import GetSystemMetrics
+from annotation_view.components import show_server_error
 
 MARK_ZERO_TIME_ID = 16
 
+def ordered_rows(observations, colors):
+    '''
+    Events in display order, plus the events whose zebra color or observation
+    header flag moved because observations were added or removed around them
+    '''
+    rows = []
+    restyled = set()
+    rotate_index = 0
+    obs = sorted(observations, key=lambda o: o.initial_time())
+    for o in obs:
+        events = o.events_by_time()
+        color = colors[rotate_index]
+        for e in events:
+            first_flag = e is events[-1]
+            if e.obs_color is not color or e.first_flag != first_flag:
+                e.obs_color = color
+                e.first_flag = first_flag
+                restyled.add(e)
+        rows.extend(events)
+        rotate_index ^= 1
+    return rows, restyled
+
+
 class ObservationTableModel(QAbstractTableModel):
     observationUpdated = pyqtSignal(Observation)
     eventUpdated = pyqtSignal(Event)
@@ -28,6 +52,8 @@ class ObservationTableModel(QAbstractTableModel):
 
     def __init__(self):
         self.rows = []
+        # formatted cell values per event, filled on first paint and dropped when the event changes
+        self._display = {}
         self.columns = ObservationColumn.return_observation_table_coloumn_details()
         self.editable_columns = []
         super(QAbstractTableModel, self).__init__(None)
@@ -44,10 +70,8 @@ class ObservationTableModel(QAbstractTableModel):
             else super(QAbstractTableModel, self).headerData(idx, orientation, role)
 
     def data(self, model_index, role=None):
-        if len(self.rows) > 0 and role in [Qt.DisplayRole, Qt.EditRole]:
-            row = self.rows[model_index.row()]
-            columns = row.to_table_columns()
-            return columns[model_index.column()]
+        if len(self.rows) > 0 and role in (Qt.DisplayRole, Qt.EditRole):
+            return self.display_row(self.rows[model_index.row()])[model_index.column()]
         else:
             if role == Qt.TextAlignmentRole :
                 return Qt.AlignVCenter
@@ -57,12 +81,15 @@ class ObservationTableModel(QAbstractTableModel):
             evt = self.rows[model_index.row()]
             if model_index.column() == self.Columns.duration:
                 evt.observation.duration = value
+                self.invalidate(evt.observation.events)
                 self.observationUpdated.emit(evt.observation)
             elif model_index.column() == self.Columns.observation_comment:
                 evt.observation.comment = value
+                self.invalidate(evt.observation.events)
                 self.observationUpdated.emit(evt.observation)
             elif model_index.column() == self.Columns.event_notes:
                 evt.note = value
+                self.invalidate([evt])
                 self.eventUpdated.emit(evt)
             self.dataChanged.emit(model_index, model_index)
             return True
@@ -75,17 +102,73 @@ class ObservationTableModel(QAbstractTableModel):
             else default_flags
 
     def insertRows(self, start, count, new_rows=None, *args, **kwargs):
-        self.beginInsertRows(self.index(start, 0), start, start + count - 1)
-        self.rows = self.rows[start:] + new_rows + self.rows[:start]
+        self.beginInsertRows(QModelIndex(), start, start + count - 1)
+        self.rows[start:start] = new_rows
         self.endInsertRows()
         return True
 
     def removeRows(self, start, count, *args, **kwargs):
-        self.beginRemoveRows(self.index(start, 0), start, start + count - 1)
+        self.beginRemoveRows(QModelIndex(), start, start + count - 1)
+        self.invalidate(self.rows[start:(start + count)])
         del self.rows[start:(start + count)]
         self.endRemoveRows()
         return True
 
+    def set_rows(self, rows):
+        ''' Bulk load: a single model reset instead of one insert per row '''
+        self.beginResetModel()
+        self.rows = list(rows)
+        self._display = {}
+        self.endResetModel()
+
+    def display_row(self, evt):
+        columns = self._display.get(evt)
+        if columns is None:
+            columns = self._display[evt] = tuple(evt.to_table_columns())
+        return columns
+
+    def invalidate(self, events):
+        for evt in events:
+            self._display.pop(evt, None)
+
+    def update_rows(self, rows, changed, restyled=()):
+        '''
+        Move the model to the new row list with the fewest row operations: rows shared at the
+        start and end of both lists are kept, the span in between is removed and re-inserted
+        in one batch, and kept rows whose display changed get a dataChanged. Kept rows that
+        are only restyled (colour, observation header) keep their formatted text and get a
+        single dataChanged over their span, which just repaints what's on screen.
+        Returns the rows that were inserted or changed, whose size may have changed.
+        '''
+        self.invalidate(changed)
+        old_count, new_count = len(self.rows), len(rows)
+        prefix = 0
+        while prefix < min(old_count, new_count) and self.rows[prefix] is rows[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < min(old_count, new_count) - prefix and \
+                self.rows[old_count - suffix - 1] is rows[new_count - suffix - 1]:
+            suffix += 1
+
+        if old_count - suffix > prefix:
+            self.removeRows(prefix, old_count - suffix - prefix)
+        if new_count - suffix > prefix:
+            self.insertRows(prefix, new_count - suffix - prefix, new_rows=rows[prefix:new_count - suffix])
+        touched = list(range(prefix, new_count - suffix))
+
+        last_column = self.columnCount() - 1
+        if changed:
+            for row in range(new_count):
+                if (row < prefix or row >= new_count - suffix) and rows[row] in changed:
+                    self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+                    touched.append(row)
+        if restyled:
+            kept = [row for row in range(new_count)
+                    if (row < prefix or row >= new_count - suffix) and rows[row] in restyled]
+            if kept:
+                self.dataChanged.emit(self.index(kept[0], 0), self.index(kept[-1], last_column))
+        return touched
+
     def append_row(self, row):
         self.insertRows(self.rowCount(), 1, new_rows=[row])
 
@@ -94,8 +177,7 @@ class ObservationTableModel(QAbstractTableModel):
         self.removeRows(row, 1)
 
     def empty(self):
-        self.removeRows(0, self.rowCount())
-        self.reset()
+        self.set_rows([])
 
     def get_coulmn_details(self):
         return self.columns
@@ -149,22 +231,23 @@ class ObservationTableCell(QStyledItemDelegate):
         if col == self.Columns.organism and self.parent().item(row, self.Columns.type) == 'I':
             painter.save()
             painter.fillRect(style.rect, self.disabled_color)
-            self.drawBorder(painter, style.rect, col in self.observation_columns and not hasattr(event, 'first_flag'), col, row)
+            self.drawBorder(painter, style.rect, col in self.observation_columns and not event.first_flag, col, row)
             painter.restore()
 
         # zebra striping table by observation
         else:
             painter.save()
             painter.fillRect(style.rect, event.obs_color)
-            self.drawBorder(painter, style.rect, col in self.observation_columns and not hasattr(event, 'first_flag'),  col, row)
+            self.drawBorder(painter, style.rect, col in self.observation_columns and not event.first_flag,  col, row)
             painter.restore()
-            if col not in self.observation_columns or hasattr(event, 'first_flag'):
+            if col not in self.observation_columns or event.first_flag:
                 super().paint(painter, style, model_index)
 
 class ObservationTable(QTableView):
     source_model = None
     current_set = None
     Columns = ObservationTableModel.Columns
+    ROTATE_COLORS = [QColor(126, 211, 33, 128), QColor(126, 211, 33, 64)]
 
     # signals
     durationClicked = pyqtSignal(Observation)
@@ -252,49 +335,52 @@ class ObservationTable(QTableView):
         self.source_model.append_row(row)
 
     def load_set(self, current_set):
+        if self.current_set is not None:
+            dispatcher.disconnect(self.on_observations_changed, signal=OBSERVATIONS_CHANGED,
+                                  sender=self.current_set)
         self.current_set = current_set
-        self.refresh_model()
-
-    def refresh_model(self):
-        rotate_colors = [QColor(126, 211, 33, 128), QColor(126, 211, 33, 64)]
-        rotate_index = 0
-        # TODO note current row
-        self.empty()
-        obs = sorted(self.current_set.observations, key=lambda o: o.initial_time())
-        row_space_list = []
-
-        for o in obs:
-            events = sorted(o.events, key=lambda e: e.event_time)
-            events[-1].first_flag = True
-
-            for e in events:
-                e.obs_color = rotate_colors[rotate_index]
-                self.add_row(e)
-            rotate_index ^= 1
+        dispatcher.connect(self.on_observations_changed, signal=OBSERVATIONS_CHANGED, sender=current_set)
+        rows, _ = self._ordered_rows()
+        self.source_model.set_rows(rows)
         self.resizeRowsToContents()
         self.tableRefresh.emit()
-        # TODO return to noted row
+
+    def _ordered_rows(self):
+        return ordered_rows(self.current_set.observations, self.ROTATE_COLORS)
+
+    def refresh_model(self, changes=None):
+        rows, restyled = self._ordered_rows()
+        changed = set()
+        if changes is not None:
+            updated_obs = changes.updated_observations
+            changed.update(e for e in rows if e.id in changes.updated_events or e.observation.id in updated_obs)
+        # restyled rows are only repainted; their text, and so their height, is unchanged
+        for row in self.source_model.update_rows(rows, changed, restyled - changed):
+            self.resizeRowToContents(row)
+        self.tableRefresh.emit()
+
+    def on_observations_changed(self, signal, sender, value):
+        if self.source_model is not None:
+            self.refresh_model(value)
 
     def edit_event(self, evt):
         values = evt.to_dict()
         values['attribute'] = [a['id'] for a in values['attribute'][:]]
-        self.current_set.edit_event(evt, values)
-        self.refresh_model()
+        self.current_set.edit_event(evt, values, on_done=self._on_set_changed, on_error=show_server_error)
 
     def edit_observation(self, obs):
-        self.current_set.edit_observation(obs, obs.to_dict())
-        self.refresh_model()
+        self.current_set.edit_observation(obs, obs.to_dict(), on_done=self._on_set_changed,
+                                          on_error=show_server_error)
 
     def remove_event(self, evt):
         self.clearSelection()
-        # TODO busy cursor
-        self.current_set.delete_event(evt)
-        self.refresh_model()
+        self.current_set.delete_event(evt, on_done=self._on_set_changed, on_error=show_server_error)
 
     def remove_observation(self, obs):
         self.clearSelection()
-        # TODO busy cursor
-        self.current_set.delete_observation(obs)
+        self.current_set.delete_observation(obs, on_done=self._on_set_changed, on_error=show_server_error)
+
+    def _on_set_changed(self, _=None):
         self.refresh_model()
 
     def empty(self):
@@ -318,14 +404,9 @@ class ObservationTable(QTableView):
         go_to_event_action = menu.addAction('Go To Event')
         if self.get_event(row).observation.type_choice == 'A':
             change_organism_menu = menu.addMenu('Change organism')
-            grouping = {}
-            for animal in self.current_set.animals:
-                if animal.group not in grouping:
-                    grouping[animal.group] = []
-                grouping[animal.group].append(animal)
-            for group in grouping.keys():
+            for group, animals in self.current_set.animals_by_group().items():
                 group_menu = change_organism_menu.addMenu(group)
-                for animal in grouping[group]:
+                for animal in animals:
                     act = group_menu.addAction(str(animal))
                     act.setData(animal)
         cancel_action = menu.addAction('Cancel')
@@ -348,8 +429,8 @@ class ObservationTable(QTableView):
                 self.goToEvent.emit(self.get_event(row))
             elif type(action.data()).__name__ == 'Animal':  # change organism
                 obs = self.get_event(row).observation
-                self.current_set.edit_observation(obs, {'animal_id': action.data().id})
-                self.refresh_model()
+                self.current_set.edit_observation(obs, {'animal_id': action.data().id},
+                                                  on_done=self._on_set_changed, on_error=show_server_error)
 
     def confirm_delete_dialog(self, obj):
         msg = 'Are you sure you want to delete {0}?'.format(str(obj))
@@ -0,0 +1,159 @@
+'''
+Search over the organism choices in a TypeAndReduce picker. Each choice's label is
+lowercased and split into words once, and a trigram index over the labels narrows a
+query to a handful of candidates before any label is looked at, so a keystroke costs
+the same whether a group has fifty species or five thousand.
+
+Run on its own, it times building an index and typing into it:
+
+    python -m annotation_view.search_index [--choices N]
+'''
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from collections import OrderedDict
+
+
+WORD = re.compile(r'\w+')
+
+
+def _trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class SearchIndex(object):
+    # indexes for the choice lists seen most recently; the context menu is rebuilt on
+    # every right click, but its lists are the set's and don't change
+    CACHE_SIZE = 64
+    _cache = OrderedDict()
+
+    @classmethod
+    def for_choices(cls, choices):
+        index = cls._cache.pop(id(choices), None)
+        if index is None or index.source is not choices:
+            index = SearchIndex(choices)
+        cls._cache[id(choices)] = index
+        while len(cls._cache) > cls.CACHE_SIZE:
+            cls._cache.popitem(last=False)
+        return index
+
+    def __init__(self, choices, label=str):
+        # kept so a cached index is only reused for the very list it was built from
+        self.source = choices
+        labelled = sorted(((label(c), c) for c in choices), key=lambda lc: lc[0].lower())
+        self.labels = [l for l, _ in labelled]
+        self.choices = [c for _, c in labelled]
+        self._texts = [l.lower() for l in self.labels]
+        # the words with a space in front of each, so "a word starts with w" is a
+        # single substring test for ' ' + w
+        self._words = [' ' + ' '.join(WORD.findall(t)) for t in self._texts]
+        # built on the first query long enough to use it; most pickers are opened and
+        # closed without typing anything
+        self._postings = None
+        self._last_query = ''
+        self._last_matches = None
+
+    def __len__(self):
+        return len(self.choices)
+
+    def search(self, text):
+        '''
+        Positions in choices (and labels) of the choices matching text, best first: labels
+        starting with it, then labels with words starting with each word typed, then
+        labels containing each word typed. Ties keep alphabetical order.
+        '''
+        query = ' '.join(text.lower().split())
+        if not query:
+            self._last_query, self._last_matches = '', None
+            return list(range(len(self.choices)))
+        words = query.split()
+        starts = [' ' + w for w in words]
+        texts, label_words = self._texts, self._words
+
+        prefix, word_prefix, substring = [], [], []
+        for i in self._candidates(query, words):
+            text = texts[i]
+            if len(words) == 1:
+                if query not in text:
+                    continue
+            elif not all(w in text for w in words):
+                continue
+            if text.startswith(query):
+                prefix.append(i)
+            elif all(s in label_words[i] for s in starts):
+                word_prefix.append(i)
+            else:
+                substring.append(i)
+
+        ranked = prefix + word_prefix + substring
+        self._last_query, self._last_matches = query, sorted(ranked)
+        return ranked
+
+    def _candidates(self, query, words):
+        # typing narrows: whatever matches the new query matched the one before it
+        if self._last_matches is not None and query.startswith(self._last_query):
+            return self._last_matches
+        long_words = [w for w in words if len(w) >= 3]
+        if not long_words:
+            return range(len(self.choices))
+        if self._postings is None:
+            self._postings = {}
+            for i, t in enumerate(self._texts):
+                for gram in _trigrams(t):
+                    self._postings.setdefault(gram, []).append(i)
+        postings = sorted((self._postings.get(g, ()) for w in long_words for g in _trigrams(w)), key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(p)
+        return sorted(candidates)
+
+
+def _random_name(rnd):
+    def word(low, high):
+        return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(low, high)))
+    common = ' '.join(word(3, 9).capitalize() for _ in range(rnd.randint(1, 3)))
+    return '{0} ({1} {2})'.format(common, word(5, 12).capitalize(), word(5, 12))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time organism search')
+    parser.add_argument('--choices', type=int, default=10000, help='choices to search (default 10000)')
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(0)
+    names = [_random_name(rnd) for _ in range(args.choices)]
+    typed = [names[rnd.randrange(len(names))].split(' (')[1][:6].lower() for _ in range(50)]
+
+    started = time.perf_counter()
+    index = SearchIndex(names)
+    build = time.perf_counter() - started
+
+    keystrokes = 0
+    started = time.perf_counter()
+    for word in typed:
+        index.search('')
+        for n in range(1, len(word) + 1):
+            index.search(word[:n])
+            keystrokes += 1
+    per_key = (time.perf_counter() - started) / keystrokes
+
+    started = time.perf_counter()
+    for word in typed:
+        for n in range(1, len(word) + 1):
+            # what the list widget did: look at every label on every keystroke
+            [t for t in names if word[:n] not in t.lower()]
+    scan = (time.perf_counter() - started) / keystrokes
+
+    print('{0} choices'.format(args.choices))
+    print('  build index       {0:>8.2f} ms'.format(build * 1000))
+    print('  per keystroke     {0:>8.3f} ms  (scanning every label: {1:.3f} ms)'.format(per_key * 1000, scan * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
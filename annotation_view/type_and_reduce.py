@@ -1,16 +1,42 @@
 from .components import ClickLabel
+from .search_index import SearchIndex
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from logging import getLogger
 
 
-class TypeAndReduceChoice(QListWidgetItem):
+class TypeAndReduceChoice(object):
+    ''' what on_choice is called with '''
     def __init__(self, choice):
-        super().__init__()
-        self.setText(str(choice))
         self.choice = choice
 
 
+class TypeAndReduceModel(QAbstractListModel):
+    '''
+    The choices matching the search text, best match first. A new search replaces the
+    rows in one go rather than hiding list items one at a time.
+    '''
+    def __init__(self, choices, parent=None):
+        super().__init__(parent)
+        self.search_index = SearchIndex.for_choices(choices)
+        self.rows = self.search_index.search('')
+
+    def set_search_text(self, text):
+        self.beginResetModel()
+        self.rows = self.search_index.search(text)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, model_index, role=None):
+        if model_index.isValid() and role == Qt.DisplayRole:
+            return self.search_index.labels[self.rows[model_index.row()]]
+
+    def choice(self, model_index):
+        return self.search_index.choices[self.rows[model_index.row()]]
+
+
 class TypeAndReduce(QWidgetAction):
     def __init__(self, title, choices, on_choice, parent, hide_parent = True):
         super().__init__(parent)
@@ -40,9 +66,10 @@ class TypeAndReduce(QWidgetAction):
         top_layout.addWidget(self.toggle_view)
         top_section.setLayout(top_layout)
 
-        self.choice_list = QListWidget()
-        for choice in choices:
-            self.choice_list.addItem(TypeAndReduceChoice(choice))
+        self.model = TypeAndReduceModel(choices, self)
+        self.choice_list = QListView()
+        self.choice_list.setUniformItemSizes(True)
+        self.choice_list.setModel(self.model)
         self.choice_list.setStyleSheet('''
         :focus { border: none; }
         QScrollBar::vertical { border: 1px solid #999999; background:white; width:10px; margin: 0px 0px 0px 0px;}
@@ -64,8 +91,7 @@ class TypeAndReduce(QWidgetAction):
             stop: 0.5 rgb(131,140,158),  stop:1 rgb(131,140,158)); width: 0px;subcontrol-position: left;
             subcontrol-origin:margin}
         ''')
-        self.choice_list.sortItems()
-        self.choice_list.itemDoubleClicked.connect(self._selected_choice)
+        self.choice_list.doubleClicked.connect(self._selected_choice)
 
         layout.addWidget(top_section)
         layout.addWidget(self.choice_list)
@@ -73,11 +99,10 @@ class TypeAndReduce(QWidgetAction):
         self.setDefaultWidget(default_widget)
 
     def _text_changed(self, new_text):
-        for row in range(0, self.choice_list.count()):
-            item = self.choice_list.item(row)
-            item.setHidden(new_text.lower() not in item.text().lower())
+        self.model.set_search_text(new_text)
 
-    def _selected_choice(self, item):
+    def _selected_choice(self, model_index):
+        item = TypeAndReduceChoice(self.model.choice(model_index))
         getLogger('finprint').debug('item chosen: {}'.format(str(item.choice)))
         self.on_choice(item)
         if self.hide_parent:
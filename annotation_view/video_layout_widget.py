@@ -1,13 +1,13 @@
 import os
 from logging import getLogger
 from video_player import VlcVideoWidget, PlayState, TimerVO
-from global_finprint import GlobalFinPrintServer
-from config import global_config
+from global_finprint import GlobalFinPrintServer, ProgressReporter
 from .video_seek_widget import VideoSeekWidget
 from .filter_widget import FilterWidget
 from .fullscreen import FullScreen
-from .components import ClickLabel, SpeedButton, GenericButton
+from .components import ClickLabel, SpeedButton, GenericButton, show_server_error
 from .observation_table import ObservationTable
+from media_index import get_media_index
 from .util import convert_position
 from .key_press_handler import MultiKeyPressHandler
 from PyQt4.QtCore import *
@@ -23,7 +23,6 @@ MARK_HAUL_TIME_GLOBAL_ID = 23
 class VideoLayoutWidget(QWidget):
     fullscreen = None
     is_fullscreen = False
-    FRAME_STEP = 70  # milli seconds
     keyPressed = pyqtSignal(QEvent)
 
     def __init__(self, main_window):
@@ -246,17 +245,10 @@ class VideoLayoutWidget(QWidget):
     @staticmethod
     def get_local_file(orig_file_path):
         path, filename = os.path.split(orig_file_path)
-        local_path = global_config.get('VIDEOS', 'alt_media_dir')
-        matching_files = []
-        for dir_path, dir_names, file_names in os.walk(local_path):
-            for f in file_names:
-                if f == filename:
-                    matching_files.append(os.path.join(dir_path, f))
-
-        if len(matching_files) == 1:
-            return matching_files[0]
-        elif len(matching_files) > 1:
-            return matching_files[0]  # TODO: Allow selection if there's more than one
+        index = get_media_index()
+        local_file = index.lookup(filename, orig_file_path) if index is not None else None
+        if local_file is not None:
+            return local_file
         else:
             error_message = 'File not found in local media store.  Using original path {0}'.format(orig_file_path)
             getLogger('finprint').info(error_message)
@@ -265,6 +257,11 @@ class VideoLayoutWidget(QWidget):
     def load_set(self, set):
         getLogger('finprint').info("Loading Set {0}".format(set.code))
 
+        # report how far we got in the set we're leaving
+        if self.current_set is not None:
+            self.on_progress_update(self._video_player.get_position())
+        ProgressReporter.get_instance().flush()
+
         self._data_loading = True
         self.clear()
         self.current_set = set
@@ -328,6 +325,22 @@ class VideoLayoutWidget(QWidget):
         self._fullscreen_button.setDisabled(False)
         self._video_filter_button.setDisabled(False)
 
+        # have the fullscreen player ready before it's asked for
+        QTimer.singleShot(0, self._prewarm_fullscreen)
+
+    def _fullscreen_args(self):
+        return [self.current_set,
+                self.get_local_file(self.current_set.file),
+                self._video_player]
+
+    def _prewarm_fullscreen(self):
+        if self.current_set is None or self.is_fullscreen:
+            return
+        if self.fullscreen:
+            self.fullscreen.prewarm(*self._fullscreen_args())
+        else:
+            self.fullscreen = FullScreen(*self._fullscreen_args(), show=False)
+
     def on_playstate_changed(self, play_state):
         getLogger('finprint').info('layout widget: playstate changed: {0}'.format(play_state))
         if play_state == PlayState.EndOfStream or play_state == PlayState.Paused:
@@ -388,8 +401,7 @@ class VideoLayoutWidget(QWidget):
 
 
     def on_slider_tick(self, position, obs):
-        events = sorted(obs.events, key=lambda e: e.create_datetime)
-        self.event_selected(events[0])
+        self.event_selected(obs.first_event())
 
     def event_selected(self, evt):
         self._video_player.display_event(evt.event_time, evt.extent)
@@ -398,9 +410,13 @@ class VideoLayoutWidget(QWidget):
         self._video_player.toggle_play()
 
     def on_submit(self):
-        self.current_set.mark_as_done()
+        def failed(error):
+            show_server_error(error)
+            self._main_window._launch_assign_diag()
+
+        # the set list is only shown once the server has the set as done
+        self.current_set.mark_as_done(on_done=lambda _: self._main_window._launch_assign_diag(), on_error=failed)
         self.clear()
-        self._main_window._launch_assign_diag()
 
     def on_accept(self):
         GlobalFinPrintServer().mark_set_approved(self.current_set.id)
@@ -427,10 +443,10 @@ class VideoLayoutWidget(QWidget):
         self._video_player.fast_forward()
 
     def on_step_back(self):
-        self._video_player.scrub_position(self._video_player.get_position() - self.FRAME_STEP)
+        self._video_player.step_frame(-1)
 
     def on_step_forward(self):
-        self._video_player.scrub_position(self._video_player.get_position() + self.FRAME_STEP)
+        self._video_player.step_frame(1)
 
     def on_speed(self, speed):
         self._video_player.set_speed(speed)
@@ -438,6 +454,7 @@ class VideoLayoutWidget(QWidget):
     def on_quit(self):
         if self._video_player is not None:
             self.on_progress_update(self._video_player.get_position())  # update position on quit
+        ProgressReporter.get_instance().flush(wait=True)
         QCoreApplication.instance().quit()
 
     def set_duration(self, obs):
@@ -449,8 +466,9 @@ class VideoLayoutWidget(QWidget):
             msgbox.setWindowTitle("Error Setting Duration")
             msgbox.exec_()
         else:
-            self.current_set.edit_observation(obs, {'duration': duration})
-            self._observation_table.refresh_model()
+            self.current_set.edit_observation(obs, {'duration': duration},
+                                              on_done=self._observation_table._on_set_changed,
+                                              on_error=show_server_error)
 
     def on_organism_cell_changed(self, animal, row):
         obs = self._observation_table.get_observation(row)
@@ -474,24 +492,25 @@ class VideoLayoutWidget(QWidget):
         self.check_submit_button_activation_condition(self.current_set)
 
     def on_fullscreen(self):
+        # keep playing at the same speed in fullscreen if we were playing
+        resume_rate = self._video_player.get_rate() if self._video_player.is_playing() else None
         self._video_player.pause()
         self._filter_widget.hide()
         self._video_filter_button.setPixmap(QPixmap('images/filters.png'))
-        args = [self.current_set,
-                self.get_local_file(self.current_set.file),
-                self._video_player]
+        args = self._fullscreen_args()
         if self.fullscreen:
-            self.fullscreen.revive(*args)
+            self.fullscreen.revive(*args, resume_rate=resume_rate)
         else:
-            self.fullscreen = FullScreen(*args)
+            self.fullscreen = FullScreen(*args, resume_rate=resume_rate)
         self.is_fullscreen = True
 
     def on_filter_change(self, saturation, brightness, contrast):
-        self._video_player.saturation = saturation
-        self._video_player.brightness = brightness
-        self._video_player.contrast = contrast
-        if self._video_player.is_paused():
-            self._video_player.refresh_frame()
+        self._video_player.set_filter_state(saturation, brightness, contrast)
+
+    def set_filter_state(self, saturation, brightness, contrast):
+        ''' take on the filters used in fullscreen '''
+        self._filter_widget.set_values(saturation, brightness, contrast)
+        self._video_player.set_filter_state(saturation, brightness, contrast)
 
     def check_submit_button_activation_condition(self, set):
         #instead of having constant for mark_haul_time,mark_90Mins_time
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from global_finprint import GlobalFinPrintServer, Observation
 from .util import convert_position
 from PyQt4.QtCore import *
@@ -5,23 +6,49 @@ from PyQt4.QtGui import *
 from video_player.mark_zero_time_selector import MarkZeroTimeSelector
 
 
-class Tick(QLabel):
-    clicked = pyqtSignal(int, Observation)
+class TickLayer(object):
+    '''
+    Observation markers on the seek bar. Positions are kept sorted so the whole
+    timeline is drawn in one pass and clicks are resolved with a binary search.
+    '''
     tick_image = QImage('images/timeline-tick.png')
 
-    def __init__(self, parent=None, position=0, obs=None):
-        super().__init__(parent)
-        self.position = position
-        self.observation = obs
-        self.setGeometry(QRect(0, 0, Tick.tick_image.width(), Tick.tick_image.height()))
-        self.setMouseTracking(True)
-        self.setPixmap(QPixmap.fromImage(Tick.tick_image))
-
-    def mousePressEvent(self, ev):
-        self.clicked.emit(self.position, self.observation)
-
-    def mouseMoveEvent(self, ev):
-        QToolTip.showText(QCursor.pos(), convert_position(self.position))
+    def __init__(self):
+        self.positions = []
+        self.observations = []
+        self.xs = []
+        self._pixmap = None
+
+    def load(self, observations):
+        ticks = sorted(((obs.initial_time(), obs) for obs in observations), key=lambda t: t[0])
+        self.positions = [t[0] for t in ticks]
+        self.observations = [t[1] for t in ticks]
+
+    def layout(self, pos_from_value):
+        # There's a weird layout issue so I had to add a fudge factor to get the ticks to
+        # be placed consistently with the slider
+        self.xs = []
+        for position in self.positions:
+            x = pos_from_value(position)
+            self.xs.append(round(x - (0.015 * x)))
+
+    def paint(self, painter):
+        if self._pixmap is None:
+            self._pixmap = QPixmap.fromImage(self.tick_image)
+        last_x = None
+        for x in self.xs:
+            if x != last_x:  # stacked ticks only need drawing once
+                painter.drawPixmap(x, 0, self._pixmap)
+                last_x = x
+
+    def tick_at(self, x, y):
+        ''' index of the topmost tick under the point, or None '''
+        if y < 0 or y >= self.tick_image.height():
+            return None
+        idx = bisect_right(self.xs, x) - 1
+        if idx >= 0 and x < self.xs[idx] + self.tick_image.width():
+            return idx
+        return None
 
 
 class VideoSeekWidget(QSlider):
@@ -32,22 +59,32 @@ class VideoSeekWidget(QSlider):
 
         self.dragging = False
         self._player = player
-        self._ticks = []
+        self._ticks = TickLayer()
         self._set = None
-        self._last_width = self.width()
 
         self.setOrientation(Qt.Horizontal)
+        self.setMouseTracking(True)  # tick tooltips
         self.setStyleSheet(self.style())
         self.allowed_progress = 0
         self.setMaximumWidth(self._player.width())
 
-    def resizeEvent(self, _):
-        if self.width() != self._last_width:
-            self._last_width = self.width()
-            self.generate_ticks()
+    def resizeEvent(self, ev):
+        super().resizeEvent(ev)
+        self._ticks.layout(self._posFromValue)
+
+    def sliderChange(self, change):
+        super().sliderChange(change)
+        if change == QAbstractSlider.SliderRangeChange:
+            self._ticks.layout(self._posFromValue)
+
+    def paintEvent(self, ev):
+        super().paintEvent(ev)
+        painter = QPainter(self)
+        self._ticks.paint(painter)
+        painter.end()
 
     def _posFromValue(self, val):
-        return round(val * self.width() / self.maximum())
+        return round(val * self.width() / self.maximum()) if self.maximum() else 0
 
     def _valueFromPos(self, pos):
         return pos * self.maximum() / self.width()
@@ -58,24 +95,13 @@ class VideoSeekWidget(QSlider):
         self.generate_ticks()
 
     def clear_ticks(self):
-        for t in self._ticks:
-            t.setParent(None)
-            t.deleteLater()
-        self._ticks = []
+        self._ticks.load([])
+        self._ticks.layout(self._posFromValue)
+        self.update()
 
     def generate_ticks(self):
-        self.clear_ticks()
-        if self._set:
-            for obs in self._set.observations:
-                x = self._posFromValue(obs.initial_time())
-                tick = Tick(parent=self, position=obs.initial_time(), obs=obs)
-                # There's a weird layout issue so I had to add a fudge factor to get the ticks to
-                # be placed consistently with the slider
-                x = round(x - (0.015 * x))
-                tick.move(x, 0)
-                tick.clicked.connect(self.tick_selected)
-                self._ticks.append(tick)
-                tick.show()
+        self._ticks.load(self._set.observations if self._set else [])
+        self._ticks.layout(self._posFromValue)
         self.update()
 
     def tick_selected(self, pos, obs):
@@ -87,6 +113,10 @@ class VideoSeekWidget(QSlider):
 
     def mousePressEvent(self, ev):
         """ Jump to click position """
+        tick = self._ticks.tick_at(ev.x(), ev.y())
+        if tick is not None:
+            self.tick_selected(self._ticks.positions[tick], self._ticks.observations[tick])
+            return
         self.dragging = True
         self._player.pause()
         self.allowed_progress = max(self.value(), self.allowed_progress)
@@ -94,6 +124,11 @@ class VideoSeekWidget(QSlider):
 
     def mouseMoveEvent(self, ev):
         """ Jump to pointer position while moving """
+        if not ev.buttons() & Qt.LeftButton:
+            tick = self._ticks.tick_at(ev.x(), ev.y())
+            if tick is not None:
+                QToolTip.showText(QCursor.pos(), convert_position(self._ticks.positions[tick]))
+            return
         pos = QStyle.sliderValueFromPosition(self.minimum(), self.maximum(), ev.x(), self.width())
         x = self._posFromValue(pos)
         self.setValue(pos)
@@ -103,7 +138,7 @@ class VideoSeekWidget(QSlider):
     def mouseReleaseEvent(self, ev):
         if self.dragging:
             self.scrub_position(self.value())
-            QTimer.singleShot(1000, self._player.take_videoframe_snapshot)
+            self._player.take_videoframe_snapshot()
         self.dragging = False
         # self.set_position(self.value())
 
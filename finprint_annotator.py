@@ -1,3 +1,4 @@
+import startup_timing
 import sys
 import os
 import platform
@@ -5,7 +6,15 @@ import logging
 import logging.config
 from finprint_annotator import MainWindow
 from global_finprint import ExceptionHandling
+from PyQt4.QtCore import QTimer
 from PyQt4.QtGui import *
+startup_timing.mark('imports')
+
+
+def first_window_shown(app):
+    startup_timing.mark('first window')
+    if startup_timing.exit_after_first_window():
+        app.quit()
 
 
 def main():
@@ -30,9 +39,13 @@ def main():
         l.debug('Processor: {}'.format(platform.processor()))
         app = QApplication(sys.argv)
         app.setStyle("Plastique")
+        startup_timing.mark('application')
         win = MainWindow()
+        startup_timing.mark('main window')
         win.show()
         win.activateWindow()
+        # runs once the event loop has put the window (and login dialog) on screen
+        QTimer.singleShot(0, lambda: first_window_shown(app))
         sys.exit(app.exec_())
 
     except Exception as e:
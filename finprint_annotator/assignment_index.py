@@ -0,0 +1,130 @@
+import time
+from logging import getLogger
+from pydispatch import dispatcher
+from global_finprint import GlobalFinPrintServer, SET_STATUS_CHANGED
+
+
+# the set list filters the lead dashboard can answer itself, and where each one's value
+# is found in a set from the set list
+DIMENSIONS = {
+    'set_id': lambda s: s.get('id'),
+    'trip_id': lambda s: _id_of(s, 'trip'),
+    'reef_id': lambda s: _id_of(s, 'reef'),
+    'annotator_id': lambda s: _id_of(s, 'assigned_to'),
+    'status_id': lambda s: _id_of(s, 'status'),
+    'affiliation_id': lambda s: s.get('affiliation_id', (s.get('assigned_to') or {}).get('affiliation_id')),
+}
+
+
+# values on fewer than 1 in SPARSE sets are kept as positions rather than bitmaps
+SPARSE = 64
+
+
+def _id_of(s, key):
+    if key + '_id' in s:
+        return s[key + '_id']
+    value = s.get(key)
+    return value.get('id') if isinstance(value, dict) else None
+
+
+def _bitmap(positions, count):
+    bits = bytearray((count + 7) // 8)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class AssignmentIndex(object):
+    '''
+    The lead's working set of assignments, downloaded once, indexed by the value of each
+    filter, so any combination of filters is a few integer ANDs of bitmaps (bit i set
+    for the i-th set) instead of a request. Common values keep their bitmap; rare ones,
+    like set ids, keep a list of positions and get a bitmap when they're asked for.
+    Filters on something the sets don't carry can't
+    be answered here; supports() says so and the caller asks the server as before.
+    '''
+    # indexes by the logged in user and the server-side part of the query they were
+    # downloaded with
+    _cache = {}
+
+    def __init__(self, sets, max_age):
+        self.sets = list(sets)
+        self.created = time.time()
+        self.max_age = max_age
+        self._all = (1 << len(self.sets)) - 1
+        self._bitmaps = {}
+        for name, value_of in DIMENSIONS.items():
+            positions = {}
+            complete = True
+            for i, s in enumerate(self.sets):
+                value = value_of(s)
+                if value is None:
+                    complete = False
+                    break
+                positions.setdefault(str(value), []).append(i)
+            # a filter is only answered here if every set says which value it has
+            if complete:
+                self._bitmaps[name] = dict((v, _bitmap(p, len(self.sets)) if len(p) * SPARSE > len(self.sets) else p)
+                                           for v, p in positions.items())
+        getLogger('finprint').debug('Indexed {0} sets by {1}'.format(len(self.sets), sorted(self._bitmaps)))
+
+    @staticmethod
+    def split(params):
+        ''' params as (what the server has to filter on, what can be filtered here) '''
+        server = dict((k, v) for k, v in params.items() if k not in DIMENSIONS)
+        local = dict((k, v) for k, v in params.items() if k in DIMENSIONS)
+        return server, local
+
+    @staticmethod
+    def key(server_params):
+        # per user, as the server answers the same query differently for each of them
+        user_id = GlobalFinPrintServer().user_id
+        return (user_id,) + tuple(sorted((k, str(v)) for k, v in server_params.items()))
+
+    @classmethod
+    def cached(cls, server_params):
+        index = cls._cache.get(cls.key(server_params))
+        if index is not None and index.is_stale():
+            del cls._cache[cls.key(server_params)]
+            return None
+        return index
+
+    @classmethod
+    def store(cls, key, index):
+        ''' key is from key(), taken when the download started '''
+        cls._cache[key] = index
+
+    @classmethod
+    def clear(cls):
+        cls._cache.clear()
+
+    def is_stale(self):
+        return time.time() - self.created > self.max_age
+
+    def supports(self, local_params):
+        return all(k in self._bitmaps for k in local_params)
+
+    def query(self, local_params):
+        ''' the sets matching every filter in local_params, in the server's order '''
+        mask = self._all
+        for name, value in local_params.items():
+            bitmap = self._bitmaps[name].get(str(value), 0)
+            mask &= bitmap if isinstance(bitmap, int) else _bitmap(bitmap, len(self.sets))
+            if not mask:
+                return []
+        # lowest bit first, so the string reads in set order
+        bits = bin(mask)[:1:-1]
+        result = []
+        i = bits.find('1')
+        while i >= 0:
+            result.append(self.sets[i])
+            i = bits.find('1', i + 1)
+        return result
+
+
+def _on_set_status_changed(signal, sender, value):
+    # the filters would go on showing the set under its old status
+    AssignmentIndex.clear()
+
+
+dispatcher.connect(_on_set_status_changed, signal=SET_STATUS_CHANGED, sender=dispatcher.Any)
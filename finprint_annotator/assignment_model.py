@@ -0,0 +1,203 @@
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+from annotation_view import convert_position
+
+
+MISSING_FILE_COLOR = QColor(204, 204, 204)
+
+
+class SetColumns(object):
+    '''
+    The set list as one list per field rather than a dict per set, which is all the
+    table needs and a lot less to keep for thousands of sets. Display text is only put
+    together for the rows the view actually paints.
+    '''
+    def __init__(self, sets=()):
+        self.ids = []
+        self.codes = []
+        self.annotators = []
+        self.projects = []
+        self.assigned_at = []
+        self.statuses = []
+        self.progress = []
+        self.last_activity = []
+        self.files = []
+        self._search_text = None
+        self.extend(sets)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, sets):
+        start = len(self.ids)
+        for s in sets:
+            self.ids.append(s['id'])
+            self.codes.append(s['set_code'])
+            self.annotators.append((s.get('assigned_to') or {}).get('user'))
+            self.projects.append(s['project_name'])
+            self.assigned_at.append(s['assigned_at'])
+            self.statuses.append(s['status']['name'])
+            self.progress.append(s['progress'])
+            self.last_activity.append(s['last_activity'])
+            self.files.append(s['file'])
+        if self._search_text is not None:
+            self._search_text.extend(self._search_texts(start))
+
+    def status_text(self, row):
+        return self.statuses[row] + ' ' + convert_position(self.progress[row])
+
+    def has_file(self, row):
+        return self.files[row] not in ('None', '', None)
+
+    def search_text(self, row):
+        ''' everything shown for row, lowercased, for the filter box '''
+        if self._search_text is None:
+            # built the first time anyone filters, in one pass
+            self._search_text = self._search_texts(0)
+        return self._search_text[row]
+
+    def _search_texts(self, start):
+        columns = (self.codes, self.annotators, self.projects, self.assigned_at, self.statuses,
+                   self.last_activity, self.files)
+        return [' '.join(str(v) for v in values if v is not None).lower()
+                for values in zip(*(c[start:] for c in columns))]
+
+
+class AssignmentTableModel(QAbstractTableModel):
+    LEAD_COLUMNS = ['ID', 'Set/video name',
+                    'Annotator', 'Project name',
+                    'Date assigned', 'Status', 'Last activity', 'Filename']
+
+    ANNO_COLUMNS = ['ID', 'Set/video name', 'Project name',
+                    'Date assigned', 'Status', 'Last Activity', 'Filename']
+
+    # the SetColumns list behind each column
+    LEAD_FIELDS = ['ids', 'codes', 'annotators', 'projects', 'assigned_at', 'statuses', 'last_activity', 'files']
+    ANNO_FIELDS = ['ids', 'codes', 'projects', 'assigned_at', 'statuses', 'last_activity', 'files']
+
+    def __init__(self, is_lead, parent=None):
+        super().__init__(parent)
+        self.columns = self.LEAD_COLUMNS if is_lead else self.ANNO_COLUMNS
+        self.fields = self.LEAD_FIELDS if is_lead else self.ANNO_FIELDS
+        self.sets = SetColumns()
+        # display order, as positions in sets
+        self._order = []
+        self._sort = None
+
+    def set_sets(self, sets):
+        self.beginResetModel()
+        self.sets = SetColumns(sets)
+        self._order = list(range(len(self.sets)))
+        if self._sort is not None:
+            self._sort_order(*self._sort)
+        self.endResetModel()
+
+    def append_sets(self, sets):
+        ''' add another page of sets, in place if the table is sorted '''
+        if not sets:
+            return
+        start = len(self.sets)
+        if self._sort is None:
+            self.beginInsertRows(QModelIndex(), start, start + len(sets) - 1)
+            self.sets.extend(sets)
+            self._order.extend(range(start, len(self.sets)))
+            self.endInsertRows()
+            return
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        rows = [self._order[i.row()] for i in persistent]
+        self.sets.extend(sets)
+        self._order.extend(range(start, len(self.sets)))
+        self._sort_order(*self._sort)
+        self._move_persistent(persistent, rows)
+        self.layoutChanged.emit()
+
+    def set_id(self, row):
+        return self.sets.ids[self._order[row]]
+
+    def file(self, row):
+        return self.sets.files[self._order[row]]
+
+    def has_file(self, row):
+        return self.sets.has_file(self._order[row])
+
+    def search_text(self, row):
+        return self.sets.search_text(self._order[row])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=None):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, model_index, role=None):
+        if not model_index.isValid():
+            return None
+        row = self._order[model_index.row()]
+        if role == Qt.DisplayRole:
+            field = self.fields[model_index.column()]
+            if field == 'statuses':
+                return self.sets.status_text(row)
+            value = getattr(self.sets, field)[row]
+            return '' if value is None else str(value)
+        if role == Qt.ForegroundRole and not self.sets.has_file(row):
+            return MISSING_FILE_COLOR
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # sorted a column at a time, rather than by the view comparing cells in pairs
+        if column < 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        rows = [self._order[i.row()] for i in persistent]
+        self._sort = (column, order)
+        self._sort_order(column, order)
+        self._move_persistent(persistent, rows)
+        self.layoutChanged.emit()
+
+    def _move_persistent(self, persistent, rows):
+        ''' point the persistent indexes (the selection...) back at the sets they were on '''
+        if not persistent:
+            return
+        position = dict((r, i) for i, r in enumerate(self._order))
+        self.changePersistentIndexList(persistent, [self.index(position[r], i.column())
+                                                    for r, i in zip(rows, persistent)])
+
+    def _sort_order(self, column, order):
+        field = self.fields[column]
+        values = getattr(self.sets, field)
+        if field == 'statuses':
+            progress = self.sets.progress
+            key = lambda r: (values[r] is not None, values[r], progress[r])
+        else:
+            key = lambda r: (values[r] is not None, values[r])
+        self._order.sort(key=key, reverse=order == Qt.DescendingOrder)
+
+
+class AssignmentFilterModel(QSortFilterProxyModel):
+    '''
+    Client side filtering of the assignment list by the text in the filter box;
+    sorting is passed down to the AssignmentTableModel, which does it column-wise.
+    '''
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._filter_words = []
+        self.setDynamicSortFilter(True)
+
+    def set_filter_text(self, text):
+        self._filter_words = text.lower().split()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._filter_words:
+            return True
+        text = self.sourceModel().search_text(source_row)
+        return all(w in text for w in self._filter_words)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
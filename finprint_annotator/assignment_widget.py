@@ -1,22 +1,32 @@
 from pydispatch import dispatcher
-from global_finprint import GlobalFinPrintServer
+from global_finprint import GlobalFinPrintServer, AsyncClient
+from global_finprint.global_finprint_server import _config_int
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
-from annotation_view import convert_position, VideoLayoutWidget
+from annotation_view import VideoLayoutWidget
+from annotation_view.components import show_server_error
 from finprint_annotator.assignment_filter import AssignmentFilterDTO
-import ast as ast
+from finprint_annotator.assignment_index import AssignmentIndex
+from finprint_annotator.assignment_model import AssignmentTableModel, AssignmentFilterModel
 
-class AssignmentWidget(QWidget):
-    LEAD_COLUMNS = ['ID', 'Set/video name',
-                    'Annotator', 'Project name',
-                 'Date assigned', 'Status', 'Last activity', 'Filename']
 
-    ANNO_COLUMNS = ['ID', 'Set/video name', 'Project name',
-                   'Date assigned', 'Status', 'Last Activity', 'Filename']
+DEFAULT_INDEX_MAX_AGE = 600  # seconds
+
+class AssignmentWidget(QWidget):
     def __init__(self, sets, assigned=False, assignedByMe=0,):
         super().__init__()
 
-        self._sets = sets
+        self._sets = sets or []
+        # the set list request filling the table, while it's running
+        self._loading = None
+        # when the list being loaded is a whole working set, what to index it under
+        self._index_as = None
+        self._loaded = []
+        self._indexing = set()
+        # the request for the reef and set dropdowns, while it's running
+        self._reef_sets = None
+        # (dropdown, id) to select once the dropdowns are filled, while the saved filters are restored
+        self._restore = None
         self.is_lead = GlobalFinPrintServer().is_lead()
         self.layout = QVBoxLayout()
         self._assignment_filter = AssignmentFilterDTO.get_instance()
@@ -89,7 +99,7 @@ class AssignmentWidget(QWidget):
             self._affiliation_filter.setStyleSheet(stylesheet)
             self._affiliation_filter.setMaximumWidth(400)
             self._affiliation_filter.addItem('--- Affiliation ---')
-            for key,value in ast.literal_eval(affiliation_list.text).items():
+            for key,value in affiliation_list.items():
                 self._affiliation_filter.addItem(value,key)
 
             filter_layout.addWidget(self._affiliation_filter)
@@ -112,6 +122,11 @@ class AssignmentWidget(QWidget):
 
             self.resetSearch = QPushButton("Reset")
             self.resetSearch.setMaximumWidth(100)
+            # searches are answered from the sets downloaded for the first one; this
+            # downloads them again
+            self.refreshSearch = QPushButton("Refresh")
+            self.refreshSearch.setMaximumWidth(100)
+            self.refreshSearch.clicked.connect(self._refresh)
             self.searchWithAllFilters = QPushButton("Search")
             self.searchWithAllFilters.setMaximumWidth(100)
 
@@ -119,6 +134,7 @@ class AssignmentWidget(QWidget):
             self.resetSearch.clicked.connect(self._clear_filter)
             self._another_filter_layout.addSpacing(400)
             self._another_filter_layout.addWidget(self.resetSearch);
+            self._another_filter_layout.addWidget(self.refreshSearch);
             self._another_filter_layout.addWidget(self.searchWithAllFilters);
             filter_layout.addStretch(1)
 
@@ -137,8 +153,19 @@ class AssignmentWidget(QWidget):
         self.headerLabel.setMinimumHeight(40)
         self.layout.addWidget(self.headerLabel)
 
+        # narrows the sets already loaded, without asking the server
+        self._text_filter = QLineEdit()
+        self._text_filter.setPlaceholderText('Filter these sets')
+        self._text_filter.setMaximumWidth(400)
+        self._text_filter.textChanged.connect(self._text_filter_change)
+        self.layout.addWidget(self._text_filter)
+
         # set table
-        self.set_table = QTableWidget(self)
+        self.set_model = AssignmentTableModel(self.is_lead, self)
+        self.filter_model = AssignmentFilterModel(self)
+        self.filter_model.setSourceModel(self.set_model)
+        self.set_table = QTableView(self)
+        self.set_table.setModel(self.filter_model)
         #increasing size of widget GLOB-525
         self.setMinimumSize(1200, 800)
 
@@ -150,76 +177,104 @@ class AssignmentWidget(QWidget):
                 padding-bottom:5px
             }
         ''')
-        columns = self.LEAD_COLUMNS if self.is_lead else self.ANNO_COLUMNS
-        self.set_table.setColumnCount(len(columns))
-        self.set_table.setHorizontalHeaderLabels(columns)
         self.set_table.setSelectionBehavior(QAbstractItemView.SelectRows)
-
-        # first column takes up extra space then fit rest of columns
-       # self.set_table.horizontalHeader().setResizeMode(1, QHeaderView.Stretch)
-        for col in range(1, self.set_table.columnCount() - 1):
-            self.set_table.horizontalHeader().setResizeMode(col, QHeaderView.ResizeToContents)
+        self.set_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # unsorted (the server's order) until a header is clicked
+        self.set_table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.set_table.setSortingEnabled(True)
+
+        # share the width out between the columns rather than measuring every cell;
+        # rows are all one height, so only the ones on screen are ever laid out
+        for col in range(1, self.set_model.columnCount() - 1):
             self.set_table.horizontalHeader().setResizeMode(col, QHeaderView.Stretch)
+        self.set_table.verticalHeader().setResizeMode(QHeaderView.Fixed)
 
         # hide ID and filename columns
         self.set_table.setColumnHidden(0, True)
-        self.set_table.setColumnHidden(self.set_table.columnCount() - 1, True)
+        self.set_table.setColumnHidden(self.set_model.columnCount() - 1, True)
 
         self.layout.addWidget(self.set_table)
         self.setLayout(self.layout)
 
+        # populate table with current sets
+        self._populate_table()
+
         if self.is_lead and not assigned:
           # GLOB-544: retain filter status
           if self._assignment_filter :
             self.set_prev_state_of_filters()
 
-        # populate table with current sets
-        self._populate_table()
-
         # hook up click events
-        self.set_table.cellDoubleClicked.connect(self._select_set)
+        self.set_table.doubleClicked.connect(self._select_set)
 
     def _populate_table(self):
-        # clear any current rows
-        for row in range(self.set_table.rowCount()):
-            self.set_table.removeRow(row)
-
+        self.set_model.set_sets(self._sets)
+        self._update_header()
+
+    def load_sets(self, index_as=None, **params):
+        '''
+        Replace the table with the server's set list, adding each page of it as it
+        arrives rather than waiting for all of it. With index_as, the list is a lead's
+        working set, indexed for filtering once it's all here.
+        '''
+        if self._loading is not None:
+            self._loading.cancel()
+        self._index_as = index_as
+        self._loaded = []
+        self.set_model.set_sets([])
+        self._loading = AsyncClient.get_instance().stream(GlobalFinPrintServer().iter_set_list, kwargs=params,
+                                                          on_item=self._on_set_page, on_done=self._on_set_list,
+                                                          on_error=self._on_set_list_error)
+        self._update_header()
+
+    def _on_set_page(self, sets):
+        # pages from a list we've since given up on can still be on their way
+        if self.sender() is self._loading:
+            self.set_model.append_sets(sets)
+            if self._index_as is not None:
+                self._loaded.extend(sets)
+            self._update_header()
+
+    def _on_set_list(self, _):
+        if self.sender() is self._loading:
+            self._loading = None
+            if self._index_as is not None:
+                self._build_index(self._index_as, self._loaded)
+            self._update_header()
+
+    def _on_set_list_error(self, error):
+        if self.sender() is self._loading:
+            self._loading = None
+            self._update_header()
+            show_server_error(error)
+
+    def hideEvent(self, event):
+        # the dialog is closed; no point fetching the rest
+        if self._loading is not None:
+            self._loading.cancel()
+            self._loading = None
+        super().hideEvent(event)
+
+    def _update_header(self):
         # Change the header label counter
         headerText = 'Assignments' if self.is_lead else 'Assigned set list'
         # Adding no. of assignments to the header label for quickly knowing the count
-        self.headerLabel.setText(headerText + ' (' + str(len(self._sets)) + ')')
-
-        # add sets to table
-        self.set_table.setRowCount(len(self._sets))
-        for row, set in enumerate(self._sets):
-            self._add_row(set, row)
-
-    def _add_row(self, set, row):
-        items = [
-            QTableWidgetItem(str(set['id'])),
-            QTableWidgetItem(set['set_code'])
-        ]
-        if self.is_lead:
-            items += [QTableWidgetItem(set['assigned_to']['user'])]
-
-        items += [
-            QTableWidgetItem(set['project_name']),
-            QTableWidgetItem(set['assigned_at']),
-            QTableWidgetItem(set['status']['name'] + ' ' + convert_position(set['progress'])),
-            QTableWidgetItem(set['last_activity']),
-            QTableWidgetItem(set['file']),
-        ]
-
-        for col, item in enumerate(items):
-            if set['file'] == 'None' or set['file'] == '' or set['file'] is None:
-                item.setTextColor(QColor(204, 204, 204))
-            item.setFlags(item.flags() ^ Qt.ItemIsEditable)
-            self.set_table.setItem(row, col, item)
-
-    def _select_set(self, row, _):
-        filename = self.set_table.item(row, self.set_table.columnCount() - 1).text()
-        set_id = int(self.set_table.item(row, 0).text())
-        if filename == 'None':
+        shown = self.filter_model.rowCount()
+        total = self.set_model.rowCount()
+        count = str(total) if shown == total else '{0} of {1}'.format(shown, total)
+        if self._loading is not None:
+            count += ', loading...'
+        self.headerLabel.setText(headerText + ' (' + count + ')')
+
+    def _text_filter_change(self, text):
+        self.filter_model.set_filter_text(text)
+        self._update_header()
+
+    def _select_set(self, model_index):
+        row = self.filter_model.mapToSource(model_index).row()
+        filename = self.set_model.file(row)
+        set_id = self.set_model.set_id(row)
+        if not self.set_model.has_file(row):
             msgbox = QMessageBox()
             msgbox.setText('No video file has been specified for this set')
             msgbox.setWindowTitle('Missing video')
@@ -259,8 +314,46 @@ class AssignmentWidget(QWidget):
         if  self._assignment_filter.get_limit_search()["id"] == 2:
             params['assigned_by_me'] = True
 
-        self._sets = GlobalFinPrintServer().set_list(**params)['sets']
-        self._populate_table()
+        server_params, local_params = AssignmentIndex.split(params)
+        index = AssignmentIndex.cached(server_params)
+        if index is not None and index.supports(local_params):
+            self._show_sets(index.query(local_params))
+        elif index is None and not local_params:
+            # this is the working set; index it as it comes in
+            self.load_sets(index_as=server_params, **params)
+        else:
+            self.load_sets(**params)
+            if index is None:
+                self._build_index(server_params)
+
+    def _show_sets(self, sets):
+        if self._loading is not None:
+            self._loading.cancel()
+            self._loading = None
+        self.set_model.set_sets(sets)
+        self._update_header()
+
+    def _build_index(self, server_params, sets=None):
+        ''' index the working set for server_params, downloading it first if need be '''
+        key = AssignmentIndex.key(server_params)
+        if key in self._indexing:
+            return
+        self._indexing.add(key)
+        max_age = _config_int('set_filter_max_age', DEFAULT_INDEX_MAX_AGE)
+
+        def build():
+            working_set = sets if sets is not None else GlobalFinPrintServer().set_list(**server_params)['sets']
+            return AssignmentIndex(working_set, max_age)
+
+        def built(index):
+            self._indexing.discard(key)
+            AssignmentIndex.store(key, index)
+
+        AsyncClient.get_instance().submit(build, on_result=built, on_error=lambda _: self._indexing.discard(key))
+
+    def _refresh(self):
+        AssignmentIndex.clear()
+        self._filter_change()
 
 
 
@@ -325,12 +418,11 @@ class AssignmentWidget(QWidget):
 
 
     def set_prev_state_of_filters(self):
+        # the reef and set dropdowns are filled in for the trip once the server answers
+        self._restore = [(self._reef_filter, self._assignment_filter.get_reef_filter()["id"]),
+                         (self._set_filter, self._assignment_filter.get_set_filter()["id"])]
         self._trip_filter.setCurrentIndex( self.returnZeroIndexIfFilterIsNotApplied(
             self._trip_filter.findData(self._assignment_filter.get_trip_filter()["id"])))
-        self._reef_filter.setCurrentIndex(self.returnZeroIndexIfFilterIsNotApplied(
-            self._reef_filter.findData(self._assignment_filter.get_reef_filter()["id"])))
-        self._set_filter.setCurrentIndex( self.returnZeroIndexIfFilterIsNotApplied(
-                self._set_filter.findData( self._assignment_filter.get_set_filter()["id"])))
         self._anno_filter.setCurrentIndex(self.returnZeroIndexIfFilterIsNotApplied(
             self._anno_filter.findData(self._assignment_filter.get_anno_filter()["id"])))
         self._status_filter.setCurrentIndex(self.returnZeroIndexIfFilterIsNotApplied(
@@ -338,7 +430,19 @@ class AssignmentWidget(QWidget):
         self._affiliation_filter.setCurrentIndex(self.returnZeroIndexIfFilterIsNotApplied(
             self._affiliation_filter.findData(self._assignment_filter.get_affiliation_filter()["id"])))
         self._limit_search.setCheckState(self._assignment_filter.get_limit_search()["id"])
-        self._filter_change()
+        self._restore_filters()
+
+    def _restore_filters(self):
+        ''' select the saved reef and set as their dropdowns are filled, then search '''
+        while self._restore:
+            if self._reef_sets is not None:
+                return
+            combo, id = self._restore.pop(0)
+            # selecting a reef asks for its sets, so the set is only selected after that
+            combo.setCurrentIndex(self.returnZeroIndexIfFilterIsNotApplied(combo.findData(id)))
+        if self._reef_sets is None:
+            self._restore = None
+            self._filter_change()
 
     def restrict_filter_based_on_trip_selected(self):
         self.control_set_filter_based_on_trip_selected()
@@ -351,8 +455,7 @@ class AssignmentWidget(QWidget):
         if self._reef_filter.currentIndex() > 0:
             reef_id = self._reef_filter.itemData(self._reef_filter.currentIndex())
 
-        reef_set_list = GlobalFinPrintServer().reef_set_list(trip_id, reef_id)
-        self.filter_group_by_set_reef(reef_set_list)
+        self._load_reef_set_list(trip_id, reef_id)
 
     def control_set_filter_based_on_trip_selected(self):
             ''''filtering sets if a trip is selected'''
@@ -361,8 +464,28 @@ class AssignmentWidget(QWidget):
             if self._trip_filter.currentIndex() > 0:
                 trip_id = self._trip_filter.itemData(self._trip_filter.currentIndex())
 
-            reef_set_list = GlobalFinPrintServer().reef_set_list(trip_id, reef_id)
+            self._load_reef_set_list(trip_id, reef_id)
+
+    def _load_reef_set_list(self, trip_id, reef_id):
+        self._reef_sets = AsyncClient.get_instance().submit(GlobalFinPrintServer().reef_set_list,
+                                                            args=(trip_id, reef_id),
+                                                            on_result=self._on_reef_set_list,
+                                                            on_error=self._on_reef_set_list_error)
+
+    def _on_reef_set_list(self, reef_set_list):
+        # only the answer for the latest selection fills the dropdowns
+        if self.sender() is self._reef_sets:
+            self._reef_sets = None
             self.filter_group_by_set_reef(reef_set_list)
+            if self._restore is not None:
+                self._restore_filters()
+
+    def _on_reef_set_list_error(self, error):
+        if self.sender() is self._reef_sets:
+            self._reef_sets = None
+            show_server_error(error)
+            if self._restore is not None:
+                self._restore_filters()
 
     def returnZeroIndexIfFilterIsNotApplied(self,filterIndex):
         if filterIndex == -1 :
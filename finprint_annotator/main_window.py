@@ -2,9 +2,12 @@ import config
 import webbrowser
 from pydispatch import dispatcher
 from annotation_view import VideoLayoutWidget
-from global_finprint import GlobalFinPrintServer, Set, QueryException
+from global_finprint import GlobalFinPrintServer, Set, QueryException, AsyncClient, Journal, ProgressReporter
+from video_player.upload_manager import UploadManager
+from video_player.clip_engine import ClipEngine
 from .login_widget import LoginWidget
 from .assignment_widget import AssignmentWidget
+from .assignment_index import AssignmentIndex
 from PyQt4.QtGui import *
 from PyQt4.QtCore import *
 from sys import argv
@@ -30,6 +33,18 @@ class MainWindow(QMainWindow):
         dispatcher.connect(self.on_login, signal='LOGIN', sender=dispatcher.Any)
         dispatcher.connect(self.on_login_cancelled, signal='LOGIN_CANCELLED', sender=dispatcher.Any)
         dispatcher.connect(self.set_selected, signal='SET_SELECTED', sender=dispatcher.Any)
+        AsyncClient.get_instance().busyChanged.connect(self.on_busy_changed)
+        # also resumes any uploads left over from the last session
+        uploads = UploadManager.get_instance()
+        uploads.pendingChanged.connect(self.on_uploads_pending)
+        uploads.uploadFailed.connect(self.on_upload_failed)
+        ClipEngine.get_instance().clipFailed.connect(self.on_clip_failed)
+        # and any observation changes that didn't reach the server
+        journal = Journal.get_instance()
+        journal.pendingChanged.connect(self.on_journal_changed)
+        journal.offlineChanged.connect(self.on_journal_changed)
+        # and progress that hadn't been reported
+        ProgressReporter.get_instance()
 
     def _init_widgets(self):
         self.statusBar()
@@ -236,12 +251,14 @@ class MainWindow(QMainWindow):
 
 
     def _launch_assigned_set_list_diag(self):
-        sets = GlobalFinPrintServer().set_list()['sets']
+        # shown straight away and filled in as the set list arrives
+        assign_widget = AssignmentWidget(None, assigned=True)
         assign_layout = QVBoxLayout()
-        assign_layout.addWidget(AssignmentWidget(sets, assigned=True))
+        assign_layout.addWidget(assign_widget)
         self.assign_diag = QDialog(self)
         self.assign_diag.setLayout(assign_layout)
         self.assign_diag.show()
+        assign_widget.load_sets()
 
     def _launch_assign_diag(self, sets=False):
         assign_layout = QVBoxLayout()
@@ -252,8 +269,43 @@ class MainWindow(QMainWindow):
         self.assign_diag.move(50, 300)
         self.assign_diag.show()
 
+    def on_busy_changed(self, busy):
+        # the UI stays usable while requests are in flight; just show that we're waiting
+        if busy:
+            QApplication.setOverrideCursor(Qt.BusyCursor)
+            self.statusBar().showMessage('Waiting for server...')
+        else:
+            QApplication.restoreOverrideCursor()
+            self.statusBar().clearMessage()
+
+    def on_uploads_pending(self, pending):
+        if pending:
+            self.statusBar().showMessage('Uploading {0} capture(s)...'.format(pending))
+        else:
+            self.statusBar().clearMessage()
+
+    def on_journal_changed(self, _=None):
+        journal = Journal.get_instance()
+        if journal.is_offline() and journal.pending():
+            self.statusBar().showMessage('Server unreachable, {0} change(s) waiting to be sent'.format(journal.pending()))
+        elif not journal.pending():
+            self.statusBar().clearMessage()
+
+    def on_upload_failed(self, filename):
+        if filename.endswith('.mp4'):
+            msg = 'There was an error saving the video clip to the server. It will be retried the next time the annotator is started.'
+        else:
+            msg = 'There was an error saving the frame capture to the server. It will be retried the next time the annotator is started.'
+        QMessageBox.question(self, 'AWS UPLOAD ERROR', msg, QMessageBox.Close)
+
+    def on_clip_failed(self, filename):
+        msg = 'An error occurred while creating the video clip. Re-try by editing the observation or continue without creating a video.'
+        QMessageBox.question(self, '8Sec Video Clip Error', msg, QMessageBox.Close)
+
     def on_login(self, signal, sender, value):
         self._has_logged_in = True
+        # whatever the last user's dashboard indexed isn't theirs to see
+        AssignmentIndex.clear()
         if hasattr(self, 'login_diag'):
             self.login_diag.close()
         self._set_menus()
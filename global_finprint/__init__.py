@@ -1,6 +1,10 @@
 from .animal import Animal
+from .async_client import AsyncClient
+from .change_set import ChangeSet
 from .exception_handling import ExceptionHandling
 from .extent import Extent
-from .global_finprint_server import GlobalFinPrintServer, QueryException
+from .global_finprint_server import GlobalFinPrintServer, QueryException, SET_STATUS_CHANGED
+from .journal import Journal
+from .progress_reporter import ProgressReporter
 from .observation import Observation, Event
-from .set import Set
+from .set import Set, OBSERVATIONS_CHANGED
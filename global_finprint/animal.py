@@ -1,4 +1,7 @@
 class Animal(object):
+    __slots__ = ('_animal_dict', 'id', 'group', 'group_id', 'rank', 'genus', 'species', 'common_name',
+                 'sealifebase_key', 'fishbase_key', 'family')
+
     def __init__(self):
         self._animal_dict = None
         self.id = None
@@ -0,0 +1,107 @@
+from logging import getLogger
+from PyQt4.QtCore import *
+
+
+class PendingRequest(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    # each item from a streamed request
+    item = pyqtSignal(object)
+
+    def __init__(self, fn, args, kwargs, stream=False):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.stream = stream
+        self.cancelled = False
+
+    def cancel(self):
+        ''' stop a streamed request before its next item '''
+        self.cancelled = True
+
+
+class _RequestRunner(QRunnable):
+    def __init__(self, request):
+        super().__init__()
+        self.request = request
+        self.setAutoDelete(True)
+
+    def run(self):
+        try:
+            result = self.request.fn(*self.request.args, **self.request.kwargs)
+            if self.request.stream:
+                for item in result:
+                    if self.request.cancelled:
+                        break
+                    self.request.item.emit(item)
+                result.close()
+                result = None
+        except Exception as e:
+            getLogger('finprint').exception('Server request failed')
+            self.request.failed.emit(e)
+        else:
+            self.request.finished.emit(result)
+
+
+class AsyncClient(QObject):
+    '''
+    Runs server calls on worker threads and hands the results back to the GUI thread
+    as Qt signals. Mutations are submitted with serial=True so they reach the server
+    (and come back) in the order the annotator made them.
+    '''
+    INSTANCE = None
+    MAX_THREADS = 4
+
+    busyChanged = pyqtSignal(bool)
+
+    def __init__(self):
+        super().__init__()
+        self._pending = set()
+        self._pool = QThreadPool()
+        self._pool.setMaxThreadCount(self.MAX_THREADS)
+        self._serial_pool = QThreadPool()
+        self._serial_pool.setMaxThreadCount(1)
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = AsyncClient()
+        return cls.INSTANCE
+
+    def is_busy(self):
+        return len(self._pending) > 0
+
+    def submit(self, fn, args=(), kwargs=None, on_result=None, on_error=None, serial=False):
+        return self._start(PendingRequest(fn, args, kwargs or {}), on_result, on_error, serial)
+
+    def stream(self, fn, args=(), kwargs=None, on_item=None, on_done=None, on_error=None):
+        '''
+        Run a generator function: on_item gets each thing it yields as it's yielded, then
+        on_done(None) is called once it's finished. Items a cancelled request had already
+        produced may still be delivered; check sender() if that matters.
+        '''
+        request = PendingRequest(fn, args, kwargs or {}, stream=True)
+        if on_item is not None:
+            request.item.connect(on_item)
+        return self._start(request, on_done, on_error, False)
+
+    def _start(self, request, on_result, on_error, serial):
+        # connect before starting so a fast response can't be missed
+        request.finished.connect(lambda _: self._done(request))
+        request.failed.connect(lambda _: self._done(request))
+        if on_result is not None:
+            request.finished.connect(on_result)
+        if on_error is not None:
+            request.failed.connect(on_error)
+
+        self._pending.add(request)
+        if len(self._pending) == 1:
+            self.busyChanged.emit(True)
+        (self._serial_pool if serial else self._pool).start(_RequestRunner(request))
+        return request
+
+    def _done(self, request):
+        self._pending.discard(request)
+        if not self._pending:
+            self.busyChanged.emit(False)
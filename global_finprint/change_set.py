@@ -0,0 +1,21 @@
+class ChangeSet(object):
+    '''
+    Ids of the observations and events that were added, updated or removed by
+    merging a server response into a Set
+    '''
+    def __init__(self):
+        self.added_observations = set()
+        self.updated_observations = set()
+        self.removed_observations = set()
+        self.added_events = set()
+        self.updated_events = set()
+        self.removed_events = set()
+
+    def __bool__(self):
+        return bool(self.added_observations or self.updated_observations or self.removed_observations or
+                    self.added_events or self.updated_events or self.removed_events)
+
+    def __str__(self):
+        return 'observations +{0} ~{1} -{2}, events +{3} ~{4} -{5}'.format(
+            len(self.added_observations), len(self.updated_observations), len(self.removed_observations),
+            len(self.added_events), len(self.updated_events), len(self.removed_events))
@@ -2,51 +2,46 @@ import re
 from PyQt4.QtCore import *
 
 
+NUMBER = re.compile(r'\d+(?:\.\d*)?')
+
+
 class Extent(object):
-    def __init__(self):
-        self.empty = True
-        self.rect = QRect(QPoint(0, 0), QPoint(0, 0))
-        self.height = 1
-        self.width = 1
-        self.numbers = []
+    '''
+    A rectangle on the video, kept as fractions of the frame's width and height so it
+    doesn't depend on the size the video is shown at. It only becomes a QRect, in
+    pixels, when it's drawn.
+    '''
+    __slots__ = ('x1', 'y1', 'x2', 'y2')
+
+    def __init__(self, x1=None, y1=None, x2=None, y2=None):
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+
+    @property
+    def empty(self):
+        return self.x1 is None
 
     def getRect(self, h, w):
-        self.height = h
-        self.width = w
-        if len(self.numbers) == 10:
-            self.rect = QRect(QPoint(self._adjustX(float(self.numbers[0])), self._adjustY(float(self.numbers[1]))),
-                              QPoint(self._adjustX(float(self.numbers[4])), self._adjustY(float(self.numbers[5]))))
-        return self.rect
+        if self.empty:
+            return QRect(QPoint(0, 0), QPoint(0, 0))
+        return QRect(QPoint(int(self.x1 * w), int(self.y1 * h)), QPoint(int(self.x2 * w), int(self.y2 * h)))
 
     def setRect(self, r, h, w):
-        self.empty = False
-        self.rect = r
-        self.height = h
-        self.width = w
+        self.x1 = r.left() / w
+        self.y1 = r.top() / h
+        self.x2 = r.right() / w
+        self.y2 = r.bottom() / h
 
     def from_wkt(self, wkt_polygon):
         if wkt_polygon is not None:  # imports don't have extents
-            self.empty = False
             # Comes in SRID=4356;POLYGON ((X1 Y1, X2 Y1, X2 Y2, X1 Y2, X1 Y1))
-            self.numbers = re.findall(r'\d+(?:\.\d*)?', wkt_polygon.partition(';')[2])
-
-    def _adjustX(self, x):
-        return x * self.width
-
-    def _adjustY(self, y):
-        return y * self.height
-
-    def _normalizeX(self, x):
-        return x/self.width
-
-    def _normalizeY(self, y):
-        return y/self.height
+            numbers = NUMBER.findall(wkt_polygon.partition(';')[2] or wkt_polygon)
+            if len(numbers) == 10:
+                self.x1, self.y1, self.x2, self.y2 = map(float, numbers[0:2] + numbers[4:6])
 
     def to_wkt(self):
         wkt = "POLYGON (({0:.5f} {1:.5f}, {2:.5f} {3:.5f}, {4:.5f} {5:.5f}, {6:.5f} {7:.5f}, {8:.5f} {9:.5f}))"
-        return wkt.format(self._normalizeX(self.rect.topLeft().x()),
-                          self._normalizeY(self.rect.topLeft().y()),
-                          self._normalizeX(self.rect.topRight().x()), self._normalizeY(self.rect.topRight().y()),
-                          self._normalizeX(self.rect.bottomRight().x()), self._normalizeY(self.rect.bottomRight().y()),
-                          self._normalizeX(self.rect.bottomLeft().x()), self._normalizeY(self.rect.bottomLeft().y()),
-                          self._normalizeX(self.rect.topLeft().x()), self._normalizeY(self.rect.topLeft().y()))
+        x1, y1, x2, y2 = (0, 0, 0, 0) if self.empty else (self.x1, self.y1, self.x2, self.y2)
+        return wkt.format(x1, y1, x2, y1, x2, y2, x1, y2, x1, y1)
@@ -1,4 +1,23 @@
+import ast
+import json
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from logging import getLogger
+from pydispatch import dispatcher
+from config import global_config
+from .response_cache import ResponseCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL
+
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 30  # seconds
+DEFAULT_SET_PAGE_SIZE = 500
+# asks for just the observations a change touched rather than the whole list;
+# servers that don't know it ignore it and answer with the full list
+DELTA = {'delta': 'true'}
+# sent, with the set's id, when a set is marked done, accepted or rejected
+SET_STATUS_CHANGED = 'SET_STATUS_CHANGED'
 
 
 class Singleton:
@@ -12,6 +31,86 @@ class QueryException(Exception):
     pass
 
 
+class BulkUnsupported(QueryException):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    '''
+    Keep-alive adapter that applies a default timeout and counts whether each
+    request went out on a reused connection or had to open (and handshake) a new one.
+    New connections are counted by the pools as they open them, so requests running
+    at the same time on one pool don't get each other's connections counted as theirs.
+    '''
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        self.new_connections = 0
+        self._requests = 0
+        # requests go out from the GUI thread and the worker pools at once
+        self._stats_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    @property
+    def reused_connections(self):
+        with self._stats_lock:
+            return self._requests - self.new_connections
+
+    def get_connection(self, url, proxies=None):
+        return self._counted(super().get_connection(url, proxies))
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        # what send() asks for the pool from requests 2.32 on
+        return self._counted(super().get_connection_with_tls_context(request, verify, proxies, cert))
+
+    def _counted(self, pool):
+        ''' have pool count each connection it opens '''
+        with self._stats_lock:
+            if not getattr(pool, 'counted_by_adapter', False):
+                new_conn = pool._new_conn
+
+                def counted():
+                    with self._stats_lock:
+                        self.new_connections += 1
+                    return new_conn()
+
+                pool._new_conn = counted
+                pool.counted_by_adapter = True
+        return pool
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        with self._stats_lock:
+            self._requests += 1
+        return super().send(request, **kwargs)
+
+
+def _config_int(key, default):
+    value = global_config.get('GLOBAL_FINPRINT_SERVER', key)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        getLogger('finprint').warning('Invalid value for {0} in config.ini: {1}'.format(key, value))
+        return default
+
+
+def make_session():
+    pool_size = _config_int('pool_size', DEFAULT_POOL_SIZE)
+    adapter = PooledHTTPAdapter(timeout=_config_int('timeout', DEFAULT_TIMEOUT),
+                                pool_connections=pool_size,
+                                pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+def make_cache():
+    return ResponseCache(max_entries=_config_int('cache_size', DEFAULT_MAX_ENTRIES),
+                         disk_dir=global_config.get('GLOBAL_FINPRINT_SERVER', 'cache_dir') or None)
+
+
 class GlobalFinPrintServer(Singleton):
     def __init__(self):
         Singleton.__init__(self)
@@ -25,6 +124,54 @@ class GlobalFinPrintServer(Singleton):
             self.user_name = ''
             self.user_id = None
             self.address = None
+            self._session = make_session()
+            self._cache = make_cache()
+            self._cache_ttl = _config_int('cache_ttl', DEFAULT_TTL)
+
+    def _cached_get(self, path, parse=json.loads, **params):
+        '''
+        GET reference data through the response cache. Fresh entries are answered
+        without a request and stale ones are revalidated; only 200s are cached.
+        The body is cached as it came and parse turns it into what is returned, so
+        the answer is the same whether it came from the server, memory or disk.
+        '''
+        query = '&'.join('{0}={1}'.format(k, params[k]) for k in sorted(params))
+        key = '{0}|{1}|{2}'.format(path, self.user_id, query)
+        entry = self._cache.get(key)
+        if entry is not None and not isinstance(entry.data, str):
+            # written to disk by a version that cached parsed bodies
+            entry = None
+        if entry is not None and entry.is_fresh():
+            self._cache.count('hits')
+            return parse(entry.data)
+
+        params['token'] = self.user_token
+        headers = entry.validators() if entry is not None else {}
+        r = self._session.get(self.address + path, params=params, headers=headers)
+        if r.status_code == 304 and entry is not None:
+            self._cache.count('revalidated')
+            self._cache.refresh(entry, self._cache_ttl)
+            return parse(entry.data)
+        self._cache.count('misses')
+        if r.status_code != 200:
+            raise QueryException('Failed to get {0}: status {1}'.format(path, r.status_code))
+        data = parse(r.text)
+        self._cache.put(key, r.text, self._cache_ttl, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+        return data
+
+    def invalidate_cache(self, path=''):
+        ''' forget cached reference data for path (an /api/... prefix), or all of it '''
+        self._cache.invalidate(path)
+
+    def cache_stats(self):
+        return self._cache.stats()
+
+    def connection_stats(self):
+        adapters = set(self._session.adapters.values())
+        return {
+            'new': sum(a.new_connections for a in adapters),
+            'reused': sum(a.reused_connections for a in adapters)
+        }
 
     def is_lead(self):
         return self.user_role == 'lead'
@@ -37,7 +184,7 @@ class GlobalFinPrintServer(Singleton):
         if skip_set_list:
             data['skip_set_list'] = True
         self.address = server
-        r = requests.post(self.address + '/api/login', data)
+        r = self._session.post(self.address + '/api/login', data)
         self.logged_in = False
         if r.status_code == 200:
             self.logged_in = True
@@ -54,53 +201,85 @@ class GlobalFinPrintServer(Singleton):
         return self.logged_in, data
 
     def logout(self):
-        r = requests.post(self.address + '/api/logout', {'token': self.user_token})
+        r = self._session.post(self.address + '/api/logout', {'token': self.user_token})
+        getLogger('finprint').debug('Server connections: {0}'.format(self.connection_stats()))
+        getLogger('finprint').debug('Response cache: {0}'.format(self.cache_stats()))
         self.logged_in = not r.status_code == 200
         return not self.logged_in
 
     def set_list(self, **kwargs):
-        params = {'token': self.user_token}
+        sets = []
+        for page in self.iter_set_list(**kwargs):
+            sets.extend(page)
+        return {'sets': sets}
+
+    def iter_set_list(self, page_size=None, **kwargs):
+        '''
+        The set list a page at a time, as lists of sets; the next page is requested as
+        soon as one arrives, so it's usually there by the time it's wanted. Servers that
+        don't page the list send all of it as the first page.
+        '''
+        params = {'token': self.user_token,
+                  'page_size': page_size or _config_int('set_list_page_size', DEFAULT_SET_PAGE_SIZE)}
         params.update(kwargs)
-        r = requests.get(self.address + '/api/set', params=params)
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            pending = prefetch.submit(self._set_list_page, params, 1)
+            while pending is not None:
+                data = pending.result()
+                next_page = data.get('next_page')
+                pending = prefetch.submit(self._set_list_page, params, next_page) if next_page else None
+                yield data['sets']
+
+    def _set_list_page(self, params, page):
+        r = self._session.get(self.address + '/api/set', params=dict(params, page=page))
+        if r.status_code != 200:
+            raise QueryException('Failed to get the set list: status {0}'.format(r.status_code))
         return r.json()
 
     def trip_list(self):
-        r = requests.get(self.address + '/api/trip', params={'token': self.user_token, 'assigned': True})
-        return r.json()
+        return self._cached_get('/api/trip', assigned=True)
 
     def annotator_list(self):
-        r = requests.get(self.address + '/api/annotator', params={'token': self.user_token})
-        return r.json()
+        return self._cached_get('/api/annotator')
 
     def set_detail(self, set_id):
-        r = requests.get(self.address + '/api/set/{0}'.format(set_id), params={'token': self.user_token})
+        r = self._session.get(self.address + '/api/set/{0}'.format(set_id), params={'token': self.user_token})
         return r.json()
 
+    def _set_status_changed(self, set_id):
+        # trip and reef/set dropdowns are built from the sets
+        self.invalidate_cache('/api/trip')
+        self.invalidate_cache('/api/restrict_filter_dropdown')
+        dispatcher.send(SET_STATUS_CHANGED, sender=self, value=set_id)
+
     def mark_set_done(self, set_id):
-        r = requests.post(self.address + '/api/set/{0}/done'.format(set_id), {'token': self.user_token})
+        r = self._session.post(self.address + '/api/set/{0}/done'.format(set_id), {'token': self.user_token})
+        self._set_status_changed(set_id)
         return r.status_code == 200
 
     def mark_set_approved(self, set_id):
-        r = requests.post(self.address + '/api/set/{0}/accept'.format(set_id), {'token': self.user_token})
+        r = self._session.post(self.address + '/api/set/{0}/accept'.format(set_id), {'token': self.user_token})
+        self._set_status_changed(set_id)
         return r.status_code == 200
 
     def mark_set_rejected(self, set_id):
-        r = requests.post(self.address + '/api/set/{0}/reject'.format(set_id), {'token': self.user_token})
+        r = self._session.post(self.address + '/api/set/{0}/reject'.format(set_id), {'token': self.user_token})
+        self._set_status_changed(set_id)
         return r.status_code == 200
 
     def update_progress(self, set_id, progress):
-        r = requests.post(self.address + '/api/set/{0}/progress'.format(set_id),
+        r = self._session.post(self.address + '/api/set/{0}/progress'.format(set_id),
                           {'token': self.user_token, 'progress': int(progress)})
         return r.status_code == 200
 
     def observations(self, set_id):
-        r = requests.get(self.address + '/api/set/{0}/obs'.format(set_id), params={'token': self.user_token})
+        r = self._session.get(self.address + '/api/set/{0}/obs'.format(set_id), params={'token': self.user_token})
         return r.json()
 
     def add_observation(self, set_id, **kwargs):
         data = kwargs  # TODO make sure first event stuff is in here
         data['token'] = self.user_token
-        r = requests.post(self.address + '/api/set/{0}/obs'.format(set_id), data=data)
+        r = self._session.post(self.address + '/api/set/{0}/obs'.format(set_id), data=data, params=DELTA)
         if r.status_code == 200:
             return r.json()
         else:
@@ -109,7 +288,7 @@ class GlobalFinPrintServer(Singleton):
     def edit_observation(self, set_id, obs_id, **kwargs):
         data = kwargs  # TODO make sure event stuff ISNT here
         data['token'] = self.user_token
-        r = requests.post(self.address + '/api/set/{0}/obs/{1}'.format(set_id, obs_id), data)
+        r = self._session.post(self.address + '/api/set/{0}/obs/{1}'.format(set_id, obs_id), data, params=DELTA)
         if r.status_code == 200:
             return r.json()
         else:
@@ -117,7 +296,8 @@ class GlobalFinPrintServer(Singleton):
 
     def delete_observation(self, set_id, obs_id):
         params = {'obs_id': obs_id, 'token': self.user_token}
-        r = requests.delete(self.address + '/api/set/{0}/obs'.format(set_id), params=params)
+        params.update(DELTA)
+        r = self._session.delete(self.address + '/api/set/{0}/obs'.format(set_id), params=params)
         if r.status_code == 200:
             return r.json()
         else:
@@ -126,7 +306,8 @@ class GlobalFinPrintServer(Singleton):
     def add_event(self, set_id, obs_id, **kwargs):
         params = {'token': self.user_token}
         params.update(kwargs)  # TODO filter out non-event stuff?
-        r = requests.post(self.address + '/api/set/{0}/obs/{1}/event'.format(set_id, obs_id), params)
+        r = self._session.post(self.address + '/api/set/{0}/obs/{1}/event'.format(set_id, obs_id), params,
+                               params=DELTA)
         if r.status_code == 200:
             return r.json()
         else:
@@ -135,7 +316,8 @@ class GlobalFinPrintServer(Singleton):
     def edit_event(self, set_id, obs_id, evt_id, **kwargs):
         params = {'token': self.user_token}
         params.update(kwargs)  # TODO filter out non-event stuff?
-        r = requests.post(self.address + '/api/set/{0}/obs/{1}/event/{2}'.format(set_id, obs_id, evt_id), params)
+        r = self._session.post(self.address + '/api/set/{0}/obs/{1}/event/{2}'.format(set_id, obs_id, evt_id), params,
+                               params=DELTA)
         if r.status_code == 200:
             return r.json()
         else:
@@ -143,28 +325,41 @@ class GlobalFinPrintServer(Singleton):
 
     def delete_event(self, set_id, obs_id, evt_id):
         params = {'token': self.user_token, 'evt_id': evt_id}
-        r = requests.delete(self.address + '/api/set/{0}/obs/{1}/event'.format(set_id, obs_id), params=params)
+        params.update(DELTA)
+        r = self._session.delete(self.address + '/api/set/{0}/obs/{1}/event'.format(set_id, obs_id), params=params)
         if r.status_code == 200:
             return r.json()
         else:
             raise QueryException('Failed to delete event: status {0}'.format(r.status_code))
 
-    def attributes(self, set_id):
-        params = {'token': self.user_token}
-        r = requests.get(self.address + '/api/set/{0}/attributes'.format(set_id), params)
+    def bulk_mutate(self, set_id, ops):
+        '''
+        Several observation/event changes in one request. ops is a list of
+        {'op': 'edit_event', 'obs_id': ..., 'evt_id': ..., 'values': {...}}; they're
+        applied in order and answered like a single change. Raises QueryException if
+        the server refused one of the changes, and BulkUnsupported for any other
+        failure, as a server without the endpoint can answer in all sorts of ways.
+        '''
+        data = {'token': self.user_token, 'ops': ops}
+        data.update(DELTA)
+        r = self._session.post(self.address + '/api/set/{0}/obs/bulk'.format(set_id), json=data)
         if r.status_code == 200:
-            return r.json()['attributes']
+            return r.json()
+        elif r.status_code in (400, 422):
+            raise QueryException('Failed to apply changes: status {0}'.format(r.status_code))
         else:
-            raise QueryException('Failed to get attributes: status {0}'.format(r.status_code))
+            raise BulkUnsupported('No bulk endpoint: status {0}'.format(r.status_code))
+
+    def attributes(self, set_id):
+        return self._cached_get('/api/set/{0}/attributes'.format(set_id))['attributes']
 
     def animals(self, set_id):
-        r = requests.get(self.address + '/api/set/{0}/animals'.format(set_id), params={'token': self.user_token})
+        r = self._session.get(self.address + '/api/set/{0}/animals'.format(set_id), params={'token': self.user_token})
         return r.json
 
     def affiliation_list(self):
-        r = requests.get(self.address + '/api/affiliations', params={'token': self.user_token})
-        return r
+        # not necessarily JSON; the server sends a python dict literal
+        return self._cached_get('/api/affiliations', parse=ast.literal_eval)
 
     def reef_set_list(self, trip_id=None, reef_id=None):
-        r = requests.get(self.address + '/api/restrict_filter_dropdown', params={'token': self.user_token,'trip_id':trip_id,'reef_id':reef_id})
-        return r.json()
\ No newline at end of file
+        return self._cached_get('/api/restrict_filter_dropdown', trip_id=trip_id, reef_id=reef_id)
\ No newline at end of file
@@ -0,0 +1,537 @@
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+import requests
+from PyQt4.QtCore import *
+from config import global_config
+from .global_finprint_server import GlobalFinPrintServer, QueryException, BulkUnsupported, DEFAULT_POOL_SIZE
+
+
+DEFAULT_JOURNAL_FILE = './journal.jsonl'
+SYNC_INTERVAL = 0.05  # seconds; appended records are fsynced together at most this often
+RETRY_BASE = 2  # seconds
+RETRY_MAX = 120
+MAX_REJECTIONS = 3
+# edits and deletes made within this long of each other are sent together
+BATCH_WINDOW = 0.25  # seconds
+MAX_BATCH = 50
+BATCHABLE = ('edit_observation', 'edit_event', 'delete_observation', 'delete_event')
+
+
+class JournalOp(object):
+    '''
+    One recorded mutation. ids are the observation/event it applies to, and temp the
+    temporary ids of what it creates; both may be temporary (negative) ids that are
+    only mapped to server ids when the op, or the one that created them, is replayed.
+    user_id is who made the change; it is only ever sent with their login.
+    '''
+    def __init__(self, seq, op, set_id, ids=None, values=None, temp=None, user_id=None):
+        self.seq = seq
+        self.op = op
+        self.set_id = set_id
+        self.user_id = user_id
+        self.ids = ids or {}
+        self.values = values or {}
+        self.temp = temp or {}
+        self.attempts = 0
+        self.maybe_sent = False
+        self.solo = False
+        self.submitted = time.time()
+
+    def args(self, resolve):
+        args = [self.set_id]
+        for kind in ('obs', 'event'):
+            if kind in self.ids:
+                args.append(resolve(self.ids[kind]))
+        return args
+
+    def refers_to(self, ids):
+        return any(i in ids for i in self.ids.values())
+
+    def to_dict(self):
+        return {'seq': self.seq, 'op': self.op, 'set_id': self.set_id, 'user_id': self.user_id,
+                'ids': self.ids, 'values': self.values, 'temp': self.temp}
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(value['seq'], value['op'], value['set_id'], value['ids'], value['values'], value['temp'],
+                   value.get('user_id'))
+
+    def belongs_to(self, user_id):
+        # changes journalled before owners were recorded go with whoever logs in next
+        return self.user_id is None or self.user_id == user_id
+
+
+class _Change(object):
+    ''' one request's worth of a batch: a change and the journal ops folded into it '''
+    def __init__(self, op, ids, values, ops):
+        self.op = op
+        self.ids = ids
+        self.values = values
+        self.ops = ops
+
+    def target(self):
+        kind = 'event' if self.op.endswith('event') else 'obs'
+        return kind, self.ids[kind]
+
+    def args(self, set_id):
+        return [set_id] + [self.ids[k] for k in ('obs', 'event') if k in self.ids]
+
+    def to_bulk(self):
+        change = {'op': self.op, 'obs_id': self.ids['obs'], 'values': self.values}
+        if 'event' in self.ids:
+            change['evt_id'] = self.ids['event']
+        return change
+
+
+def _combine(responses):
+    ''' one delta out of several, or None if any of them is a full list '''
+    if not all(r.get('delta') for r in responses):
+        return None
+    observations = OrderedDict()
+    deleted = set()
+    for r in responses:
+        for o in r.get('observations', []):
+            observations[o['id']] = o
+        deleted.update(r.get('deleted_observations', []))
+    for id in deleted:
+        observations.pop(id, None)
+    return {'delta': True, 'observations': list(observations.values()),
+            'deleted_observations': sorted(deleted)}
+
+
+def _ids_of(json):
+    obs_ids, event_ids = set(), set()
+    for o in json.get('observations', []):
+        obs_ids.add(o['id'])
+        event_ids.update(e['id'] for e in o['events'])
+    return obs_ids, event_ids
+
+
+class Journal(QObject):
+    '''
+    Append-only record of observation and event changes. Each change is written to the
+    journal file and applied to the Set straight away; a background thread then sends
+    the changes to the server one at a time, in the order they were made, retrying for
+    as long as the server can't be reached. Records are fsynced in batches, so saving
+    an observation never waits on the disk or the network. Whatever hasn't reached the
+    server when the annotator closes is sent after the next login.
+
+    Edits and deletes that follow each other closely are coalesced and sent as one bulk
+    request, or as concurrent requests (one per observation, so each observation's
+    changes stay in order) when the server has no bulk endpoint. Changes ask the
+    server for just the observations they touched rather than the whole list.
+
+    Each change is sent only while the user who made it is logged in; anyone else's
+    stay in the journal until they next log in.
+
+    Observations and events created locally get temporary negative ids. When the server
+    accepts one, its id is picked out of the response and every later change that
+    refers to the temporary id is sent with the real one.
+    '''
+    INSTANCE = None
+
+    # ops, server response, {temp id: server id}, {op seq: capture filename}
+    applied = pyqtSignal(object, object, object, object)
+    rejected = pyqtSignal(object, object)  # op, exception
+    pendingChanged = pyqtSignal(int)
+    offlineChanged = pyqtSignal(bool)
+
+    def __init__(self, path=None, server=None):
+        super().__init__()
+        self.path = path or global_config.get('GLOBAL_FINPRINT_SERVER', 'journal') or DEFAULT_JOURNAL_FILE
+        self._server = server or GlobalFinPrintServer()
+        self._cond = threading.Condition()
+        self._ops = []
+        self._id_map = {}
+        self._seq = 0
+        self._next_temp = -1
+        self._callbacks = {}
+        self._sets = weakref.WeakValueDictionary()
+        self._baseline = {}
+        self._retry_at = 0
+        self._failures = 0
+        self._offline = False
+        self._dirty = False
+        self._bulk = None  # whether the server has a bulk endpoint; None until we know
+        self._pipeline = ThreadPoolExecutor(max_workers=DEFAULT_POOL_SIZE)
+
+        self._load()
+        self._file = open(self.path, 'a')
+        self.applied.connect(self._on_applied)
+        self.rejected.connect(self._on_rejected)
+
+        threading.Thread(target=self._sync, daemon=True).start()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = Journal()
+        return cls.INSTANCE
+
+    def pending(self):
+        return len(self._mine())
+
+    def pending_for(self, set_id):
+        with self._cond:
+            return [op for op in self._mine() if op.set_id == set_id]
+
+    def _mine(self):
+        ''' the changes the logged in user made, in order '''
+        if not self._server.logged_in:
+            return []
+        return [op for op in self._ops if op.belongs_to(self._server.user_id)]
+
+    def is_offline(self):
+        return self._offline
+
+    def temp_id(self):
+        with self._cond:
+            temp = self._next_temp
+            self._next_temp -= 1
+            return temp
+
+    def resolve(self, id):
+        ''' server id for a temporary id once it's known; any other id unchanged '''
+        return self._id_map.get(id, id)
+
+    def attach(self, set):
+        ''' have set follow the results of its changes as they are replayed '''
+        self._sets[set.id] = set
+
+    def submit(self, op, set_id, ids=None, values=None, temp=None, on_done=None, on_error=None):
+        with self._cond:
+            self._seq += 1
+            journal_op = JournalOp(self._seq, op, set_id, ids, values, temp, self._server.user_id)
+            self._append(journal_op.to_dict())
+            self._ops.append(journal_op)
+            if on_done is not None or on_error is not None:
+                self._callbacks[journal_op.seq] = (on_done, on_error)
+            self._cond.notify_all()
+        self.pendingChanged.emit(self.pending())
+        return journal_op
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, default=str) + '\n')
+        self._file.flush()
+        self._dirty = True
+
+    def _sync(self):
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            with self._cond:
+                if not self._dirty:
+                    continue
+                self._dirty = False
+                try:
+                    os.fsync(self._file.fileno())
+                except OSError as e:
+                    getLogger('finprint').error('Unable to sync journal: {0}'.format(e))
+
+    def _load(self):
+        ops = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the tail of a write that never finished
+                        getLogger('finprint').warning('Skipping damaged journal record')
+                        continue
+                    if 'op' in record:
+                        op = JournalOp.from_dict(record)
+                        ops[op.seq] = op
+                        self._seq = max(self._seq, op.seq)
+                    elif 'drop' in record:
+                        ops.pop(record['drop'], None)
+                    else:
+                        ops.pop(record.get('ack'), None)
+                        self._id_map.update((int(k), v) for k, v in record.get('ids', {}).items())
+        self._ops = [ops[seq] for seq in sorted(ops)]
+        # new temporary ids must not collide with any still mapped or referred to, whether or
+        # not the op that created them is still in the file
+        used = list(self._id_map)
+        for op in self._ops:
+            used.extend(op.temp.values())
+            used.extend(op.ids.values())
+            used.append(op.values.get('id'))
+        self._next_temp = min([-1] + [i - 1 for i in used if isinstance(i, int) and i < 0])
+        if self._ops:
+            getLogger('finprint').info('{0} change(s) still to send to the server'.format(len(self._ops)))
+        self._compact()
+
+    def _compact(self):
+        ''' rewrite the journal with just the pending changes and the ids they need '''
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            if self._ops and self._id_map:
+                f.write(json.dumps({'ids': self._id_map}) + '\n')
+            for op in self._ops:
+                f.write(json.dumps(op.to_dict(), default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def _set_offline(self, offline):
+        if offline != self._offline:
+            self._offline = offline
+            self.offlineChanged.emit(offline)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                mine = self._mine()
+                while not (mine and time.time() >= self._retry_at):
+                    self._cond.wait(max(0.5, min(self._retry_at - time.time(), 5)))
+                    mine = self._mine()
+                op = mine[0]
+                if op.op in BATCHABLE and not op.solo:
+                    # give the changes that come right after this one a chance to go with it
+                    delay = op.submitted + BATCH_WINDOW - time.time()
+                    if delay > 0:
+                        self._cond.wait(delay)
+                        continue
+                    batch = self._take_batch(mine)
+                else:
+                    batch = [op]
+
+            try:
+                if len(batch) == 1:
+                    result, created, filenames = self._send(op)
+                    done = batch
+                else:
+                    done, result, filenames, error = self._send_batch(batch)
+                    created = {}
+                    if error is not None:
+                        if done:
+                            self._acknowledge(done, result, created, filenames)
+                        raise error
+            except requests.RequestException as e:
+                getLogger('finprint').warning('Server unreachable, will retry: {0}'.format(e))
+                op.maybe_sent = True
+                self._backoff()
+                self._set_offline(True)
+                continue
+            except Exception as e:
+                getLogger('finprint').exception('Server refused {0} (attempt {1})'.format(op.op, op.attempts + 1))
+                if len(batch) > 1:
+                    # send them one at a time to find the one the server objects to
+                    for b in batch:
+                        b.solo = True
+                    continue
+                op.attempts += 1
+                if op.attempts < MAX_REJECTIONS:
+                    self._backoff()
+                    continue
+                self._drop(op)
+                self.rejected.emit(op, e)
+                continue
+
+            self._acknowledge(done, result, created, filenames)
+
+    def _acknowledge(self, ops, result, created, filenames):
+        self._failures = 0
+        self._set_offline(False)
+        with self._cond:
+            self._id_map.update(created)
+            for op in ops:
+                self._append({'ack': op.seq, 'ids': created})
+                self._ops.remove(op)
+            if not self._ops:
+                self._file.close()
+                self._compact()
+                self._file = open(self.path, 'a')
+        self.applied.emit(ops, result, created, filenames)
+        self.pendingChanged.emit(self.pending())
+
+    def _backoff(self):
+        self._retry_at = time.time() + min(RETRY_MAX, RETRY_BASE * 2 ** self._failures)
+        self._failures += 1
+
+    def _drop(self, op):
+        ''' give up on op, and on the later changes to anything it would have created '''
+        with self._cond:
+            dropped = [op]
+            created = set(op.temp.values())
+            for later in self._ops:
+                if later is not op and later.refers_to(created):
+                    dropped.append(later)
+                    created.update(later.temp.values())
+            for d in dropped:
+                self._ops.remove(d)
+                self._append({'drop': d.seq})
+        for d in dropped[1:]:
+            self.rejected.emit(d, QueryException('{0} depends on a change the server refused'.format(d.op)))
+        self.pendingChanged.emit(self.pending())
+
+    def _take_batch(self, ops):
+        ''' the edits and deletes at the head of ops that can go to the server together '''
+        first = ops[0]
+        batch = []
+        for op in ops[:MAX_BATCH]:
+            if op.op not in BATCHABLE or op.solo or op.set_id != first.set_id:
+                break
+            batch.append(op)
+        return batch
+
+    def _coalesce(self, batch):
+        '''
+        The changes in batch with repeated edits of the same observation or event folded
+        into one, and edits of something that is then deleted left out
+        '''
+        changes = []
+        latest = {}
+        for op in batch:
+            kind = 'event' if op.op.endswith('event') else 'obs'
+            ids = dict((k, self.resolve(v)) for k, v in op.ids.items())
+            target = (kind, ids[kind])
+            prev = latest.get(target)
+            if op.op.startswith('edit') and prev is not None and prev.op == op.op:
+                prev.values.update(self._values(op))
+                prev.ops.append(op)
+                continue
+            change = _Change(op.op, ids, self._values(op), [op])
+            if op.op.startswith('delete'):
+                gone = [c for c in changes if c.op.startswith('edit') and
+                        (c.target() == target or (kind == 'obs' and c.ids['obs'] == ids['obs']))]
+                for c in gone:
+                    changes.remove(c)
+                    change.ops[:0] = c.ops
+            changes.append(change)
+            latest[target] = change
+        return changes
+
+    def _values(self, op):
+        values = dict(op.values)
+        if 'id' in values:
+            values['id'] = self.resolve(values['id'])
+        return values
+
+    def _send_batch(self, batch):
+        '''
+        Send a batch of edits and deletes as one bulk request or, if the server has no
+        bulk endpoint, as concurrent requests, one per observation. Returns the ops that
+        the server applied, its answer, any capture filenames and the error that stopped
+        the rest, if any.
+        '''
+        set_id = batch[0].set_id
+        changes = self._coalesce(batch)
+        if len(changes) > 1 and self._bulk is not False:
+            try:
+                result = self._server.bulk_mutate(set_id, [c.to_bulk() for c in changes])
+            except BulkUnsupported:
+                getLogger('finprint').info('No bulk endpoint on the server; sending changes concurrently')
+                self._bulk = False
+            else:
+                self._bulk = True
+                self._update_baseline(set_id, result)
+                filenames = {}
+                for change, r in zip(changes, result.get('results', [])):
+                    if r and r.get('filename'):
+                        filenames.update((op.seq, r['filename']) for op in change.ops)
+                return batch, result, filenames, None
+
+        groups = OrderedDict()
+        for change in changes:
+            groups.setdefault(change.ids['obs'], []).append(change)
+
+        def _send_group(group):
+            sent = []
+            for change in group:
+                response = getattr(self._server, change.op)(*change.args(set_id), **change.values)
+                sent.append((change, response))
+            return sent
+
+        done, responses, filenames, error = [], [], {}, None
+        futures = [self._pipeline.submit(_send_group, g) for g in groups.values()]
+        for future in futures:
+            try:
+                sent = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            for change, response in sent:
+                done.extend(change.ops)
+                responses.append(response)
+                if response.get('filename'):
+                    filenames.update((op.seq, response['filename']) for op in change.ops)
+        # in the order they were made, so an ack never overtakes the change before it
+        done.sort(key=lambda op: op.seq)
+        if not responses:
+            return [], None, {}, error
+        result = responses[0] if len(responses) == 1 else _combine(responses)
+        if result is None:
+            # full lists answered concurrently can each miss the others' changes
+            result = self._server.observations(set_id)
+        self._update_baseline(set_id, result)
+        return done, result, filenames, error
+
+    def _send(self, op):
+        if op.temp and op.set_id not in self._baseline:
+            self._baseline[op.set_id] = _ids_of(self._server.observations(op.set_id))
+
+        if op.temp and op.maybe_sent:
+            # the last attempt may have got through before the connection dropped
+            current = self._server.observations(op.set_id)
+            created = self._created(op, current)
+            if created:
+                self._update_baseline(op.set_id, current)
+                return current, created, {}
+
+        result = getattr(self._server, op.op)(*op.args(self.resolve), **self._values(op))
+        created = self._created(op, result) if op.temp else {}
+        self._update_baseline(op.set_id, result)
+        return result, created, {op.seq: result.get('filename')}
+
+    def _update_baseline(self, set_id, json):
+        obs_ids, event_ids = _ids_of(json)
+        if json.get('delta') and set_id in self._baseline:
+            known_obs, known_events = self._baseline[set_id]
+            obs_ids = (known_obs | obs_ids) - set(json.get('deleted_observations', []))
+            event_ids = known_events | event_ids
+        self._baseline[set_id] = (obs_ids, event_ids)
+
+    def _created(self, op, result):
+        ''' {temp id: server id} for what op created, found by diffing against the last response '''
+        known_obs, known_events = self._baseline.get(op.set_id, (set(), set()))
+        event_time = op.values.get('event_time')
+        if op.op == 'add_observation':
+            candidates = [o for o in result.get('observations', []) if o['id'] not in known_obs]
+        else:
+            obs_id = self.resolve(op.ids['obs'])
+            candidates = [o for o in result.get('observations', []) if o['id'] == obs_id]
+        for o in reversed(candidates):
+            events = [e for e in o['events'] if e['id'] not in known_events]
+            matching = [e for e in events if e['event_time'] == event_time] or events
+            if not matching:
+                continue
+            created = {op.temp['event']: matching[-1]['id']}
+            if 'obs' in op.temp:
+                created[op.temp['obs']] = o['id']
+            return created
+        return {}
+
+    def _on_applied(self, ops, result, created, filenames):
+        set = self._sets.get(ops[0].set_id)
+        if set is not None:
+            set.on_replayed(ops, result, created)
+        for op in ops:
+            on_done, _ = self._callbacks.pop(op.seq, (None, None))
+            if on_done is not None:
+                on_done(filenames.get(op.seq))
+
+    def _on_rejected(self, op, error):
+        set = self._sets.get(op.set_id)
+        if set is not None:
+            set.on_rejected(op)
+        _, on_error = self._callbacks.pop(op.seq, (None, None))
+        if on_error is not None:
+            on_error(error)
@@ -11,43 +11,101 @@ def convert_position(pos):
     return "{0:02}:{1:02}:{2:03}".format(h, s, m)
 
 
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
 class Event(object):
+    # a large set has tens of thousands of events, so no per-instance __dict__
+    __slots__ = ('_source', 'id', 'event_time', 'attribute', 'note', 'extent', 'observation', '_created',
+                 '_create_datetime', 'max_n', 'first_flag', 'obs_color')
+
     def __init__(self):
+        self._source = None
         self.id = None
         self.event_time = None
-        self.attribute = []
+        self.attribute = ()
         self.note = None
         self.extent = Extent()
         self.observation = None
-        self.create_datetime = None
+        self._created = ''
+        self._create_datetime = None
         self.max_n = None
+        # set by the observation table: the row that heads its observation, and its color
+        self.first_flag = False
+        self.obs_color = None
+
+    @property
+    def create_datetime(self):
+        # most events never need theirs, so it's only parsed when asked for
+        if self._create_datetime is None and self._created:
+            self._create_datetime = datetime.strptime(self._created, DATETIME_FORMAT)
+        return self._create_datetime
+
+    @create_datetime.setter
+    def create_datetime(self, value):
+        self._create_datetime = value
+        self._created = value.strftime(DATETIME_FORMAT) if value is not None else ''
+
+    def created_key(self):
+        ''' sorts the same as create_datetime, without parsing it '''
+        return self._created
 
     def load(self, evt_dict, obs):
+        self._source = evt_dict
         self.id = evt_dict['id']
         self.event_time = evt_dict['event_time']
-        self.attribute = evt_dict['attribute']
+        self.attribute = tuple(evt_dict['attribute'])
         # adding new column in observation table
-        if 'measurables' in evt_dict and evt_dict['measurables']:
-            self.flag = True
-            for measurable in evt_dict['measurables'] :
-                if self.flag and measurable['measurable_name'] == 'MaxN' :
-                    self.max_n = measurable['value']
-                    self.flag = False
-
-        else :
-            self.max_n=''
+        self.max_n = ''
+        for measurable in evt_dict.get('measurables') or ():
+            if measurable['measurable_name'] == 'MaxN':
+                self.max_n = measurable['value']
+                break
 
         self.note = evt_dict['note']
+        self.extent = Extent()
         if 'extent' in evt_dict:
             self.extent.from_wkt(evt_dict['extent'])
-        self.create_datetime = datetime.strptime(evt_dict['create_datetime'], '%Y-%m-%d %H:%M:%S')
+        self._created = evt_dict['create_datetime']
+        self._create_datetime = None
         self.observation = obs
 
+    def apply_values(self, values, attributes):
+        '''
+        Apply the values of a change that hasn't reached the server yet. attributes maps
+        attribute ids to the attributes they stand for.
+        '''
+        # so the next server copy is loaded whether or not it matches the last one
+        self._source = None
+        if 'event_time' in values:
+            self.event_time = values['event_time']
+            if self.observation is not None:
+                self.observation.event_moved(self)
+        if 'note' in values:
+            self.note = values['note']
+        if values.get('attribute') is not None:
+            self.attribute = tuple(attributes[a] for a in values['attribute'] if a in attributes)
+        if 'extent' in values:
+            self.extent = Extent()
+            self.extent.from_wkt(values['extent'])
+        if values.get('measurables'):
+            self.max_n = values['measurables'][0]
+
+    def merge(self, evt_dict):
+        '''
+        Reload from the server representation only if it differs from what we loaded last.
+        Returns True if the event changed.
+        '''
+        if evt_dict == self._source:
+            return False
+        self.load(evt_dict, self.observation)
+        return True
+
     def to_dict(self):
         return {
             'id': self.id,
             'event_time': self.event_time,
-            'attribute': self.attribute,
+            'attribute': list(self.attribute),
             'note': self.note,
             'extent': self.extent.to_wkt(),
             'max_n': self.max_n
@@ -84,7 +142,11 @@ class Event(object):
 
 
 class Observation(object):
+    __slots__ = ('_fields', 'id', 'animal_id', 'behavior_id', 'comment', 'duration', 'animal', 'type_choice',
+                 '_events', '_first', '_by_time')
+
     def __init__(self):
+        self._fields = None
         self.id = None
         self.animal_id = None
         self.behavior_id = None
@@ -92,22 +154,115 @@ class Observation(object):
         self.duration = 0
         self.animal = Animal()
         self.type_choice = 'A'
-        self.events = []
+        self._events = []
+        # the first event created and the events in time order, worked out when first
+        # asked for and then kept up to date as events come and go
+        self._first = None
+        self._by_time = None
+
+    @property
+    def events(self):
+        ''' the events in the order they were loaded; change them with add_event and remove_event '''
+        return self._events
+
+    @events.setter
+    def events(self, events):
+        self._events = list(events)
+        self._first = None
+        self._by_time = None
+
+    def add_event(self, evt):
+        self._events.append(evt)
+        if self._first is not None and evt.created_key() < self._first.created_key():
+            self._first = evt
+        if self._by_time is not None:
+            # new events are nearly always the latest, so look from the end
+            i = len(self._by_time)
+            while i and self._by_time[i - 1].event_time > evt.event_time:
+                i -= 1
+            self._by_time.insert(i, evt)
+
+    def remove_event(self, evt):
+        self._events.remove(evt)
+        if evt is self._first:
+            self._first = None
+        if self._by_time is not None:
+            self._by_time.remove(evt)
+
+    def event_moved(self, evt):
+        ''' evt's event_time changed '''
+        self._by_time = None
+
+    def first_event(self):
+        ''' the event that started the observation '''
+        if self._first is None and self._events:
+            self._first = min(self._events, key=Event.created_key)
+        return self._first
+
+    def events_by_time(self):
+        if self._by_time is None:
+            self._by_time = sorted(self._events, key=lambda e: e.event_time)
+        return self._by_time
 
     def initial_time(self):
-        return sorted(self.events, key=lambda x: x.create_datetime)[0].event_time
+        return self.first_event().event_time
 
     def load(self, obs_dict):
+        self._load_fields(obs_dict)
+        events = []
+        for e in obs_dict['events']:
+            evt = Event()
+            evt.load(e, self)
+            events.append(evt)
+        self.events = events
+
+    def apply_values(self, values):
+        ''' apply the values of a change that hasn't reached the server yet '''
+        self._fields = None
+        if 'type_choice' in values:
+            self.type_choice = values['type_choice']
+        if 'comment' in values:
+            self.comment = values['comment']
+        if 'duration' in values:
+            self.duration = values['duration']
+        if 'animal_id' in values:
+            self.animal_id = values['animal_id'] if self.type_choice == 'A' else None
+
+    def _load_fields(self, obs_dict):
+        self._fields = dict((k, v) for k, v in obs_dict.items() if k != 'events')
         self.type_choice = obs_dict['type_choice']
         self.id = obs_dict['id']
         self.comment = obs_dict['comment']
         self.duration = obs_dict['duration']
+        self.animal_id = obs_dict['animal_id'] if self.type_choice == 'A' else None
+
+    def merge(self, obs_dict, changes):
+        '''
+        Update in place from the server representation, keeping the Event objects whose
+        data hasn't changed. Differences are recorded on the given ChangeSet.
+        Returns True if the observation's own fields changed.
+        '''
+        fields_changed = dict((k, v) for k, v in obs_dict.items() if k != 'events') != self._fields
+        if fields_changed:
+            self._load_fields(obs_dict)
+            changes.updated_observations.add(self.id)
+
+        current = dict((e.id, e) for e in self.events)
+        events = []
         for e in obs_dict['events']:
-            evt = Event()
-            evt.load(e, self)
-            self.events.append(evt)
-        if self.type_choice == 'A':
-            self.animal_id = obs_dict['animal_id']
+            evt = current.pop(e['id'], None)
+            if evt is None:
+                evt = Event()
+                evt.load(e, self)
+                changes.added_events.add(evt.id)
+            elif evt.merge(e):
+                changes.updated_events.add(evt.id)
+            events.append(evt)
+        # events created locally stay until the server has them
+        events.extend(e for e in current.values() if e.id < 0)
+        changes.removed_events.update(id for id in current if id >= 0)
+        self.events = events
+        return fields_changed
 
     def to_dict(self):
         return {'id': self.id,
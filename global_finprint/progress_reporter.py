@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+from logging import getLogger
+from PyQt4.QtCore import *
+from config import global_config
+from .global_finprint_server import GlobalFinPrintServer, _config_int
+from .journal import MAX_REJECTIONS
+
+
+DEFAULT_PROGRESS_FILE = './progress.json'
+DEFAULT_INTERVAL = 30  # seconds between reports to the server
+SHUTDOWN_TIMEOUT = 5  # seconds
+
+
+class ProgressReporter(QObject):
+    '''
+    Reports how far annotators have got through each set. Progress only ever moves
+    forward: each report raises a per-set high-water mark, and a background thread
+    sends the latest mark at most once per interval, or straight away when flushed
+    (switching sets, submitting, quitting). Marks the server hasn't confirmed are kept
+    in a local file, so progress made before a crash is reported on the next start.
+    Each mark is only sent while the annotator who made it is logged in, and is given
+    up on once the server has refused it MAX_REJECTIONS times.
+    '''
+    INSTANCE = None
+
+    def __init__(self, path=None, server=None, interval=None):
+        super().__init__()
+        self.path = path or global_config.get('GLOBAL_FINPRINT_SERVER', 'progress_file') or DEFAULT_PROGRESS_FILE
+        self.interval = interval or _config_int('progress_interval', DEFAULT_INTERVAL)
+        self._server = server or GlobalFinPrintServer()
+        self._cond = threading.Condition()
+        # {set id: {'user_id': ..., 'progress': ...}}
+        self._pending = {}
+        self._sent = {}
+        self._rejections = {}
+        self._last_flush = 0
+        self._flush_requested = False
+        self._load()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = ProgressReporter()
+        return cls.INSTANCE
+
+    def report(self, set_id, progress):
+        progress = int(progress)
+        with self._cond:
+            if progress <= max(self._progress(set_id), self._sent.get(set_id, 0)):
+                return
+            self._pending[set_id] = {'user_id': self._server.user_id, 'progress': progress}
+            self._save()
+            self._cond.notify_all()
+
+    def flush(self, wait=False, timeout=SHUTDOWN_TIMEOUT):
+        '''
+        Send whatever is pending now rather than at the next interval. With wait, block
+        until it has been sent or timeout seconds have passed; returns whether it was sent.
+        '''
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            if wait:
+                deadline = time.time() + timeout
+                while self._mine() and time.time() < deadline:
+                    self._cond.wait(deadline - time.time())
+            return not self._mine()
+
+    def _progress(self, set_id):
+        return self._pending.get(set_id, {}).get('progress', 0)
+
+    def _mine(self):
+        ''' {set id: progress} for the marks the logged in annotator made '''
+        if not self._server.logged_in:
+            return {}
+        # marks saved before annotators were recorded go with whoever logs in next
+        return dict((set_id, p['progress']) for set_id, p in self._pending.items()
+                    if p['user_id'] in (None, self._server.user_id))
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._pending = dict((int(k), v if isinstance(v, dict) else {'user_id': None, 'progress': v})
+                                     for k, v in json.load(f).items())
+        except (OSError, ValueError):
+            self._pending = {}
+        if self._pending:
+            getLogger('finprint').info('Progress still to report for {0} set(s)'.format(len(self._pending)))
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self._pending, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            getLogger('finprint').error('Unable to save progress: {0}'.format(e))
+
+    def _due(self):
+        if not self._mine():
+            return False
+        return self._flush_requested or time.time() - self._last_flush >= self.interval
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    self._cond.wait(1)
+                self._flush_requested = False
+                self._last_flush = time.time()
+                pending = self._mine()
+
+            for set_id, progress in pending.items():
+                try:
+                    ok = self._server.update_progress(set_id, progress)
+                except Exception:
+                    # unreachable; try again at the next interval
+                    getLogger('finprint').exception('Unable to report progress for set {0}'.format(set_id))
+                    continue
+                with self._cond:
+                    if ok:
+                        self._sent[set_id] = max(progress, self._sent.get(set_id, 0))
+                        self._rejections.pop(set_id, None)
+                    else:
+                        self._rejections[set_id] = self._rejections.get(set_id, 0) + 1
+                        if self._rejections[set_id] < MAX_REJECTIONS:
+                            continue
+                        getLogger('finprint').error('Server refused progress for set {0}, giving up'.format(set_id))
+                        del self._rejections[set_id]
+                    # it may have moved on again while we were sending
+                    if self._progress(set_id) == progress:
+                        del self._pending[set_id]
+                    self._save()
+                    self._cond.notify_all()
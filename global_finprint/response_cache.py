@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from logging import getLogger
+
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_TTL = 300  # seconds
+
+
+class CacheEntry(object):
+    def __init__(self, key, data, etag=None, last_modified=None, expires=0):
+        self.key = key
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def is_fresh(self):
+        return time.time() < self.expires
+
+    def validators(self):
+        ''' conditional request headers for revalidating this entry '''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_json(self):
+        return {'key': self.key, 'data': self.data, 'etag': self.etag,
+                'last_modified': self.last_modified, 'expires': self.expires}
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(value['key'], value['data'], value.get('etag'), value.get('last_modified'),
+                   value.get('expires', 0))
+
+
+class ResponseCache(object):
+    '''
+    Cache for server reference data (trips, annotators, reefs...). Entries are served
+    without a request until their TTL runs out; after that they're revalidated with
+    the ETag/Last-Modified the server sent, so an unchanged answer costs a 304 rather
+    than the whole list. Recently used entries are kept in memory; with a directory,
+    every entry is also written to disk so the next session starts warm.
+    '''
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'disk_hits': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                return entry
+        entry = self._load(key)
+        if entry is not None:
+            self.count('disk_hits')
+            self._remember(entry)
+        return entry
+
+    def put(self, key, data, ttl, etag=None, last_modified=None):
+        entry = CacheEntry(key, data, etag, last_modified, time.time() + ttl)
+        self._remember(entry)
+        self._save(entry)
+        return entry
+
+    def refresh(self, entry, ttl):
+        ''' the server confirmed entry is still current '''
+        entry.expires = time.time() + ttl
+        self._save(entry)
+
+    def invalidate(self, prefix=''):
+        ''' drop every entry whose key starts with prefix (all of them by default) '''
+        with self._lock:
+            keys = [k for k in self._entries if k.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    with open(path) as f:
+                        key = json.load(f)['key']
+                    if key.startswith(prefix):
+                        os.remove(path)
+                except (OSError, ValueError, KeyError):
+                    continue
+
+    def count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+    def _remember(self, entry):
+        with self._lock:
+            self._entries.pop(entry.key, None)
+            self._entries[entry.key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = CacheEntry.from_json(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        return entry if entry.key == key else None
+
+    def _save(self, entry):
+        if not self.disk_dir:
+            return
+        path = self._path(entry.key)
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(entry.to_json(), f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            getLogger('finprint').warning('Unable to write response cache entry: {0}'.format(e))
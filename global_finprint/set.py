@@ -1,14 +1,28 @@
+from collections import OrderedDict
+from datetime import datetime
+from logging import getLogger
+from pydispatch import dispatcher
 from .animal import Animal
+from .async_client import AsyncClient
+from .change_set import ChangeSet
 from .global_finprint_server import GlobalFinPrintServer
-from .observation import Observation
+from .journal import Journal
+from .progress_reporter import ProgressReporter
+from .observation import Observation, Event
+
+OBSERVATIONS_CHANGED = 'OBSERVATIONS_CHANGED'
 
 
 class Set(object):
     def __init__(self, id):
         self._connection = GlobalFinPrintServer()
+        self._journal = Journal.get_instance()
+        self._server_obs = OrderedDict()
         self.id = None
         self.file = ''
         self.animals = []
+        self._animals_by_id = {}
+        self._animals_by_group = OrderedDict()
         self.observations = []
         self.attributes = []
         self.code = ''
@@ -29,7 +43,9 @@ class Set(object):
                 a = Animal()
                 a.load(animal)
                 self.animals.append(a)
+            self._index_animals()
 
+            self._absorb({'observations': data['set']['observations']})
             for obs in data['set']['observations']:
                 o = Observation()
                 o.load(obs)
@@ -43,57 +59,213 @@ class Set(object):
             for att in GlobalFinPrintServer().attributes(id):
                 self.attributes.append(att)
 
-    def add_event(self, obs_id, evt_values):
-        result = self._connection.add_event(self.id, obs_id, **evt_values)
-        self._obs_from_json(result)
-        return result['filename']
+            # changes from the last session that haven't reached the server yet
+            self._journal.attach(self)
+            for op in self._journal.pending_for(self.id):
+                self._apply_local(op, ChangeSet())
 
-    def edit_event(self, evt, evt_values):
-        result = self._connection.edit_event(self.id, evt.observation.id, evt.id, **evt_values)
-        self._obs_from_json(result)
-        return result['filename']
+    def add_event(self, obs_id, evt_values, on_done=None, on_error=None):
+        return self._mutate('add_event', {'obs': obs_id}, evt_values, on_done, on_error, creates=('event',))
 
-    def delete_event(self, evt):
-        result = self._connection.delete_event(self.id, evt.observation.id, evt.id)
-        self._obs_from_json(result)
+    def edit_event(self, evt, evt_values, on_done=None, on_error=None):
+        return self._mutate('edit_event', {'obs': evt.observation.id, 'event': evt.id}, evt_values,
+                            on_done, on_error)
 
-    def add_observation(self, obs_values):
-        result = self._connection.add_observation(self.id, **obs_values)
-        self._obs_from_json(result)
-        return result['filename']
+    def delete_event(self, evt, on_done=None, on_error=None):
+        return self._mutate('delete_event', {'obs': evt.observation.id, 'event': evt.id}, {},
+                            on_done, on_error)
 
-    def edit_observation(self, obs, obs_values):
-        result = self._connection.edit_observation(self.id, obs.id, **obs_values)
-        self._obs_from_json(result)
-        return result['filename']
+    def add_observation(self, obs_values, on_done=None, on_error=None):
+        return self._mutate('add_observation', {}, obs_values, on_done, on_error, creates=('obs', 'event'))
 
-    def delete_observation(self, obs):
-        result = self._connection.delete_observation(self.id, obs.id)
-        self._obs_from_json(result)
+    def edit_observation(self, obs, obs_values, on_done=None, on_error=None):
+        return self._mutate('edit_observation', {'obs': obs.id}, obs_values, on_done, on_error)
 
-    def _obs_from_json(self, json):
-        self.observations = []
+    def delete_observation(self, obs, on_done=None, on_error=None):
+        return self._mutate('delete_observation', {'obs': obs.id}, {}, on_done, on_error)
+
+    def _mutate(self, op, ids, values, on_done, on_error, creates=()):
+        '''
+        Record the change in the journal and apply it to the observations straight away;
+        the journal sends it to the server in the background. on_done(filename) is called
+        on the GUI thread once the server has accepted it, on_error(exception) if the
+        server turns it down.
+        '''
+        temp = dict((kind, self._journal.temp_id()) for kind in creates)
+        op = self._journal.submit(op, self.id, ids, dict(values), temp, on_done, on_error)
+        changes = ChangeSet()
+        self._apply_local(op, changes)
+        self._changed(changes)
+        return op
+
+    def on_replayed(self, ops, result, created):
+        ''' the server accepted ops; switch to its ids and its copy of the observations '''
+        for o in self.observations:
+            o.id = created.get(o.id, o.id)
+            for e in o.events:
+                e.id = created.get(e.id, e.id)
+        self._rebase(result)
+
+    def on_rejected(self, op):
+        ''' the server turned op down; drop what it created and go back to the server's copy '''
+        created = set(op.temp.values())
+        for o in self.observations:
+            o.events = [e for e in o.events if e.id not in created]
+        self.observations = [o for o in self.observations if o.id not in created]
+        self._rebase()
+
+    def _absorb(self, json):
+        '''
+        Fold a server response into our copy of the server's observations. Responses are
+        either the full list or, when the server supports it, a delta with just the
+        observations a change touched and the ids of the ones it deleted.
+        '''
+        if not json.get('delta'):
+            self._server_obs = OrderedDict((o['id'], o) for o in json['observations'])
+            return
+        for o in json['observations']:
+            self._server_obs[o['id']] = o
+        for id in json.get('deleted_observations', []):
+            self._server_obs.pop(id, None)
+
+    def _rebase(self, json=None):
+        ''' the server's observations with the changes still in the journal on top '''
+        if json is not None:
+            self._absorb(json)
+        changes = ChangeSet()
+        self._merge_json({'observations': list(self._server_obs.values())}, changes)
+        for op in self._journal.pending_for(self.id):
+            self._apply_local(op, changes)
+        self._changed(changes)
+
+    def _attribute_lookup(self):
+        lookup = {}
+        pending = list(self.attributes)
+        while pending:
+            attr = pending.pop()
+            lookup[attr['id']] = attr
+            pending.extend(attr.get('children', []))
+        return lookup
+
+    def _find_obs(self, id):
+        return next((o for o in self.observations if o.id == id), None)
+
+    def _add_local_event(self, obs, id, values, changes):
+        if any(e.id == id for e in obs.events):
+            return
+        evt = Event()
+        evt.id = id
+        evt.observation = obs
+        evt.create_datetime = datetime.now().replace(microsecond=0)
+        evt.apply_values(values, self._attribute_lookup())
+        obs.add_event(evt)
+        changes.added_events.add(id)
+
+    def _apply_local(self, op, changes):
+        ''' apply op to the in-memory observations, ahead of the server '''
+        values = op.values
+        resolve = self._journal.resolve
+        if op.op == 'add_observation':
+            obs = self._find_obs(resolve(op.temp['obs']))
+            if obs is None:
+                obs = Observation()
+                obs.id = resolve(op.temp['obs'])
+                obs.apply_values(values)
+                obs.animal = self.get_animal(obs.animal_id) if obs.animal_id else Animal()
+                self.observations.append(obs)
+                changes.added_observations.add(obs.id)
+            self._add_local_event(obs, resolve(op.temp['event']), values, changes)
+            return
+
+        obs = self._find_obs(resolve(op.ids['obs']))
+        if obs is None:
+            return
+        if op.op == 'add_event':
+            self._add_local_event(obs, resolve(op.temp['event']), values, changes)
+        elif op.op == 'edit_observation':
+            obs.apply_values(values)
+            obs.animal = self.get_animal(obs.animal_id) if obs.animal_id else Animal()
+            changes.updated_observations.add(obs.id)
+        elif op.op == 'delete_observation':
+            self.observations.remove(obs)
+            changes.removed_observations.add(obs.id)
+            changes.removed_events.update(e.id for e in obs.events)
+        else:
+            evt = next((e for e in obs.events if e.id == resolve(op.ids['event'])), None)
+            if evt is None:
+                return
+            if op.op == 'edit_event':
+                evt.apply_values(values, self._attribute_lookup())
+                changes.updated_events.add(evt.id)
+            else:
+                obs.remove_event(evt)
+                changes.removed_events.add(evt.id)
+
+    def _changed(self, changes):
+        if changes:
+            getLogger('finprint').debug('Set {0} changed: {1}'.format(self.id, changes))
+            dispatcher.send(OBSERVATIONS_CHANGED, sender=self, value=changes)
+
+    def _merge_json(self, json, changes):
+        '''
+        Merge the server's observation list into the current one, reusing the objects
+        that haven't changed and keeping the ones created locally that the server
+        doesn't have yet. Differences are recorded on changes.
+        '''
+        current = dict((o.id, o) for o in self.observations)
+        observations = []
         for oj in json['observations']:
-            o = Observation()
-            o.load(oj)
-            if o.animal_id:
-                o.animal = self.get_animal(o.animal_id)
-            self.observations.append(o)
+            o = current.pop(oj['id'], None)
+            if o is None:
+                o = Observation()
+                o.load(oj)
+                changes.added_observations.add(o.id)
+                changes.added_events.update(e.id for e in o.events)
+            elif not o.merge(oj, changes):
+                observations.append(o)
+                continue
+            o.animal = self.get_animal(o.animal_id) if o.animal_id else Animal()
+            observations.append(o)
+
+        for o in current.values():
+            if o.id < 0:
+                observations.append(o)
+                continue
+            changes.removed_observations.add(o.id)
+            changes.removed_events.update(e.id for e in o.events)
+
+        self.observations = observations
+
+    def _index_animals(self):
+        self._animals_by_id = dict((a.id, a) for a in self.animals)
+        groups = OrderedDict()
+        for a in self.animals:
+            groups.setdefault(a.group, []).append(a)
+        self._animals_by_group = OrderedDict((g, groups[g]) for g in sorted(groups))
 
     def get_animal(self, id):
-        a = [animal for animal in self.animals if animal.id == id]
-        if len(a):
-            return a[0]
-        return None
+        return self._animals_by_id.get(id)
+
+    def animals_by_group(self):
+        '''
+        The set's animals grouped for the organism menus, groups in name order. Shared
+        by every menu, so don't change it.
+        '''
+        return self._animals_by_group
 
     def update_progress(self, progress):
         if self.assigned_to_current():
             if progress > self.progress:
                 self.progress = progress
-                GlobalFinPrintServer().update_progress(self.id, progress)
+                ProgressReporter.get_instance().report(self.id, progress)
+
+    def mark_as_done(self, on_done=None, on_error=None):
+        def submit():
+            # the server should have the final progress before the set is submitted
+            ProgressReporter.get_instance().flush(wait=True)
+            return self._connection.mark_set_done(self.id)
 
-    def mark_as_done(self):
-        GlobalFinPrintServer().mark_set_done(self.id)
+        return AsyncClient.get_instance().submit(submit, on_result=on_done, on_error=on_error)
 
     def assigned_to_current(self):
         return GlobalFinPrintServer().user_id == self.assigned_to['id']
@@ -0,0 +1,271 @@
+'''
+Persistent index of the video files under the local media directory, so sets can be
+matched to a local copy without walking the whole drive on every load.
+
+    python media_index.py rebuild [--root DIR] [--db FILE]
+    python media_index.py verify [--root DIR] [--db FILE]
+'''
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from logging import getLogger
+from config import global_config
+
+
+DEFAULT_INDEX_FILE = './media_index.db'
+# a lookup miss refreshes the index, but not more often than this (seconds)
+REFRESH_INTERVAL = 30
+QUICK_HASH_BYTES = 64 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    quick_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+'''
+
+
+def quick_hash(path, size):
+    ''' hash of the size and the first and last 64k; enough to tell two videos apart '''
+    h = hashlib.sha1(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        h.update(f.read(QUICK_HASH_BYTES))
+        if size > QUICK_HASH_BYTES:
+            f.seek(max(QUICK_HASH_BYTES, size - QUICK_HASH_BYTES))
+            h.update(f.read(QUICK_HASH_BYTES))
+    return h.hexdigest()
+
+
+class MediaIndex(object):
+    '''
+    filename -> path index kept in SQLite. Directory mtimes are stored with it, so a
+    refresh only stats the known directories and re-lists the ones that changed.
+    An index built for another root is rebuilt on opening, unless auto_rebuild is off.
+    '''
+    def __init__(self, root, db_path=DEFAULT_INDEX_FILE, auto_rebuild=True):
+        self.root = os.path.normpath(root)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._last_refresh = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        if auto_rebuild and (row is None or row[0] != self.root):
+            self.rebuild()
+
+    def close(self):
+        self._db.close()
+
+    def rebuild(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM dirs')
+            self._db.execute('DELETE FROM files')
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (self.root,))
+            self._scan_tree(self.root)
+            self._last_refresh = time.time()
+
+    def refresh(self):
+        ''' re-list the directories that changed since they were indexed; returns how many '''
+        with self._lock, self._db:
+            stale = self.stale_dirs()
+            for path in stale:
+                if os.path.isdir(path):
+                    self._scan_tree(path)
+                else:
+                    self._forget_dir(path)
+            self._last_refresh = time.time()
+            return len(stale)
+
+    def stale_dirs(self):
+        stale = []
+        for path, mtime in self._db.execute('SELECT path, mtime FROM dirs').fetchall():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    stale.append(path)
+            except OSError:
+                stale.append(path)
+        if not stale and not self._known_dir(self.root):
+            stale.append(self.root)
+        return stale
+
+    def count(self):
+        return self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def lookup(self, filename, orig_path=None):
+        '''
+        local path for filename, or None. When the name appears more than once, copies
+        with the same size and hash are interchangeable; otherwise the one whose parent
+        directories best match orig_path wins.
+        '''
+        found = self._existing(filename)
+        if not found and time.time() - self._last_refresh > REFRESH_INTERVAL:
+            self.refresh()
+            found = self._existing(filename)
+        if not found:
+            return None
+        if len(found) == 1:
+            return found[0][0]
+
+        identities = set((size, self._hash(path, size, h)) for path, size, h in found)
+        paths = [path for path, _, _ in found]
+        if len(identities) > 1:
+            getLogger('finprint').warning('{0} different files named {1} in {2}'.format(
+                len(identities), filename, self.root))
+            if orig_path:
+                paths.sort(key=lambda p: -self._common_tail(p, orig_path))
+        return paths[0]
+
+    def verify(self):
+        ''' (missing, changed) lists of indexed files that no longer match the disk '''
+        missing, changed = [], []
+        for path, size, mtime in self._db.execute('SELECT path, size, mtime FROM files ORDER BY path'):
+            try:
+                st = os.stat(path)
+            except OSError:
+                missing.append(path)
+                continue
+            if st.st_size != size or st.st_mtime != mtime:
+                changed.append(path)
+        return missing, changed
+
+    def _existing(self, filename):
+        with self._lock:
+            rows = self._db.execute('SELECT path, size, quick_hash FROM files WHERE name = ? ORDER BY path',
+                                    (filename,)).fetchall()
+        return [r for r in rows if os.path.isfile(r[0])]
+
+    def _hash(self, path, size, stored):
+        if stored is None:
+            stored = quick_hash(path, size)
+            with self._lock, self._db:
+                self._db.execute('UPDATE files SET quick_hash = ? WHERE path = ?', (stored, path))
+        return stored
+
+    @staticmethod
+    def _common_tail(path, orig_path):
+        a = os.path.normpath(path).replace('\\', '/').split('/')
+        b = os.path.normpath(orig_path).replace('\\', '/').split('/')
+        n = 0
+        while n < min(len(a), len(b)) and a[-1 - n].lower() == b[-1 - n].lower():
+            n += 1
+        return n
+
+    def _known_dir(self, path):
+        return self._db.execute('SELECT 1 FROM dirs WHERE path = ?', (path,)).fetchone() is not None
+
+    @staticmethod
+    def _prefix(path):
+        prefix = path.rstrip(os.sep) + os.sep
+        return len(prefix), prefix
+
+    def _forget_dir(self, path):
+        n, prefix = self._prefix(path)
+        self._db.execute('DELETE FROM files WHERE dir = ? OR substr(dir, 1, ?) = ?', (path, n, prefix))
+        self._db.execute('DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?', (path, n, prefix))
+
+    def _scan_tree(self, path):
+        pending = [path]
+        while pending:
+            pending.extend(self._scan_dir(pending.pop()))
+
+    def _scan_dir(self, path):
+        ''' re-list one directory; returns subdirectories not seen before '''
+        try:
+            mtime = os.stat(path).st_mtime
+            entries = list(os.scandir(path))
+        except OSError:
+            self._forget_dir(path)
+            return []
+
+        old = dict((r[0], (r[1], r[2], r[3])) for r in self._db.execute(
+            'SELECT path, size, mtime, quick_hash FROM files WHERE dir = ?', (path,)))
+        new_dirs = []
+        seen_dirs = set()
+        rows = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    seen_dirs.add(entry.path)
+                    if not self._known_dir(entry.path):
+                        new_dirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    prev = old.pop(entry.path, None)
+                    # keep a computed hash while the file is unchanged
+                    h = prev[2] if prev and prev[0] == st.st_size and prev[1] == st.st_mtime else None
+                    rows.append((entry.path, path, entry.name, st.st_size, st.st_mtime, h))
+            except OSError:
+                continue
+        self._db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self._db.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in old])
+        for (sub,) in self._db.execute('SELECT path FROM dirs WHERE substr(path, 1, ?) = ?',
+                                       self._prefix(path)).fetchall():
+            if os.path.dirname(sub) == path and sub not in seen_dirs:
+                self._forget_dir(sub)
+        self._db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (path, mtime))
+        return new_dirs
+
+
+_index = None
+
+
+def get_media_index():
+    ''' shared index for the configured alt_media_dir; rebuilt if that setting changes '''
+    global _index
+    root = global_config.get('VIDEOS', 'alt_media_dir')
+    if not root:
+        return None
+    if _index is None or _index.root != os.path.normpath(root):
+        if _index is not None:
+            _index.close()
+        _index = MediaIndex(root, global_config.get('VIDEOS', 'media_index') or DEFAULT_INDEX_FILE)
+    return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python media_index.py',
+                                     description='Rebuild or verify the local media index')
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    parser.add_argument('--root', help='media directory (default: alt_media_dir from config.ini)')
+    parser.add_argument('--db', help='index file (default: media_index from config.ini)')
+    args = parser.parse_args(argv)
+
+    root = args.root or global_config.get('VIDEOS', 'alt_media_dir')
+    if not root:
+        parser.error('no media directory configured; pass --root')
+    db_path = args.db or global_config.get('VIDEOS', 'media_index') or DEFAULT_INDEX_FILE
+
+    start = time.time()
+    # rebuilding anyway, so don't have opening it scan the tree first
+    index = MediaIndex(root, db_path, auto_rebuild=args.command != 'rebuild')
+    if args.command == 'rebuild':
+        index.rebuild()
+        print('Indexed {0} files under {1} in {2:.1f}s'.format(index.count(), index.root, time.time() - start))
+        return 0
+
+    missing, changed = index.verify()
+    for path in missing:
+        print('missing: {0}'.format(path))
+    for path in changed:
+        print('changed: {0}'.format(path))
+    stale = index.stale_dirs()
+    for path in stale:
+        print('out of date: {0}'.format(path))
+    print('{0} missing, {1} changed, {2} directories out of date'.format(len(missing), len(changed), len(stale)))
+    return 1 if missing or changed or stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
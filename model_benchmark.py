@@ -0,0 +1,168 @@
+'''
+Observation model benchmark. Builds a synthetic set the size of a long, busy video
+(50,000 events by default), loads it the way Set does and reports how long that took,
+how much memory the loaded observations hold on to, and how long the lookups the
+table, slider and context menu repeat on every refresh take. It then puts a table's
+worth of events (10,000 by default) in the observation table model and times a
+refresh after an edit, an added and a removed observation, against resetting the
+whole model as a refresh used to.
+
+    python model_benchmark.py [--events N] [--per-observation N] [--repeat N] [--rows N]
+'''
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from PyQt4.QtCore import Qt
+from global_finprint.observation import Observation
+from annotation_view.observation_table import ObservationTable, ObservationTableModel, ordered_rows
+
+
+ATTRIBUTES = [{'id': i, 'name': 'attribute {0}'.format(i), 'verified': False} for i in range(40)]
+# rows the observation table shows at once, which a model reset has to format again
+VISIBLE_ROWS = 40
+
+
+def synthetic_observations(events, per_observation, seed=0):
+    rnd = random.Random(seed)
+    start = datetime(2016, 1, 1)
+    observations = []
+    event_id = 0
+    for obs_id in range(1, events // per_observation + 1):
+        obs_events = []
+        for _ in range(per_observation):
+            event_id += 1
+            x, y = rnd.random() * 0.8, rnd.random() * 0.8
+            obs_events.append({
+                'id': event_id,
+                'event_time': rnd.randrange(0, 3600 * 1000),
+                'attribute': rnd.sample(ATTRIBUTES, 2),
+                'note': '',
+                'extent': 'SRID=4326;POLYGON (({0:.5f} {1:.5f}, {2:.5f} {1:.5f}, {2:.5f} {3:.5f}, '
+                          '{0:.5f} {3:.5f}, {0:.5f} {1:.5f}))'.format(x, y, x + 0.1, y + 0.1),
+                'create_datetime': (start + timedelta(seconds=event_id)).strftime('%Y-%m-%d %H:%M:%S'),
+                'measurables': [{'id': event_id, 'measurable_name': 'MaxN', 'value': '3'}],
+            })
+        observations.append({'id': obs_id, 'type_choice': 'A', 'animal_id': 1, 'comment': '',
+                             'duration': 0, 'events': obs_events})
+    return observations
+
+
+def load(observations):
+    loaded = []
+    for obs in observations:
+        o = Observation()
+        o.load(obs)
+        loaded.append(o)
+    return loaded
+
+
+def time_table_refresh(observations, repeat):
+    '''
+    ms per refresh of an ObservationTableModel holding every event in observations:
+    a model reset, and a refresh the way the observation table does one after an edit,
+    an added and a removed observation, each including formatting the rows the view
+    would repaint. Also the rows each refresh has the view resize.
+    '''
+    model = ObservationTableModel()
+    columns = model.columnCount()
+    observations = list(observations)
+    rows, _ = ordered_rows(observations, ObservationTable.ROTATE_COLORS)
+    model.set_rows(rows)
+
+    def paint(touched):
+        for row in touched:
+            for column in range(columns):
+                model.data(model.index(row, column), Qt.DisplayRole)
+
+    def refresh(current, updated=()):
+        # as ObservationTable.refresh_model: restyled rows are repainted, changed ones resized
+        new_rows, restyled = ordered_rows(current, ObservationTable.ROTATE_COLORS)
+        changed = set(e for o in updated for e in o.events)
+        touched = model.update_rows(new_rows, changed, restyled - changed)
+        paint(touched)
+        if restyled - changed:
+            paint(range(min(VISIBLE_ROWS, len(new_rows))))
+        return len(touched)
+
+    # the observation in the middle of the table, edited, removed and added back
+    edited = rows[len(rows) // 2].observation
+    without = [o for o in observations if o is not edited]
+
+    timings, resized = {}, {}
+    started = time.perf_counter()
+    for _ in range(repeat):
+        model.set_rows(rows)
+        paint(range(min(VISIBLE_ROWS, len(rows))))
+    timings['reset'] = (time.perf_counter() - started) / repeat
+    resized['reset'] = len(rows)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        resized['edit'] = refresh(observations, [edited])
+    timings['edit'] = (time.perf_counter() - started) / repeat
+
+    added = removed = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        resized['remove'] = refresh(without)
+        removed += time.perf_counter() - started
+        started = time.perf_counter()
+        resized['add'] = refresh(observations)
+        added += time.perf_counter() - started
+    timings['remove'] = removed / repeat
+    timings['add'] = added / repeat
+    return len(rows), timings, resized
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure loading a large set of observations')
+    parser.add_argument('--events', type=int, default=50000, help='events in the set (default 50000)')
+    parser.add_argument('--per-observation', type=int, default=5, help='events per observation (default 5)')
+    parser.add_argument('--repeat', type=int, default=20, help='times to repeat the lookups (default 20)')
+    parser.add_argument('--rows', type=int, default=10000, help='events in the observation table (default 10000)')
+    args = parser.parse_args(argv)
+
+    data = synthetic_observations(args.events, args.per_observation)
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    observations = load(data)
+    load_time = time.perf_counter() - started
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        ordered = sorted(observations, key=lambda o: o.initial_time())
+        rows = [e for o in ordered for e in o.events_by_time()]
+        labels = [str(o) for o in ordered]
+    lookup_time = (time.perf_counter() - started) / args.repeat
+
+    events = sum(len(o.events) for o in observations)
+    print('{0} observations, {1} events'.format(len(observations), events))
+    print('  load            {0:>8.0f} ms  ({1:.0f} events/s)'.format(load_time * 1000, events / load_time))
+    print('  memory held     {0:>8.1f} MB  ({1:.0f} bytes/event, not counting the server data)'.format(
+        held / 2 ** 20, held / events))
+    print('  table refresh   {0:>8.1f} ms  (order observations, rows and labels)'.format(lookup_time * 1000))
+    del rows, labels
+
+    table_events, timings, resized = time_table_refresh(load(synthetic_observations(args.rows, args.per_observation, seed=1)),
+                                               args.repeat)
+    print('observation table, {0} rows'.format(table_events))
+    print('  model reset     {0:>8.2f} ms  {1:>6} rows resized'.format(timings['reset'] * 1000, resized['reset']))
+    for change in ('edit', 'add', 'remove'):
+        print('  update, {0:<7} {1:>8.2f} ms  {2:>6} rows resized'.format(change, timings[change] * 1000,
+                                                                           resized[change]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+'''
+Set list benchmark. Starts a local stand-in for the server's login and set list
+endpoints, with a generated list of sets, and times how long the client takes to get
+the first page (the first rows in the assignment table) and the whole list, paged and
+as one response the way servers without paging send it.
+
+    python set_list_benchmark.py [--sets N] [--page-size N] [--latency MS] [--runs N]
+'''
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from global_finprint import GlobalFinPrintServer
+
+
+def synthetic_sets(count):
+    statuses = [{'id': 1, 'name': 'Not started'}, {'id': 2, 'name': 'In progress'},
+                {'id': 3, 'name': 'Ready for Review'}]
+    return [{
+        'id': i,
+        'set_code': 'FP-{0:05d}'.format(i),
+        'assigned_to': {'id': i % 40, 'user': 'Annotator {0}'.format(i % 40)},
+        'project_name': 'Project {0}'.format(i % 7),
+        'assigned_at': '2016-01-{0:02d}'.format(i % 28 + 1),
+        'status': statuses[i % 3],
+        'progress': i * 1000 % 3600000,
+        'last_activity': '2016-02-{0:02d}'.format(i % 28 + 1),
+        'file': 'FP-{0:05d}.mp4'.format(i),
+    } for i in range(1, count + 1)]
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    '''
+    Answers /api/login and /api/set like the real server. With paged set, /api/set
+    honours page and page_size and says which page comes next; without, it sends every
+    set whatever is asked for. latency (seconds) is added to every response.
+    '''
+    daemon_threads = True
+
+    def __init__(self, sets, paged=True, latency=0.0):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.sets = sets
+        self.paged = paged
+        self.latency = latency
+
+    @property
+    def address(self):
+        return 'http://127.0.0.1:{0}'.format(self.server_address[1])
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, data):
+        time.sleep(self.server.latency)
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._send({'token': 'benchmark', 'role': 'lead', 'user_id': 1, 'sets': []})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        sets = self.server.sets
+        if not self.server.paged or 'page_size' not in query:
+            self._send({'sets': sets})
+            return
+        page = int(query.get('page', ['1'])[0])
+        size = int(query['page_size'][0])
+        start = (page - 1) * size
+        self._send({'sets': sets[start:start + size], 'count': len(sets),
+                    'next_page': page + 1 if start + size < len(sets) else None})
+
+
+def time_set_list(server, page_size):
+    ''' seconds to the first page, seconds to the whole list, and the number of pages '''
+    started = time.perf_counter()
+    first = None
+    pages = 0
+    for _ in server.iter_set_list(page_size=page_size):
+        pages += 1
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started, pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure fetching the set list')
+    parser.add_argument('--sets', type=int, default=20000, help='sets in the list (default 20000)')
+    parser.add_argument('--page-size', type=int, default=500, help='sets per page (default 500)')
+    parser.add_argument('--latency', type=float, default=50, help='ms added to each response (default 50)')
+    parser.add_argument('--runs', type=int, default=3, help='times to fetch the list (default 3)')
+    args = parser.parse_args(argv)
+
+    sets = synthetic_sets(args.sets)
+    client = GlobalFinPrintServer()
+    print('{0} sets, {1:.0f} ms latency, median of {2} runs'.format(args.sets, args.latency, args.runs))
+    for paged in (False, True):
+        stand_in = StandInServer(sets, paged=paged, latency=args.latency / 1000)
+        threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+        try:
+            client.login('benchmark', 'benchmark', stand_in.address)
+            runs = [time_set_list(client, args.page_size) for _ in range(args.runs)]
+        finally:
+            stand_in.shutdown()
+            stand_in.server_close()
+        print('  {0:<22} first rows {1:>8.0f} ms   all {2:>8.0f} ms   {3} page(s)'.format(
+            'paged, {0} per page'.format(args.page_size) if paged else 'one response',
+            statistics.median(r[0] for r in runs) * 1000,
+            statistics.median(r[1] for r in runs) * 1000, runs[0][2]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+'''
+Startup timing. With FINPRINT_STARTUP_TIMING set, the annotator prints how long it
+took to reach each point in startup, ending with the first window on screen. Set it
+to "exit" to quit as soon as the window is up.
+
+Run on its own, this is a repeatable startup benchmark: it starts the annotator a few
+times under python -X importtime and reports the median time to the first window and
+the slowest imports.
+
+    python startup_timing.py [--runs N] [--top N]
+'''
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+
+_start = time.perf_counter()
+_marks = []
+
+ENV_VAR = 'FINPRINT_STARTUP_TIMING'
+MARK_PREFIX = 'startup:'
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def enabled():
+    return bool(os.environ.get(ENV_VAR))
+
+
+def exit_after_first_window():
+    return os.environ.get(ENV_VAR) == 'exit'
+
+
+def mark(label):
+    ''' record how long startup has taken so far, if timing is on '''
+    if enabled():
+        elapsed = (time.perf_counter() - _start) * 1000
+        _marks.append((label, elapsed))
+        print('{0} {1} {2:.0f}'.format(MARK_PREFIX, label, elapsed), flush=True)
+
+
+def marks():
+    return list(_marks)
+
+
+def _run_once(script):
+    env = dict(os.environ)
+    env[ENV_VAR] = 'exit'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', script],
+                          cwd=os.path.dirname(script), env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    timings = {}
+    for line in proc.stdout.splitlines():
+        if line.startswith(MARK_PREFIX):
+            label, _, ms = line[len(MARK_PREFIX):].strip().rpartition(' ')
+            timings[label] = float(ms)
+    imports = {}
+    for line in proc.stderr.splitlines():
+        m = IMPORT_LINE.match(line)
+        if m:
+            # microseconds, self and cumulative
+            imports[m.group(4)] = (int(m.group(1)), int(m.group(2)), len(m.group(3)))
+    return proc.returncode, timings, imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure annotator startup')
+    parser.add_argument('--runs', type=int, default=5, help='number of launches (default 5)')
+    parser.add_argument('--top', type=int, default=25, help='slowest imports to list (default 25)')
+    args = parser.parse_args(argv)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finprint_annotator.py')
+    timings, imports = {}, {}
+    for run in range(args.runs):
+        code, run_timings, run_imports = _run_once(script)
+        if code != 0 or 'first window' not in run_timings:
+            print('run {0} did not reach the first window (exit code {1})'.format(run + 1, code))
+            return 1
+        for label, ms in run_timings.items():
+            timings.setdefault(label, []).append(ms)
+        for name, (own, cumulative, depth) in run_imports.items():
+            imports.setdefault(name, []).append((own, cumulative, depth))
+
+    print('Median over {0} runs, ms since the annotator started importing:'.format(args.runs))
+    for label, values in sorted(timings.items(), key=lambda item: statistics.median(item[1])):
+        print('  {0:>8.0f}  {1}'.format(statistics.median(values), label))
+
+    print()
+    print('Slowest imports (median ms, cumulative / self):')
+    rows = []
+    for name, values in imports.items():
+        rows.append((statistics.median(v[1] for v in values) / 1000,
+                     statistics.median(v[0] for v in values) / 1000,
+                     values[0][2], name))
+    rows.sort(reverse=True)
+    for cumulative, own, depth, name in rows[:args.top]:
+        print('  {0:>8.1f} {1:>8.1f}  {2}{3}'.format(cumulative, own, ' ' * (depth - 1), name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
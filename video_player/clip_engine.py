@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import mkdtemp
+from logging import getLogger
+from PyQt4.QtCore import *
+import config
+from .upload_manager import UploadManager
+
+
+FFMPEG_DIR = 'ffmpeg_executable'
+EXE_SUFFIX = '.exe' if sys.platform == 'win32' else ''
+CLIP_WIDTH = 800
+DEFAULT_MAX_JOBS = 2
+# how far around a cut to look for keyframes; GOPs in the field footage are well under this
+KEYFRAME_WINDOW = 10.0
+# smart cut joins stream-copied h264 with re-encoded edges, which only works for h264 sources
+SMART_CUT_CODECS = ('h264',)
+# how far a smart cut clip's length may be from the one asked for before it's re-encoded
+DURATION_TOLERANCE = 0.5  # seconds
+
+
+def _tool(name):
+    return os.path.join(FFMPEG_DIR, name + EXE_SUFFIX)
+
+
+def _run(args):
+    getLogger('finprint').debug(' '.join(args))
+    # keep a console window from flashing up for each call on windows
+    flags = 0x08000000 if sys.platform == 'win32' else 0  # CREATE_NO_WINDOW
+    return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          check=True, creationflags=flags).stdout.decode('utf-8', 'replace')
+
+
+class KeyframeIndex(object):
+    '''
+    Keyframe times of one video file. Only the windows around requested cuts are
+    probed, by reading packet flags without decoding, and the results are kept so
+    later clips from the same stretch of video don't probe again.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.stamp = self._stamp(path)
+        self.times = []
+        self.covered = []
+        self.stream = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def is_current(self):
+        return self.stamp == self._stamp(self.path)
+
+    def stream_info(self):
+        with self._lock:
+            if self.stream is None:
+                out = _run([_tool('ffprobe'), '-v', 'error', '-select_streams', 'v:0',
+                            '-show_entries', 'stream=codec_name,profile,level,refs,has_b_frames,width,height,pix_fmt',
+                            '-of', 'json',
+                            self.path])
+                self.stream = json.loads(out)['streams'][0]
+            return self.stream
+
+    def keyframes(self, start, end):
+        with self._lock:
+            lo = max(0.0, start - KEYFRAME_WINDOW)
+            hi = end + KEYFRAME_WINDOW
+            if not any(a <= start and b >= end for a, b in self.covered):
+                self._probe(lo, hi)
+            return self.times[bisect_left(self.times, start):bisect_right(self.times, end)]
+
+    def _probe(self, lo, hi):
+        out = _run([_tool('ffprobe'), '-v', 'error', '-select_streams', 'v:0',
+                    '-read_intervals', '{0:.3f}%{1:.3f}'.format(lo, hi),
+                    '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', self.path])
+        found = set(self.times)
+        for line in out.splitlines():
+            fields = line.strip().split(',')
+            if not any(f.startswith('K') for f in fields):
+                continue
+            for f in fields:
+                try:
+                    found.add(float(f))
+                    break
+                except ValueError:
+                    pass
+        self.times = sorted(found)
+        self.covered.append((lo, hi))
+
+
+class ClipEngine(QObject):
+    '''
+    Cuts the short clips attached to observations and hands them to the upload manager.
+    The source is always seeked on input, so ffmpeg never decodes from the start of the
+    file. For h264 sources the clip is assembled from a stream copy between the first
+    and last keyframe inside the cut, with only the partial GOPs at either edge
+    re-encoded to match the source's profile and level. The result is decoded once
+    before it's uploaded; anything else, or any failure along the way, falls back to a
+    single re-encode of just the clip.
+    '''
+    INSTANCE = None
+
+    clipFailed = pyqtSignal(str)
+
+    def __init__(self, max_jobs=None):
+        super().__init__()
+        if max_jobs is None:
+            max_jobs = DEFAULT_MAX_JOBS
+            if 'clips' in config.global_config.get():
+                max_jobs = int(config.global_config.get('clips', 'max_jobs') or DEFAULT_MAX_JOBS)
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = ClipEngine()
+        return cls.INSTANCE
+
+    def submit(self, source, start_ms, duration_ms, key):
+        ''' start_ms is taken by value, so later seeks don't move the clip '''
+        return self._executor.submit(self._make_clip, source, start_ms / 1000, duration_ms / 1000, key)
+
+    def index(self, source):
+        with self._lock:
+            idx = self._indexes.get(source)
+            if idx is None or not idx.is_current():
+                idx = self._indexes[source] = KeyframeIndex(source)
+            return idx
+
+    def _make_clip(self, source, start, duration, key):
+        work_dir = mkdtemp(prefix='finprint-clip-')
+        clip_path = os.path.join(work_dir, os.path.basename(key))
+        try:
+            try:
+                self._smart_cut(source, start, duration, clip_path, work_dir)
+            except Exception as e:
+                getLogger('finprint').info('Smart cut not possible for {0}, re-encoding: {1}'.format(key, e))
+                self._encode(source, start, duration, clip_path)
+            UploadManager.get_instance().enqueue_file(key, clip_path, 'video/mp4', delete_after=True)
+        except Exception as e:
+            getLogger('finprint').error('error in generating video clip {0}: {1}'.format(key, e))
+            self.clipFailed.emit(key)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _smart_cut(self, source, start, duration, clip_path, work_dir):
+        idx = self.index(source)
+        stream = idx.stream_info()
+        if stream.get('codec_name') not in SMART_CUT_CODECS:
+            raise ValueError('codec {0}'.format(stream.get('codec_name')))
+        end = start + duration
+        keys = idx.keyframes(start, end)
+        if len(keys) < 2:
+            raise ValueError('no full GOP inside the clip')
+        first, last = keys[0], keys[-1]
+
+        segments = []
+        if first > start:
+            segments.append(self._segment(work_dir, 'head', source, start, first - start, stream))
+        segments.append(self._segment(work_dir, 'body', source, first, last - first, None))
+        if end > last:
+            segments.append(self._segment(work_dir, 'tail', source, last, end - last, stream))
+
+        # mpeg-ts segments carry their own codec parameters, so the joins stay decodable
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w') as f:
+            for seg in segments:
+                f.write("file '{0}'\n".format(seg.replace('\\', '/')))
+        _run([_tool('ffmpeg'), '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+              '-c', 'copy', '-movflags', '+faststart', clip_path])
+        self._verify(clip_path, duration)
+
+    def _segment(self, work_dir, name, source, start, duration, encode_like):
+        path = os.path.join(work_dir, name + '.ts')
+        # times go in unrounded: the body has to start on the very keyframe ffprobe
+        # reported, and a seek a fraction short of it would copy from the one before
+        args = [_tool('ffmpeg'), '-v', 'error', '-y', '-ss', repr(start), '-i', source,
+                '-t', repr(duration), '-an']
+        if encode_like is None:
+            args += ['-c:v', 'copy']
+        else:
+            args += ['-c:v', 'libx264', '-preset', 'veryfast'] + self._encode_like(encode_like)
+        _run(args + [path])
+        return path
+
+    @staticmethod
+    def _encode_like(stream):
+        ''' libx264 options for edges that decode with the same settings as the copied body '''
+        args = ['-pix_fmt', stream.get('pix_fmt', 'yuv420p')]
+        profile = (stream.get('profile') or '').lower().replace('constrained ', '').replace(' ', '')
+        if profile in ('baseline', 'main', 'high', 'high10', 'high422', 'high444'):
+            args += ['-profile:v', profile]
+        if stream.get('level', 0) > 0:
+            args += ['-level', '{0:.1f}'.format(stream['level'] / 10)]
+        params = []
+        if stream.get('refs'):
+            params.append('ref={0}'.format(stream['refs']))
+        if not stream.get('has_b_frames'):
+            params.append('bframes=0')
+        if params:
+            args += ['-x264-params', ':'.join(params)]
+        return args
+
+    def _verify(self, clip_path, duration):
+        ''' decode the whole clip, so a join that didn't take is re-encoded rather than uploaded '''
+        _run([_tool('ffmpeg'), '-v', 'error', '-xerror', '-i', clip_path, '-f', 'null', '-'])
+        out = _run([_tool('ffprobe'), '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', clip_path])
+        length = float(json.loads(out)['format']['duration'])
+        if abs(length - duration) > DURATION_TOLERANCE:
+            raise ValueError('clip is {0:.3f}s long, not {1:.3f}s'.format(length, duration))
+
+    def _encode(self, source, start, duration, clip_path):
+        _run([_tool('ffmpeg'), '-v', 'error', '-y', '-ss', '{0:.3f}'.format(start), '-i', source,
+              '-t', '{0:.3f}'.format(duration), '-an', '-c:v', 'libx264', '-preset', 'veryfast',
+              '-vf', 'scale={0}:-2'.format(CLIP_WIDTH), '-movflags', '+faststart', clip_path])
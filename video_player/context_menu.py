@@ -1,11 +1,11 @@
 from .attribute_selector import AttributeSelector
 from annotation_view import TypeAndReduce
+from annotation_view.components import show_server_error
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from enum import IntEnum
 from annotation_view.util import ObservationColumn
 from global_finprint.global_finprint_server import GlobalFinPrintServer
-from threading import Thread
 import re
 from logging import getLogger
 from .mark_zero_time_selector import MarkZeroTimeSelector
@@ -35,17 +35,12 @@ class ContextMenu(QMenu):
         # animals
         if self._set is not None:
             self.setStyleSheet('QMenu::item:selected { background-color: lightblue; }')
-            self._grouping = {}
-            for animal in self._set.animals:
-                if animal.group not in self._grouping:
-                    self._grouping[animal.group] = []
-                self._grouping[animal.group].append(animal)
 
             # actions
             self._animal_group_menu = self.addMenu('Create animal observation')
-            for group in sorted(self._grouping.keys()):
+            for group, animals in self._set.animals_by_group().items():
                 group_menu = self._animal_group_menu.addMenu(group)
-                group_menu.addAction(TypeAndReduce(group, self._grouping[group], self._debug, group_menu))
+                group_menu.addAction(TypeAndReduce(group, animals, self._debug, group_menu))
 
             self._interest_act = self.addAction('Create non-animal observation')
             self._observations_menu = self.addMenu('Add to existing observation')
@@ -370,27 +365,34 @@ class EventDialog(QDialog):
             self.dialog_values['attribute'].remove(-1)
 
         if len(self._set.observations) == 0 and not GlobalFinPrintServer().is_lead():
-            self._set.progress = self.dialog_values['event_time']
-            GlobalFinPrintServer().update_progress(self._set.id, self.dialog_values['event_time'])
+            self._set.update_progress(self.dialog_values['event_time'])
+
+        # the request runs in the background; the dialog closes straight away
+        capture_clip = self.capture_video_check is not None and self.capture_video_check.isChecked()
+        observation_table = self.observation_table()
+        video_widget = self.parent()
+        # capture where the annotator is now, not where playback is when the server answers
+        capture_position = video_widget.get_position()
+
+        def _saved(filename):
+            # update observation_table
+            if observation_table:
+                observation_table.refresh_model()
+            else:
+                video_widget.parent().refresh_seek_bar()
+            # save frame
+            video_widget.save_image(filename, capture_position)
+
+            # save 8_sec_clip
+            if capture_clip:
+                file_name = re.split(".png", filename)[0] + ".mp4"
+                video_widget.generate_8sec_clip(file_name, capture_position)
 
         if self.action == DialogActions.new_obs:  # new obs
-            filename = self._set.add_observation(self.dialog_values)
+            self._set.add_observation(self.dialog_values, on_done=_saved, on_error=show_server_error)
         else:  # add event to obs
-            filename = self._set.add_event(self.selected_obs.id, self.dialog_values)
-
-        # update observation_table
-        if self.observation_table():
-            self.observation_table().refresh_model()
-        else:
-            self.parent().parent().refresh_seek_bar()
-        # save frame
-        self.parent().save_image(filename)
-
-        # save 8_sec_clip
-        if self.capture_video_check is not None and self.capture_video_check.isChecked() == True:
-            file_name = re.split(".png", filename)[0] + ".mp4"
-            thread = Thread(target=self.upload_8sec_clip, args=(file_name,))
-            thread.start()
+            self._set.add_event(self.selected_obs.id, self.dialog_values, on_done=_saved,
+                                on_error=show_server_error)
 
         # close and clean up
         self.cleanup()
@@ -406,22 +408,37 @@ class EventDialog(QDialog):
         # added for default tag
         if self.dialog_values['attribute'] is not None and -1 in self.dialog_values['attribute']:
             self.dialog_values['attribute'].remove(-1)
+        capture_clip = self.capture_video_check is not None and self.capture_video_check.isChecked()
+        observation_table = self.observation_table()
+        video_widget = self.parent()
+        # capture where the annotator is now, not where playback is when the server answers
+        capture_position = video_widget.get_position()
+
+        def _updated(filename):
+            # update observation_table
+            observation_table.refresh_model()
+
+            # save 8_sec_clip
+            if capture_clip and filename:
+                file_name = re.split(".png", filename)[0] + ".mp4"
+                video_widget.generate_8sec_clip(file_name, capture_position)
+
+        # requests are serialized, so the event edit reaches the server after the observation edit
         if self.action == DialogActions.edit_obs:
-            filename = self._set.edit_observation(self.selected_obs, self.dialog_values)
             if self.selected_evt is not None:
                 selected_evt = [child_event for child_event in self.selected_obs.events if
                                 child_event.id == self.selected_evt['event_id']][0]
-                filename = self._set.edit_event(selected_evt, self.dialog_values)
+                self._set.edit_observation(self.selected_obs, self.dialog_values,
+                                           on_done=lambda _: None, on_error=show_server_error)
+                self._set.edit_event(selected_evt, self.dialog_values, on_done=_updated,
+                                     on_error=show_server_error)
+            else:
+                self._set.edit_observation(self.selected_obs, self.dialog_values, on_done=_updated,
+                                           on_error=show_server_error)
         else:
-            self._set.edit_event(self.selected_event, self.dialog_values)
-        # update observation_table
-        self.observation_table().refresh_model()
-
-        # save 8_sec_clip
-        if self.capture_video_check.isChecked() == True:
-            file_name = re.split(".png", filename)[0] + ".mp4"
-            thread = Thread(target=self.upload_8sec_clip, args=(file_name,))
-            thread.start()
+            self._set.edit_event(self.selected_event, self.dialog_values, on_done=_updated,
+                                 on_error=show_server_error)
+
         # close and clean up
         self.cleanup()
 
@@ -462,17 +479,12 @@ class EventDialog(QDialog):
         self.cascaded_menu = QMenu(self)
         self.cascaded_menu.setStyleSheet(stylesheet)
         self.cascaded_menu.setFixedWidth(300)
-        self._grouping = {}
-        for animal in self._set.animals:
-            if animal.group not in self._grouping:
-                self._grouping[animal.group] = []
-            self._grouping[animal.group].append(animal)
 
             # actions
         # self._animal_group_menu = menu.addMenu('Create animal observation')
-        for group in sorted(self._grouping.keys()):
+        for group, animals in self._set.animals_by_group().items():
             group_menu = self.cascaded_menu.addMenu(group)
-            group_menu.addAction(TypeAndReduce(group, self._grouping[group], self._debug, group_menu, False))
+            group_menu.addAction(TypeAndReduce(group, animals, self._debug, group_menu, False))
 
             # self.display()
         x = self.pos().x() + self.animal_dropdown.x()
@@ -487,14 +499,11 @@ class EventDialog(QDialog):
         self.dialog_values['animal_id'] = item.choice.id
         self.cascaded_menu.hide()
 
-    def upload_8sec_clip(self, file_name):
-        self.parent().generate_8sec_clip(file_name)
-
     def find_event_to_update(self):
         obs = sorted(self._set.observations, key=lambda o: o.initial_time())
         count = -1
         for o in reversed(obs):
-            events = sorted(o.events, key=lambda e: e.event_time)
+            events = o.events_by_time()
             for e in reversed(events):
                 if count + 1 == self.row_number:
                     self.dialog_values['note'] = e.note
@@ -568,7 +577,7 @@ class EventDialog(QDialog):
 
     def get_selected_event_id(self):
         for event in self.selected_event :
-            if hasattr(event, 'first_flag'):
+            if event.first_flag:
                 return event.id
 
     def unselect_tag_attribute(self, id):
@@ -0,0 +1,227 @@
+import threading
+from logging import getLogger
+from PyQt4.QtCore import *
+from .frame_filter import numpy_qimage
+
+
+FRAMES_BEHIND = 30
+FRAMES_AHEAD = 30
+DEFAULT_FPS = 30.0
+
+
+class FrameBuffer(QObject):
+    '''
+    Decoded frames around the paused playhead, so frame steps and short scrubs can be
+    shown without a libvlc seek. A background thread decodes the file with OpenCV,
+    ahead of the playhead first and then behind it, and evicts frames that fall out
+    of the window. Frames are stored letterboxed to the size of the video frame
+    widget, the same geometry as what libvlc draws, so extents line up either way.
+    Decoding stops while the video plays. OpenCV is only imported once there's a file
+    to decode.
+
+    The same thread also serves one-off captures of a single frame, either at display
+    size or at full resolution, ahead of any buffering work.
+    '''
+    frameCaptured = pyqtSignal(int, object)  # frame number, QImage or None
+
+    def __init__(self, behind=FRAMES_BEHIND, ahead=FRAMES_AHEAD):
+        super().__init__()
+        self.behind = behind
+        self.ahead = ahead
+        self._cond = threading.Condition()
+        self._path = None
+        self._size = None
+        self._target = None
+        self._frames = {}
+        self._fps = None
+        self._count = None
+        self._captures = []
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def open(self, path):
+        with self._cond:
+            self._path = path
+            self._fps = None
+            self._count = None
+            self._target = None
+            self._frames = {}
+            captures, self._captures = self._captures, []
+            self._cond.notify()
+        for _, _, callback in captures:
+            self._deliver(callback, -1, None)
+
+    def close(self):
+        self.open(None)
+
+    def fps(self):
+        return self._fps or DEFAULT_FPS
+
+    def frame_ms(self):
+        return 1000.0 / self.fps()
+
+    def frame_number(self, position):
+        return int(round(position * self.fps() / 1000))
+
+    def frame_at(self, position):
+        ''' buffered frame at position (ms) as a QImage, or None '''
+        with self._cond:
+            frame = self._frames.get(self.frame_number(position))
+        return numpy_qimage(frame) if frame is not None else None
+
+    def fill_around(self, position, size):
+        ''' start decoding around position (ms), at size (width, height) '''
+        with self._cond:
+            if size != self._size:
+                self._size = size
+                self._frames = {}
+            self._target = self.frame_number(position)
+            self._evict()
+            self._cond.notify()
+
+    def capture(self, position, size=None, callback=None):
+        '''
+        Decode the frame at position (ms). With a size it is letterboxed and kept like
+        a buffered frame; without one it is full resolution. callback(image) is called
+        on the decoder thread; without a callback frameCaptured is emitted instead.
+        The image is None if the frame can't be decoded.
+        '''
+        with self._cond:
+            n = self.frame_number(position)
+            frame = self._frames.get(n) if size is not None and size == self._size else None
+            if frame is None:
+                self._captures.append((n, size, callback))
+                self._cond.notify()
+                return
+        self._deliver(callback, n, numpy_qimage(frame))
+
+    def _deliver(self, callback, n, image):
+        if callback is None:
+            self.frameCaptured.emit(n, image)
+        else:
+            try:
+                callback(image)
+            except Exception:
+                getLogger('finprint').exception('Frame capture callback failed')
+
+    def suspend(self):
+        with self._cond:
+            self._target = None
+
+    def _evict(self):
+        lo, hi = self._target - self.behind, self._target + self.ahead
+        for n in [n for n in self._frames if n < lo or n > hi]:
+            del self._frames[n]
+
+    def _next_missing(self):
+        ''' next frame to decode: the nearest gap ahead of the target, then behind it '''
+        n = self._target
+        end = n + self.ahead + 1 if self._count is None else min(n + self.ahead + 1, self._count)
+        for i in range(n, end):
+            if i not in self._frames:
+                return i
+        for i in range(min(n, end) - 1, max(-1, n - self.behind - 1), -1):
+            if i not in self._frames:
+                # decode forward from the start of the gap
+                while i - 1 >= max(0, n - self.behind) and i - 1 not in self._frames:
+                    i -= 1
+                return i
+        return None
+
+    def _work(self):
+        with self._cond:
+            while self._path is None and not self._captures:
+                self._cond.wait()
+        import cv2
+
+        capture = None
+        capture_path = None
+        next_read = None
+
+        def read(n):
+            nonlocal next_read
+            try:
+                if next_read != n:
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, n)
+                ok, frame = capture.read()
+            except cv2.error as e:
+                getLogger('finprint').error('Frame decode failed: {0}'.format(e))
+                ok, frame = False, None
+            next_read = n + 1 if ok else None
+            return frame if ok else None
+
+        while True:
+            job = wanted = None
+            with self._cond:
+                while True:
+                    if self._path != capture_path:
+                        break
+                    if self._captures:
+                        job = self._captures.pop(0)
+                        break
+                    if self._target is not None and self._size is not None:
+                        wanted = self._next_missing()
+                        if wanted is not None:
+                            break
+                    self._cond.wait()
+                path, size = self._path, self._size
+
+            if path != capture_path:
+                if capture is not None:
+                    capture.release()
+                capture, capture_path, next_read = None, path, None
+                if path is not None:
+                    capture = cv2.VideoCapture(path)
+                    fps = capture.get(cv2.CAP_PROP_FPS)
+                    count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+                    with self._cond:
+                        self._fps = fps if fps and fps > 0 else None
+                        self._count = int(count) if count and count > 0 else None
+                continue
+
+            if job is not None:
+                n, job_size, callback = job
+                frame = read(n) if capture is not None else None
+                image = None
+                if frame is not None:
+                    if job_size is None:
+                        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    else:
+                        image = self._letterbox(frame, job_size)
+                        with self._cond:
+                            if self._path == path and self._size == job_size:
+                                self._frames[n] = image
+                    image = numpy_qimage(image)
+                self._deliver(callback, n, image)
+                continue
+
+            frame = read(wanted)
+            if frame is None:
+                # past the real end of the stream (frame counts are estimates); don't ask again
+                with self._cond:
+                    if self._path == path:
+                        self._count = wanted if self._count is None else min(self._count, wanted)
+                continue
+            image = self._letterbox(frame, size)
+
+            with self._cond:
+                if self._path != path or self._size != size or self._target is None:
+                    continue
+                lo, hi = self._target - self.behind, self._target + self.ahead
+                if lo <= wanted <= hi:
+                    self._frames[wanted] = image
+
+    @staticmethod
+    def _letterbox(frame, size):
+        import cv2
+        import numpy as np
+        width, height = size
+        fh, fw = frame.shape[:2]
+        scale = min(width / fw, height / fh)
+        sw, sh = max(1, int(fw * scale)), max(1, int(fh * scale))
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        x, y = (width - sw) // 2, (height - sh) // 2
+        # cv2 decodes BGR; overlay and filters work in RGB
+        canvas[y:y + sh, x:x + sw] = cv2.cvtColor(cv2.resize(frame, (sw, sh), interpolation=cv2.INTER_AREA),
+                                                  cv2.COLOR_BGR2RGB)
+        return canvas
@@ -0,0 +1,118 @@
+import threading
+from logging import getLogger
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+
+
+CLAHE_CLIP_LIMIT = 2.0
+
+
+def hsv_lut(saturation, brightness):
+    '''
+    256-entry lookup table for a 3 channel HSV frame: hue untouched, saturation and
+    value raised by the given amounts, clamped at 255
+    '''
+    import numpy as np
+    ramp = np.arange(256, dtype=np.uint16)
+    lut = np.empty((1, 256, 3), dtype=np.uint8)
+    lut[0, :, 0] = ramp
+    lut[0, :, 1] = np.minimum(ramp + saturation, 255)
+    lut[0, :, 2] = np.minimum(ramp + brightness, 255)
+    return lut
+
+
+def qimage_view(image):
+    '''
+    numpy view of an RGB888 QImage's pixels. The QImage stays the owner of the
+    memory, so it has to outlive the array.
+    '''
+    import numpy as np
+    width, height, stride = image.width(), image.height(), image.bytesPerLine()
+    ptr = image.constBits()  # bits() would detach, copying an image shared with the GUI
+    ptr.setsize(image.byteCount())
+    rows = np.frombuffer(ptr, dtype=np.uint8).reshape(height, stride)
+    return rows[:, :width * 3].reshape(height, width, 3)
+
+
+def numpy_qimage(frame):
+    ''' QImage over an RGB array's memory, without copying '''
+    height, width, _ = frame.shape
+    image = QImage(frame.data, width, height, frame.strides[0], QImage.Format_RGB888)
+    image.ndarray = frame  # keep the pixels alive as long as the image
+    return image
+
+
+class FrameFilter(QObject):
+    '''
+    Applies the saturation, brightness and contrast controls to paused frames on a
+    worker thread. Only the most recent request is kept; a request that arrives while
+    a frame is being filtered replaces any that was still waiting, and results for
+    anything but the latest request are dropped, so dragging a slider never queues
+    up work. OpenCV is imported by the worker with the first frame, not at startup.
+    '''
+    filtered = pyqtSignal(object, int)  # QImage, request generation
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()
+        self._request = None
+        self._generation = 0
+        self._lut_key = None
+        self._lut = None
+        self._clahe = None
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def request(self, image, saturation, brightness, contrast):
+        '''
+        queue image for filtering; image should be Format_RGB888 so it can be read in place.
+        Returns the generation that the matching filtered signal will carry.
+        '''
+        with self._cond:
+            self._generation += 1
+            self._request = (self._generation, image, saturation, brightness, contrast)
+            self._cond.notify()
+            return self._generation
+
+    def is_current(self, generation):
+        return generation == self._generation
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._request is None:
+                    self._cond.wait()
+                generation, image, saturation, brightness, contrast = self._request
+                self._request = None
+            try:
+                result = self.apply(image, saturation, brightness, contrast)
+            except Exception as ex:
+                getLogger('finprint').exception('Exception building image: {}'.format(str(ex)))
+                continue
+            if self.is_current(generation):
+                self.filtered.emit(result, generation)
+
+    def apply(self, image, saturation, brightness, contrast):
+        if not (saturation > 0 or brightness > 0 or contrast):
+            return image
+        import cv2
+        frame = qimage_view(image)
+
+        if saturation > 0 or brightness > 0:
+            if self._lut_key != (saturation, brightness):
+                self._lut_key = (saturation, brightness)
+                self._lut = hsv_lut(saturation, brightness)
+            hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+            cv2.LUT(hsv, self._lut, dst=hsv)
+            frame = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB, dst=hsv)
+
+        if contrast:
+            if self._clahe is None:
+                self._clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT)
+            lab = cv2.cvtColor(frame, cv2.COLOR_RGB2Lab)
+            l_chan = cv2.extractChannel(lab, 0)
+            self._clahe.apply(l_chan, dst=l_chan)
+            cv2.insertChannel(l_chan, lab, 0)
+            frame = cv2.cvtColor(lab, cv2.COLOR_Lab2RGB, dst=lab)
+
+        return numpy_qimage(frame)
@@ -0,0 +1,87 @@
+import time
+from PyQt4.QtCore import *
+import config
+
+
+DEFAULT_UPDATE_INTERVAL = 100  # ms
+
+
+class PositionTracker(QObject):
+    '''
+    Playback position driven by libvlc's MediaPlayerTimeChanged events instead of
+    polling get_time(). Each event only moves an anchor (time, wall clock); a GUI timer
+    then reports a position interpolated from the anchor at the configured interval,
+    however often libvlc fires, so the playhead moves smoothly without native calls.
+    The media duration is read once per media. The tracker can be created before there
+    is a media player; bind() attaches it to one.
+    '''
+    positionChanged = pyqtSignal(int)
+    _timeChanged = pyqtSignal(int)  # from libvlc's event thread
+
+    def __init__(self, interval=None):
+        super().__init__()
+        self._media = None
+        self._duration = 0
+        self._rate = 1.0
+        self._anchor_time = 0
+        self._anchor_clock = time.perf_counter()
+        self._running = False
+
+        if interval is None:
+            interval = DEFAULT_UPDATE_INTERVAL
+            if 'vlc_tracking' in config.global_config.get():
+                interval = int(config.global_config.get('vlc_tracking', 'update_interval') or interval)
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self._tick)
+
+        self._timeChanged.connect(self._on_time_changed)
+
+    def bind(self, mediaplayer):
+        from .vlc import EventType
+        mediaplayer.event_manager().event_attach(EventType.MediaPlayerTimeChanged, self._time_event)
+
+    def attach(self, media):
+        self._media = media
+        self._duration = 0
+        self.seek(0)
+
+    def duration(self):
+        # parsing can still be under way on the first few calls
+        if self._duration <= 0 and self._media is not None:
+            self._duration = max(0, self._media.get_duration())
+        return self._duration
+
+    def position(self):
+        if not self._running:
+            return self._anchor_time
+        pos = self._anchor_time + (time.perf_counter() - self._anchor_clock) * 1000 * self._rate
+        duration = self.duration()
+        return int(min(pos, duration) if duration else pos)
+
+    def start(self):
+        self._anchor_clock = time.perf_counter()
+        self._running = True
+        self._timer.start()
+
+    def stop(self):
+        self._anchor_time = self.position()
+        self._running = False
+        self._timer.stop()
+
+    def seek(self, pos):
+        self._anchor_time = int(pos)
+        self._anchor_clock = time.perf_counter()
+
+    def set_rate(self, rate):
+        self.seek(self.position())
+        self._rate = rate
+
+    def _time_event(self, event):
+        self._timeChanged.emit(event.u.new_time)
+
+    def _on_time_changed(self, new_time):
+        self.seek(new_time)
+
+    def _tick(self):
+        self.positionChanged.emit(self.position())
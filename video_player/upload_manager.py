@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import shutil
+import threading
+import uuid
+from queue import Queue
+from tempfile import gettempdir
+from logging import getLogger
+from PyQt4.QtCore import *
+import config
+
+
+AWS_BUCKET_NAME = 'finprint-annotator-screen-captures'
+UPLOAD_QUEUE_DIR = 'finprint-upload-queue'
+CREDENTIALS_FILENAME = './credentials.csv'
+
+
+def _s3_option(key, default=None):
+    if 's3' not in config.global_config.get():
+        return default
+    value = config.global_config.get('s3', key)
+    return default if value is None else value
+
+
+def _credentials():
+    creds = open(CREDENTIALS_FILENAME).readlines()[1].split(',')
+    return creds[1].strip(), creds[2].strip()
+
+
+def s3_connect():
+    '''
+    Connection to S3, or to a local stand-in when host/port are set in the [s3] section of config.ini
+    '''
+    from boto.s3.connection import S3Connection, OrdinaryCallingFormat
+    access_key, secret_key = _credentials()
+    host = _s3_option('host')
+    if host is None:
+        return S3Connection(access_key, secret_key)
+    return S3Connection(access_key, secret_key,
+                        host=host,
+                        port=int(_s3_option('port', 443)),
+                        is_secure=_s3_option('is_secure', 'True') == 'True',
+                        calling_format=OrdinaryCallingFormat())
+
+
+class UploadJob(object):
+    def __init__(self, key, path, content_type, attempts=0, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.key = key
+        self.path = path
+        self.content_type = content_type
+        self.attempts = attempts
+
+    def to_dict(self):
+        return {'id': self.id, 'key': self.key, 'path': self.path,
+                'content_type': self.content_type, 'attempts': self.attempts}
+
+
+class UploadManager(QObject):
+    '''
+    Uploads frame captures and clips to S3 from a small pool of worker threads.
+    Each worker keeps its own connection open between uploads. Jobs and their payloads
+    live in a queue directory until they are uploaded, so anything still pending when
+    the app exits is picked up again on the next start. Failed uploads are retried with
+    exponential backoff. Keys that already exist on S3 are never overwritten.
+    '''
+    INSTANCE = None
+    WORKERS = 2
+    MAX_ATTEMPTS = 6
+    BACKOFF_BASE = 2  # seconds
+    BACKOFF_MAX = 300
+
+    statusChanged = pyqtSignal(str, str)  # key, status
+    pendingChanged = pyqtSignal(int)
+    uploadFailed = pyqtSignal(str)
+
+    def __init__(self, queue_dir=None, connect=s3_connect, bucket_name=None, workers=None):
+        super().__init__()
+        self.queue_dir = queue_dir or _s3_option('queue_dir') or os.path.join(gettempdir(), UPLOAD_QUEUE_DIR)
+        self.bucket_name = bucket_name or _s3_option('bucket', AWS_BUCKET_NAME)
+        self._connect = connect
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        if not os.path.exists(self.queue_dir):
+            os.makedirs(self.queue_dir)
+        self._restore()
+
+        for _ in range(workers or self.WORKERS):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = UploadManager()
+        return cls.INSTANCE
+
+    def pending(self):
+        return self._pending
+
+    def enqueue_bytes(self, key, data, content_type):
+        job = UploadJob(key, None, content_type)
+        job.path = os.path.join(self.queue_dir, job.id + '.data')
+        with open(job.path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._add(job)
+
+    def enqueue_file(self, key, path, content_type, delete_after=False):
+        job = UploadJob(key, None, content_type)
+        job.path = os.path.join(self.queue_dir, job.id + '.data')
+        if delete_after:
+            shutil.move(path, job.path)
+        else:
+            shutil.copyfile(path, job.path)
+        self._add(job)
+
+    def _add(self, job):
+        self._save(job)
+        self._change_pending(1)
+        self.statusChanged.emit(job.key, 'queued')
+        self._queue.put(job)
+
+    def _job_file(self, job):
+        return os.path.join(self.queue_dir, job.id + '.json')
+
+    def _save(self, job):
+        tmp = self._job_file(job) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(job.to_dict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._job_file(job))
+
+    def _remove(self, job):
+        for path in (self._job_file(job), job.path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _restore(self):
+        for name in sorted(os.listdir(self.queue_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.queue_dir, name)) as f:
+                    d = json.load(f)
+                job = UploadJob(d['key'], d['path'], d['content_type'], job_id=d['id'])
+            except (OSError, ValueError, KeyError):
+                getLogger('finprint').exception('Skipping unreadable upload job {0}'.format(name))
+                continue
+            if os.path.isfile(job.path):
+                getLogger('finprint').info('Resuming upload of {0}'.format(job.key))
+                self._pending += 1
+                self._queue.put(job)
+        if self._pending:
+            # once the event loop is running, so whoever created us has connected by then
+            QTimer.singleShot(0, lambda: self._change_pending(0))
+
+    def _change_pending(self, delta):
+        with self._lock:
+            self._pending += delta
+            pending = self._pending
+        self.pendingChanged.emit(pending)
+
+    def _work(self):
+        conn = None
+        bucket = None
+        while True:
+            job = self._queue.get()
+            try:
+                if bucket is None:
+                    conn = self._connect()
+                    bucket = conn.get_bucket(self.bucket_name, validate=False)
+                self.statusChanged.emit(job.key, 'uploading')
+                # a resumed job may have got there before the app exited
+                exists = bucket.get_key(job.key) is not None
+                if not exists:
+                    getLogger('finprint').info('Uploading {0}'.format(job.key))
+                    key = bucket.new_key(job.key)
+                    key.set_contents_from_filename(job.path, headers={'Content-Type': job.content_type},
+                                                   policy='public-read')
+            except Exception as e:
+                getLogger('finprint').error('Upload of {0} failed: {1}'.format(job.key, e))
+                # drop the connection, it may be what failed
+                conn = bucket = None
+                self._retry(job)
+            else:
+                if exists:
+                    getLogger('finprint').error('File already exists on S3: {0}'.format(job.key))
+                else:
+                    getLogger('finprint').info('File successfully uploaded on S3: {0}'.format(job.key))
+                self._remove(job)
+                self._change_pending(-1)
+                self.statusChanged.emit(job.key, 'done')
+
+    def _retry(self, job):
+        job.attempts += 1
+        self._save(job)
+        if job.attempts >= self.MAX_ATTEMPTS:
+            # left in the queue directory, so it is tried again on the next start
+            self._change_pending(-1)
+            self.statusChanged.emit(job.key, 'failed')
+            self.uploadFailed.emit(job.key)
+            return
+        delay = min(self.BACKOFF_BASE * 2 ** (job.attempts - 1), self.BACKOFF_MAX)
+        delay += random.uniform(0, delay / 2)
+        self.statusChanged.emit(job.key, 'retrying')
+        timer = threading.Timer(delay, self._queue.put, [job])
+        timer.daemon = True
+        timer.start()
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from logging import getLogger
+from .vlc_utils import get_vlc_params
+
+
+class VlcManager(object):
+    '''
+    One libvlc instance for the whole process, shared by the normal and fullscreen
+    players, plus the most recently used parsed media so a player switching to a file
+    that's already open doesn't parse it again. libvlc is only located and loaded when
+    the first player is needed, which is when a set is opened, not at startup.
+    '''
+    INSTANCE = None
+    MEDIA_CACHE_SIZE = 4
+
+    def __init__(self):
+        self._instance = None
+        self._media = OrderedDict()
+
+    @classmethod
+    def get_instance(cls):
+        if cls.INSTANCE is None:
+            cls.INSTANCE = VlcManager()
+        return cls.INSTANCE
+
+    def instance(self):
+        if self._instance is None:
+            from .vlc import Instance
+            # This is where we pass parameters for startup, like buffering
+            # and vlc specific debug and logging params
+            self._instance = Instance(get_vlc_params())
+        return self._instance
+
+    def media_player_new(self):
+        return self.instance().media_player_new()
+
+    def media(self, path, options=()):
+        '''
+        parsed media for path; options are media specific, so media opened with
+        different options are cached separately
+        '''
+        key = (path, tuple(options))
+        media = self._media.pop(key, None)
+        if media is None:
+            getLogger('finprint').info('Parsing media {0}'.format(path))
+            media = self.instance().media_new(path)
+            if options:
+                media.add_options(*options)
+            media.parse()
+        self._media[key] = media
+        while len(self._media) > self.MEDIA_CACHE_SIZE:
+            self._media.popitem(last=False)
+        return media
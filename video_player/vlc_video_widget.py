@@ -1,25 +1,19 @@
-import threading
-import time
-import psutil
-from io import BytesIO
-import cv2
-import subprocess
-import numpy as np
-from boto.s3.connection import S3Connection
-from boto.exception import S3ResponseError
+import os
+import sys
 from logging import getLogger
 from global_finprint import Extent
 from .play_state import PlayState
 from .highlighter import Highlighter
 from .context_menu import ContextMenu, EventDialog
+from .upload_manager import UploadManager
+from .clip_engine import ClipEngine
+from .frame_filter import FrameFilter
+from .frame_buffer import FrameBuffer
+from .position_tracker import PositionTracker
+from .vlc_manager import VlcManager
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
-from threading import Thread
-from threading import Event as PyEvent
-from tempfile import gettempdir
-from .vlc import *
 from .vlc_utils import *
-from win32api import GetSystemMetrics
 
 
 PROGRESS_UPDATE_INTERVAL = 30000
@@ -28,9 +22,8 @@ VIDEO_HEIGHT = 450
 MIN_VIDEO_WIDTH = 544  # make this more adjustable
 MIN_VIDEO_HEIGHT = 306
 DEFAULT_ASPECT_RATIO = 16.0 / 9.0
-AWS_BUCKET_NAME = 'finprint-annotator-screen-captures'
+CLIP_LENGTH = 8000  # ms
 SCREEN_CAPTURE_QUALITY = 25  # 0 to 100 (inclusive); lower is small file, higher is better quality
-TEMP_SNAPSHOT_DIR = 'finprint-snapshot'
 
 SEEK_CLOCK_FACTOR = 30
 SEEK_FRAME_JUMP = 60
@@ -38,37 +31,6 @@ SEEK_FRAME_JUMP = 60
 VIDEOFRAME_INDEX = 0
 ANNOTATION_INDEX = 1
 
-creds = open('./credentials.csv').readlines()[1].split(',')
-AWS_ACCESS_KEY_ID = creds[1].strip()
-AWS_SECRET_ACCESS_KEY = creds[2].strip()
-
-
-class RepeatingTimer(QObject):
-    timerElapsed = pyqtSignal()
-
-    def __init__(self, interval):
-        super(RepeatingTimer, self).__init__()
-        self.interval = interval
-        self.active = False
-        self.shutdown_event = PyEvent()
-        self.thread = None
-
-    def wrapper_function(self):
-        self.active = True
-        self.shutdown_event.clear()
-        while self.active:
-            if self.shutdown_event.wait(timeout=self.interval):
-                self.active = False
-            else:
-                self.timerElapsed.emit()
-
-    def start(self):
-        self.thread = Thread(group=None, target=self.wrapper_function, daemon=True)
-        self.thread.start()
-
-    def cancel(self):
-        self.shutdown_event.set()
-
 class TimerVO :
     def __init__(self, dur):
         ''' Duration of current timer in seconds '''
@@ -156,7 +118,10 @@ class VlcVideoWidget(QStackedWidget):
         self.saturation = 0
         self.brightness = 0
         self.contrast = False
-        self.retry_count = 0
+        self._frame_filter = FrameFilter()
+        self._frame_filter.filtered.connect(self._on_frame_filtered)
+        self._frame_buffer = FrameBuffer()
+        self._frame_buffer.frameCaptured.connect(self._on_frame_captured)
 
         # We will pass a window handle to libvlc, which
         # will be responsible for the actual rendering of the video
@@ -170,7 +135,7 @@ class VlcVideoWidget(QStackedWidget):
 
         # XXX Fixme - this is a hack
         if not self._fullscreen:
-            if GetSystemMetrics(1) > 800 :
+            if QApplication.desktop().screenGeometry().height() > 800 :
                 self.setMinimumSize(VIDEO_WIDTH, VIDEO_HEIGHT)
                 self.setMaximumSize(VIDEO_WIDTH, VIDEO_HEIGHT)
             else :
@@ -187,26 +152,17 @@ class VlcVideoWidget(QStackedWidget):
         # XXX todo - get aspect ratio from vlc when played
         self._aspect_ratio = DEFAULT_ASPECT_RATIO
 
-        # temporary storage for vlc snapshots
-        self.temp_snapshot_dir = os.path.join(gettempdir(), TEMP_SNAPSHOT_DIR)
-
-        if not os.path.exists(self.temp_snapshot_dir):
-            os.makedirs(self.temp_snapshot_dir)
-
-        # bind instance to load libvlc. This is where we pass parameters for
-        # startup, like buffering and vlc specific debug and logging params
-        startup_args = get_vlc_params()
-        self.instance = Instance(startup_args)
-        # create a vlc media player from loaded library
-        self.mediaplayer = self.instance.media_player_new()
+        # the vlc media player is created on first use, so libvlc isn't loaded until a set is opened
+        self._mediaplayer = None
+        self._preloaded_file = None
+        self._loaded_file = None
+        self._resume_rate = None
 
         # This keeps track of how far the annotator has gotten in the video
         self._last_progress = 0
 
-        self._timer_flag = False
-        self.timer_time = time.perf_counter()
-        self._timer = RepeatingTimer(0.25)
-        self._timer.timerElapsed.connect(self.on_timer)
+        self._tracker = PositionTracker()
+        self._tracker.positionChanged.connect(self.on_timer)
         # Initialize timer value object with 0 ms
         self.timer_vo = TimerVO(0)
 
@@ -215,6 +171,7 @@ class VlcVideoWidget(QStackedWidget):
 
         # current observation rect to display
         self._observation_rect = None
+        self._pending_observation_rect = None
 
         self.setStyleSheet('QMenu { background-color: white; }')
 
@@ -224,7 +181,15 @@ class VlcVideoWidget(QStackedWidget):
     def initUI(self):
         pass
 
+    @property
+    def mediaplayer(self):
+        if self._mediaplayer is None:
+            self._mediaplayer = VlcManager.get_instance().media_player_new()
+            self._tracker.bind(self._mediaplayer)
+        return self._mediaplayer
+
     def _print_sys_info(self):
+        import psutil
         l = getLogger('finprint')
         p = psutil.Process()
         l.debug('System CPU %: {}'.format(psutil.cpu_percent()))
@@ -265,16 +230,29 @@ class VlcVideoWidget(QStackedWidget):
 
         return False
 
-    def load(self, file_name):
+    def preload(self, file_name):
+        ''' give the player file_name without starting playback, so a later load() is quick '''
+        # if we have any special options, like hardware acceleration, that are media specific, set them here
+        # XXX sohrt term hack here, we're only going to load these options if it is fullscreen
+        opts = get_vlc_media_options() if self._fullscreen else ()
+        self.media = VlcManager.get_instance().media(file_name, opts)
+        self.mediaplayer.set_media(self.media)
+        self._preloaded_file = file_name
+
+    def is_loaded(self, file_name):
+        return self._loaded_file == file_name
+
+    def load(self, file_name, resume_rate=None):
         self._file_name = file_name
 
         self.clear_extent()
 
 
         getLogger('finprint').info("Loading loading video {0}".format(self._file_name))
-        self.media = self.instance.media_new(self._file_name)
-        self.mediaplayer.set_media(self.media)
-        self.media.parse()
+        self._frame_buffer.open(self._file_name)
+        if self._preloaded_file != file_name:
+            self.preload(file_name)
+        self._tracker.attach(self.media)
 
         # Where the magic starts - you have to give the handle of the QFrame (or similar object) to
         # vlc, different platforms have different functions for this. Downside is its opaque to you,
@@ -292,35 +270,27 @@ class VlcVideoWidget(QStackedWidget):
 
         self._play_state = PlayState.Paused
 
-        # wire up callbacks to VLC for snapshots and end of stream,
-        # which is relative to the media being played
-        mp_event_mgr = self.mediaplayer.event_manager()
-        mp_event_mgr.event_attach(EventType.MediaPlayerSnapshotTaken, self.snapShotTaken)
-        # XXX Uncomment these for debugging
-        # mp_event_mgr.event_attach(EventType.MediaPlayerEndReached, self.streamEndEvent)
-        # mp_event_mgr.event_attach(EventType.MediaPlayerPositionChanged, self.positionChangedEvent)
-        # mp_event_mgr.event_attach(EventType.MediaPlayerTimeChanged, self.timeChangedEvent)
-
         # don't start listening for spacebar until video is loaded and playable
         self.mediaplayer.video_set_mouse_input(True)
 
-        # if we have any special options, like hardware acceleration, that are media specific, set them here
-        # XXX sohrt term hack here, we're only going to load these options if it is fullscreen
-        opts = get_vlc_media_options()
-        if opts and self._fullscreen :
-            self.media.add_options(opts)
-
         self.show()
         # XXX hack to display the first few frames, which alters the bahavior of
         # VLC with respect to video scrubbing
         self.mediaplayer.set_time(20)
         print(" playing for 20 msec")
         self.mediaplayer.play()
+        self._loaded_file = file_name
+        self._resume_rate = resume_rate
         QTimer.singleShot(500, self.after_load)
 
         return True
 
     def after_load(self):
+        if self._resume_rate:
+            # carry on playing where the other player was
+            rate, self._resume_rate = self._resume_rate, None
+            self.set_speed(rate)
+            return
         self.mediaplayer.pause()
         self.clear_extent()
         self.annotationImage.clear()
@@ -349,12 +319,11 @@ class VlcVideoWidget(QStackedWidget):
             return 0
 
     # Reinstate last_progress here
-    def on_timer(self):
+    def on_timer(self, pos):
         if self._play_state is not PlayState.EndOfStream:
-            pos = self.mediaplayer.get_time()
             #intializing/updating timeVO to use as a common timer holder
             self.timer_vo.timer_duration_ms = pos
-            if pos > (self.media.get_duration() - 2000):
+            if pos > (self.get_length() - 2000):
                 self.streamEndEvent()
             if self._play_state is PlayState.Playing and self._last_progress > PROGRESS_UPDATE_INTERVAL:
                 self._last_progress = pos
@@ -365,8 +334,11 @@ class VlcVideoWidget(QStackedWidget):
         print('vlc_video_widget > clear: get_position {0}'.format(self.get_position()))
         #self.pause()
         # TODO: clear/reset vlc media player
-        self.mediaplayer.stop()
-        self._timer.cancel()
+        if self._mediaplayer is not None:
+            self._mediaplayer.stop()
+        self._tracker.stop()
+        self._frame_buffer.close()
+        self._loaded_file = None
         self.annotationImage.clear()
         self.removeWidget(self.annotationImage)
         self.annotationImage.hide()
@@ -419,41 +391,92 @@ class VlcVideoWidget(QStackedWidget):
             rect = extent.getRect(self.videoframe.height(), self.videoframe.width())
         self._observation_rect = rect
         self.scrub_position(pos)
-        QTimer.singleShot(1000, self.display_observation_snaphot)
+        self.display_observation_snaphot()
 
     def take_videoframe_snapshot(self):
+        '''
+        show the decoded frame at the playhead in the annotation image; it comes straight
+        from the frame buffer, or from the decoder thread as soon as it's decoded
+        '''
         getLogger('finprint').info('take videoframe snapshot')
+        self._frame_buffer.capture(self.get_position(), self._frame_size())
+
+    def _on_frame_captured(self, frame_number, image):
+        # the playhead has moved on since this was asked for
+        if self._play_state is PlayState.Playing or \
+                frame_number != self._frame_buffer.frame_number(self.get_position()):
+            return
+        if image is None:
+            # OpenCV couldn't decode this file; fall back to what libvlc has drawn
+            pix = QPixmap.grabWindow(self.videoframe.winId())
+            image = pix.scaledToHeight(self.videoframe.height()).toImage().convertToFormat(QImage.Format_RGB888)
+        self._show_snapshot(image)
+
+    def _show_snapshot(self, image):
         self.annotationImage.clear()
         self.annotationImage.show()
-        pix = QPixmap.grabWindow(self.videoframe.winId())
-        snap = pix.scaledToHeight(self.videoframe.height())
-        self.annotationImage.curr_image = snap.toImage()
-        self.current_snapshot = snap.toImage()
-        # XXX inline this function
+        self.annotationImage.curr_image = image
+        # RGB888, so the filter can read it in place
+        self.current_snapshot = image
         if self.is_filtered():
             self.refresh_frame()
+        if self._pending_observation_rect is not None:
+            rect, self._pending_observation_rect = self._pending_observation_rect, None
+            getLogger('finprint').info('draw observation rect at {0}'.format(rect))
+            self.annotationImage.highlighter.start_rect(rect.topLeft())
+            self.annotationImage.highlighter.set_rect(rect.bottomRight())
         self.setCurrentIndex(ANNOTATION_INDEX)
+        self.annotationImage.update()
 
     def display_observation_snaphot(self):
+        self._pending_observation_rect = self._observation_rect
         self.take_videoframe_snapshot()
-        if self._observation_rect is not None:
-            getLogger('finprint').info('draw observation rect at {0}'.format(self._observation_rect))
-            self.annotationImage.highlighter.start_rect(self._observation_rect.topLeft())
-            self.annotationImage.highlighter.set_rect(self._observation_rect.bottomRight())
-            self.annotationImage.repaint()
 
     def scrub_position(self, pos):
         # todo - just have a Seek State
+        if self._play_state is not PlayState.Playing and self.show_buffered_frame(pos):
+            return
         self.set_position(pos)
         print("vlc_video_widget > scrub_position ", pos)
         self.pause()
+        self._fill_frame_buffer(pos)
+
+    def frame_step_ms(self):
+        return self._frame_buffer.frame_ms()
+
+    def step_frame(self, frames):
+        pos = self.get_position() + frames * self.frame_step_ms()
+        self.scrub_position(min(max(0, pos), self.get_length()))
+
+    def show_buffered_frame(self, pos):
+        '''
+        show the decoded frame at pos from the frame buffer, if it's there, and move
+        libvlc to it in the background so playback resumes from the same place
+        '''
+        image = self._frame_buffer.frame_at(pos)
+        if image is None:
+            return False
+        self._onPositionChange(pos)
+        self.timer_vo.timer_duration_ms = pos
+        self.mediaplayer.set_time(int(pos))
+        self._tracker.seek(pos)
+        self._show_snapshot(image)
+        self._fill_frame_buffer(pos)
+        return True
+
+    def _frame_size(self):
+        return self.videoframe.width(), self.videoframe.height()
+
+    def _fill_frame_buffer(self, pos):
+        self._frame_buffer.fill_around(pos, self._frame_size())
 
     def set_position(self, pos):
         self._onPositionChange(pos)
-        p = (pos) / self.media.get_duration()
+        p = (pos) / self.get_length()
         getLogger('finprint').info('set_position {0}'.format(p))
         self.setCurrentIndex(VIDEOFRAME_INDEX)
         self.mediaplayer.set_position(p)
+        self._tracker.seek(pos)
         self.timer_vo.timer_duration_ms = pos
 
 
@@ -474,7 +497,8 @@ class VlcVideoWidget(QStackedWidget):
         playStarted = self.mediaplayer.play()
         print('vlc_video_widget > play: play started? {0}'.format(playStarted))
         self._play_state = PlayState.Playing
-        self._timer.start()
+        self._frame_buffer.suspend()
+        self._tracker.start()
         self.playStateChanged.emit(self._play_state)
 
     def pause(self):
@@ -484,49 +508,64 @@ class VlcVideoWidget(QStackedWidget):
             self._play_state = PlayState.Paused
             self.playStateChanged.emit(self._play_state)
             self.playbackSpeedChanged.emit(0.0)
-            self._timer.cancel()
+            self._tracker.stop()
+            # interpolation may be a little off from where libvlc actually stopped
+            self.timer_vo.timer_duration_ms = self.mediaplayer.get_time()
+            self._tracker.seek(self.timer_vo.timer_duration_ms)
             self.take_videoframe_snapshot()
+            self._fill_frame_buffer(self.get_position())
         else :
-            QTimer.singleShot(500, self.take_videoframe_snapshot)
+            self.take_videoframe_snapshot()
 
-    def save_image(self, filename):
-        self.curr_s3_upload = filename
-        curr_snapshot = os.path.basename(filename)
-        snapshot_path_bytes = os.path.join(self.temp_snapshot_dir, curr_snapshot).encode('utf-8')
-        # vlc calls need a C style string
-        snapshot_path = ctypes.create_string_buffer(snapshot_path_bytes)
-        # request actual decoded frame size from libvlc
-        self.mediaplayer.video_take_snapshot(0, snapshot_path, 0, 0)
+    def save_image(self, filename, position=None):
+        ''' upload the full resolution frame at position, decoded straight from the file '''
+        if position is None:
+            position = self.get_position()
+        fallback = self.current_snapshot
+
+        def _captured(image):
+            if image is None:
+                image = fallback
+            if image is None:
+                getLogger('finprint').error('No frame to upload for {0}'.format(filename))
+                return
+            self.upload_image(filename, image)
+
+        self._frame_buffer.capture(position, callback=_captured)
 
     def upload_image(self, filename, curr_image):
         getLogger('finprint').info('Uploading {0}'.format(filename))
         data = QByteArray()
         buffer = QBuffer(data)
         curr_image.save(buffer, 'PNG', SCREEN_CAPTURE_QUALITY)
-        bio = BytesIO(data.data())
-        bio.seek(0)
-        try:
-            conn = S3Connection(AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
-            bucket = conn.get_bucket(AWS_BUCKET_NAME)
-            if not bucket.get_key(filename):
-                key = bucket.new_key(filename)
-                key.set_contents_from_string(bio.read(), headers={'Content-Type': 'image/png'})
-                key.set_acl('public-read')
-            else:
-                getLogger('finprint').error('File already exists on S3: {0}'.format(filename))
-        except S3ResponseError as e:
-            getLogger('finprint').error(str(e))
+        UploadManager.get_instance().enqueue_bytes(filename, data.data(), 'image/png')
 
     def is_paused(self):
         return self._play_state == PlayState.Paused
 
+    def is_playing(self):
+        return self._play_state == PlayState.Playing
+
+    def get_rate(self):
+        return self.mediaplayer.get_rate()
+
+    def filter_state(self):
+        return self.saturation, self.brightness, self.contrast
+
+    def set_filter_state(self, saturation, brightness, contrast):
+        self.saturation = saturation
+        self.brightness = brightness
+        self.contrast = contrast
+        if self.is_paused():
+            self.refresh_frame()
+
     ''' Provides duration of current video play in milli seconds '''
     def get_position(self):
         return self.timer_vo.timer_duration_ms
 
     def get_length(self):
-        duration = self.media.get_duration()
-        if duration == -1:
+        duration = self._tracker.duration()
+        if duration <= 0:
             getLogger('finprint').exception("Failed to calculate length")
             return 0
         else:
@@ -561,6 +600,7 @@ class VlcVideoWidget(QStackedWidget):
         # XXX assume we are about to or are playing, so show videoframe
         self.setCurrentIndex(VIDEOFRAME_INDEX)
         self.mediaplayer.set_rate(speed)
+        self._tracker.set_rate(speed)
 
         # XXX Hack for set_positon
         if start_playing:
@@ -569,6 +609,8 @@ class VlcVideoWidget(QStackedWidget):
         if PlayState.Paused and start_playing:
             self.mediaplayer.play()
             self._play_state = PlayState.Playing
+            self._frame_buffer.suspend()
+            self._tracker.start()
             self.playStateChanged.emit(self._play_state)
 
     def resizeEvent(self, ev):
@@ -579,62 +621,16 @@ class VlcVideoWidget(QStackedWidget):
 
     def _refresh_frame_cv(self):
         if self._play_state is PlayState.Paused and self.current_snapshot :
-            # grab a cv representation of the image
-            # that has not been filtered
-            curr_img = self.current_snapshot
-            bgr = curr_img.rgbSwapped()
-            cvFrame = self.qimage_to_numpy(bgr)
-            filtered_img = self.filter_image(cvFrame)
-            self.annotationImage.curr_image = filtered_img
+            # filtered off the GUI thread; the result comes back in _on_frame_filtered
+            self._frame_filter.request(self.current_snapshot, self.saturation, self.brightness, self.contrast)
+
+    def _on_frame_filtered(self, image, generation):
+        # a newer request or a play/seek since makes this frame stale
+        if self._frame_filter.is_current(generation) and self._play_state is PlayState.Paused \
+                and self.current_snapshot is not None:
+            self.annotationImage.curr_image = image
             self.update()
 
-    def filter_image(self, curr_img):
-        frame = curr_img
-        image = None
-        try:
-            getLogger('finprint').debug('saturation: {0}  brightness: {1}'.format(self.saturation, self.brightness))
-            # adjust brightness and saturation
-            if (self.saturation > 0 or self.brightness > 0) and self._play_state == PlayState.Paused:
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                h, s, v = cv2.split(hsv)
-                final_hsv = cv2.merge((
-                    h,
-                    np.where(255 - s < self.saturation, 255, s + self.saturation),
-                    np.where(255 - v < self.brightness, 255, v + self.brightness)
-                ))
-                frame = cv2.cvtColor(final_hsv, cv2.COLOR_HSV2BGR)
-
-            # equalize contrast
-            if self.contrast is True and self._play_state == PlayState.Paused:
-                lab = cv2.cvtColor(frame, cv2.COLOR_BGR2Lab)
-                l_chan = cv2.extractChannel(lab, 0)
-                l_chan = cv2.createCLAHE(clipLimit=2.0).apply(l_chan)
-                cv2.insertChannel(l_chan, lab, 0)
-                frame = cv2.cvtColor(lab, cv2.COLOR_Lab2BGR)
-
-            height, width, channels = frame.shape
-            image = QImage(frame, width, height, QImage.Format_RGB888)
-
-        except Exception as ex:
-            getLogger('finprint').exception('Exception building image: {}'.format(str(ex)))
-
-        return image
-
-    def qimage_to_numpy(self, curr_image):
-        # make sure we have the smallest usable size
-        curr_image = curr_image.convertToFormat(QImage.Format_RGB888)
-        curr_image = curr_image.rgbSwapped()
-        width = curr_image.width()
-        height = curr_image.height()
-
-        ptr = curr_image.bits()
-        ptr.setsize(curr_image.byteCount())
-        # XXX Make the # of channels (shape[2]) conditional, so if we
-        # have an alpha or b/w it can be scaled accordingly
-        frame = np.array(ptr).reshape(height, width, 3)  # Copies the data
-
-        return frame
-
     # callbacks start here
     # XXX TODO - add a video filter to libvlc to detect when video has been clicked,
     # so that it acts like the previous opencv-based version. This is likely a c based
@@ -648,36 +644,12 @@ class VlcVideoWidget(QStackedWidget):
         getLogger('finprint').info('end of stream event')
         self._play_state = PlayState.EndOfStream
         self.playStateChanged.emit(self._play_state)
-        dur = self.media.get_duration()
+        dur = self.get_length()
         self.mediaplayer.set_position((dur - 1000) / dur)
         print('vlc_video_widget > streamEndEvent: dur {0}, mediaplayer.get_position {1}'.format(dur, self.mediaplayer.get_position()))
         self.pause()
         self.playStateChanged.emit(self._play_state)
 
-    # once a snaphsot is generated by vlc, post the snapshot (a decoded video frame)
-    # in a background thread. It seems to be blocking on the main thread, even though
-    # we should be running off of a C runtime thread
-    def snapShotTaken(self, event):
-        getLogger('finprint').info('process snaphot')
-        # upload on a separate thread
-        upload_thread = threading.Thread(target=self.process_snapshot)
-        upload_thread.start()
-
-    def process_snapshot(self):
-        if self.curr_s3_upload is not None:
-            s3_filename = os.path.basename(self.curr_s3_upload)
-            getLogger('finprint').info('Searching for {0}'.format(s3_filename))
-            expected_file = os.path.join(self.temp_snapshot_dir, s3_filename)
-            if os.path.isfile(expected_file):
-                getLogger('finprint').info('Found {0}'.format(expected_file))
-                upload_img = QImage(expected_file)
-                self.upload_image(self.curr_s3_upload, upload_img)
-                self.curr_s3_upload = None
-                print(" expected_file ", expected_file)
-                print(" self.curr_s3_upload ", self.curr_s3_upload)
-                print(" s3_filename ", s3_filename)
-                os.remove(expected_file)
-
     # callback for 'MediaPlayerPositionChanged'
     def positionChangedEvent(self, event):
         pos = self.mediaplayer.get_position()
@@ -689,104 +661,12 @@ class VlcVideoWidget(QStackedWidget):
         getLogger('finprint').info('Time changed: {0}'.format(pos))
 
 
-    def generate_8sec_clip(self, filename) :
-       if os.path.exists(self._file_name) :
-           clip_path = self.generate_8sec_video_clip_wid_ffpmpeg(filename)
-       else :
-           getLogger('finprint').info('file path doesnt exist'.format(self._file_name))
-
-       if filename is not None:
-           s3_filename = os.path.basename(filename)
-           getLogger('finprint').info('Searching for {0}'.format(s3_filename))
-           expected_file = os.path.join(self.temp_snapshot_dir, s3_filename)
-           if os.path.isfile(expected_file):
-               getLogger('finprint').info('Found {0}'.format(expected_file))
-               self.upload_8sec_clip(filename, clip_path)
-               os.remove(clip_path)
-
-
-    def upload_8sec_clip(self, filename, clip_path):
-        getLogger('finprint').info('Uploading {0}'.format(filename))
-        try:
-            conn = S3Connection(AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
-            bucket = conn.get_bucket(AWS_BUCKET_NAME)
-            if not bucket.get_key(filename):
-                key = bucket.new_key(filename)
-                key.set_contents_from_filename(clip_path, headers={'Content-Type': 'video/mp4'})
-                key.set_acl('public-read')
-                print('File successfully uploaded on S3: {0}'.format(filename))
-                getLogger('finprint').info('File successfully uploaded on S3: {0}'.format(filename))
-            else:
-                getLogger('finprint').error('File already exists on S3: {0}'.format(filename))
-        except S3ResponseError as e:
-            self.retry_count += 1
-            getLogger('finprint').error(str(e))
-            getLogger('finprint').error("Will retry in 20 sec......")
-            if self.retry_count == 1:
-                time.sleep(10)
-                print('***** retrying AWS upload again *****')
-                self.upload_8sec_clip( filename, clip_path)
-            else :
-                getLogger('finprint').error("retry not working....")
-                msg = 'There was an error saving the video clip to the server. Retry by editing the observation or continue without creating a video clip.'
-                QMessageBox.question(self.parent(), 'AWS UPLOAD ERROR', msg, QMessageBox.Close)
-        except Exception as e:
-            getLogger('finprint').error(str(e))
-            self.retry_count += 1
-            time.sleep(10)
-            if self.retry_count == 1:
-                print('***** retrying AWS upload again *****')
-                self.upload_8sec_clip(filename, clip_path)
-            else:
-                getLogger('finprint').error("retry not working....")
-                msg = 'There was an error saving the video clip to the server. Retry by editing the observation or continue without creating a video clip.'
-                QMessageBox.question(self.parent(), 'AWS UPLOAD ERROR', msg, QMessageBox.Close)
-
-        self.retry_count = 0
-
-    def generate_8sec_video_clip_wid_ffpmpeg(self, filename):
-        try:
-            curr_snapshot = os.path.basename(filename)
-            clip_path = os.path.join(self.temp_snapshot_dir, curr_snapshot)
-            if os.path.exists(clip_path):
-                getLogger('finprint').info('removing duplicates video name from local disk {0}'.format(clip_path))
-                try:
-                  os.remove(clip_path)
-                except Exception :
-                    getLogger('finprint').info('not able to delete video name {0} from local disk '.format(clip_path))
-            # vlc calls need a C style string
-            t_start = self.get_position() / 1000
-            if self.get_position() + 8000 > self.get_length():
-                t_end = (self.get_length() - self.get_position()) / 1000
-            else:
-                t_end = 8
-            ffmpeg_exe_path = "ffmpeg_executable/ffmpeg.exe"
-            getLogger('finprint').info('ffpmge_exe_path {0}'.format(ffmpeg_exe_path))
-            print(ffmpeg_exe_path)
-            execute_command = ffmpeg_exe_path+' -i '+self._file_name+ ' -vf scale=800:-1 -c:v libx264  -ss '+ str(t_start) +' -c:a copy -t '+ \
-                              str(t_end) +' -an '+clip_path
-            subprocess.call(execute_command)
-        except subprocess.CalledProcessError as e:
-            self.retry_count += 1
-            time.sleep(5)
-            getLogger('finprint').error('subprocess exception in generating video clip {0}'.format(e))
-            if self.retry_count == 1:
-                print('***** retrying again *****')
-                return self.generate_8sec_video_clip_wid_ffpmpeg(filename)
-            else :
-                msg = 'An error occurred while creating the video clip. Check your network connection and re-try by editing the observation or continue without creating a video.'
-                QMessageBox.question(self.parent(), '8Sec Video Clip Error', msg, QMessageBox.Close)
-        except Exception as e :
-            self.retry_count += 1
-            getLogger('finprint').error(' error in generating video clip {0}'.format(e))
-
-            if self.retry_count == 1 :
-                time.sleep(5)
-                print('***** retrying again *****')
-                return self.generate_8sec_video_clip_wid_ffpmpeg(filename)
-            else :
-                msg = 'An error occurred while creating the video clip. Check your network connection and re-try by editing the observation or continue without creating a video.'
-                QMessageBox.question(self.parent(), '8Sec Video Clip Error', msg, QMessageBox.Close)
-
-        self.retry_count = 0
-        return clip_path
\ No newline at end of file
+    def generate_8sec_clip(self, filename, position=None):
+        if filename is None:
+            return
+        if not os.path.exists(self._file_name):
+            getLogger('finprint').info('file path doesnt exist {0}'.format(self._file_name))
+            return
+        start = self.get_position() if position is None else position
+        duration = min(CLIP_LENGTH, self.get_length() - start)
+        ClipEngine.get_instance().submit(self._file_name, start, duration, filename)